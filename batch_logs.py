@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import sys
+import os
+import io
+import glob
+import argparse
+from collections import namedtuple
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cc.find_roots
+import cc.census
+import g.find_roots
+import g.census
+from diff_logs import logKind
+
+
+# Run one analysis on every CC and GC log in a directory, such as the
+# one cc-edges.PID.log and gc-edges.PID.log per process that Firefox
+# writes, and produce a single report.
+#
+# Each log is analyzed in a pool of processes.  The output of the
+# analysis for each log is written to the report as soon as it is
+# done, followed by a summary across all of the logs at the end.  The
+# largest logs are started first, so that the whole batch takes about
+# as long as the largest log.
+#
+# Like find_roots.py, the kind of log is determined from the file
+# name, which should start with 'cc' or 'gc'.  Any arguments after the
+# directory are passed along to the analysis, so options for this
+# script must come before the directory.  For instance
+#
+#   python3 batch_logs.py find_roots logs/ nsGlobalWindowInner -np 1
+#
+# looks for paths to windows in every log in logs/.
+
+
+parser = argparse.ArgumentParser(description='Run an analysis on every CC and GC log in a directory.')
+
+parser.add_argument('analysis', choices=['find_roots', 'census'],
+                    help='the analysis to run on each log')
+
+parser.add_argument('path',
+                    help='a directory containing logs, or a glob pattern matching log file names')
+
+parser.add_argument('tool_args', metavar='ARG', nargs=argparse.REMAINDER,
+                    help='extra arguments passed to the analysis, after the log file name')
+
+parser.add_argument('--jobs', '-j', dest='jobs', type=int,
+                    default=os.cpu_count(),
+                    help='Number of logs to analyze in parallel. Defaults to the number of CPUs.')
+
+parser.add_argument('--output', '-o', dest='output_file_name',
+                    default=None,
+                    help='Write the report to this file instead of stdout.')
+
+parser.add_argument('--num-show', '-ns', dest='num_to_show', type=int,
+                    default=20,
+                    help='Only show this many classes in the summary of a census. Default is 20.')
+
+
+# The entry point of each analysis, for each kind of log.  Each of
+# these reads its arguments from sys.argv and prints to stdout.
+analyses = {
+  'find_roots': {'cc': cc.find_roots.findCCRoots, 'gc': g.find_roots.findGCRoots},
+  'census': {'cc': cc.census.cycleCollectorCensus, 'gc': g.census.gcCensus},
+}
+
+
+# - fname is the name of the log file.
+# - kind is 'cc' or 'gc'.
+# - output is everything the analysis printed, to stdout or stderr.
+# - ok is False if the analysis exited with an error.
+# - result is the value returned by the analysis: the targets that are
+#   in the graph for find_roots, and a map from classes to counts for
+#   census.
+LogReport = namedtuple('LogReport', 'fname kind output ok result')
+
+
+####
+#### Running the analyses
+####
+
+def findLogs(path):
+  if os.path.isdir(path):
+    fnames = [os.path.join(path, f) for f in os.listdir(path)]
+  else:
+    fnames = glob.glob(path)
+  fnames = [f for f in fnames if os.path.isfile(f) and logKind(f) != None]
+
+  # Start the largest logs first.
+  fnames.sort(key=lambda f: (-os.path.getsize(f), f))
+  return fnames
+
+
+# Run a single analysis.  This runs in a worker process, so rather
+# than printing anything it returns a LogReport.
+def runAnalysis(analysis, fname, toolArgs):
+  kind = logKind(fname)
+  entry = analyses[analysis][kind]
+
+  savedArgv = sys.argv
+  sys.argv = [analysis, fname] + toolArgs
+  out = io.StringIO()
+  ok = True
+  result = None
+  try:
+    with redirect_stdout(out), redirect_stderr(out):
+      result = entry()
+  except SystemExit as e:
+    ok = not e.code
+  finally:
+    sys.argv = savedArgv
+
+  return LogReport(fname=fname, kind=kind, output=out.getvalue(), ok=ok, result=result)
+
+
+def failedReport(fname, e):
+  return LogReport(fname=fname, kind=logKind(fname),
+                   output='Error: analysis failed with {0}: {1}\n'.format(type(e).__name__, e),
+                   ok=False, result=None)
+
+
+def writeSection(outf, rep):
+  outf.write('==== {0} ===='.format(os.path.basename(rep.fname)))
+  if not rep.ok:
+    outf.write(' (failed)')
+  outf.write('\n')
+  outf.write(rep.output)
+  if not rep.output.endswith('\n'):
+    outf.write('\n')
+  outf.write('\n')
+  outf.flush()
+
+
+####
+#### Summary across all logs
+####
+
+def printCensusSummary(args, outf, reports, kind):
+  totals = {}
+  numLogs = {}
+  for rep in reports:
+    if rep.kind != kind or not rep.result:
+      continue
+    for cls, n in rep.result.items():
+      if n:
+        totals[cls] = totals.get(cls, 0) + n
+        numLogs[cls] = numLogs.get(cls, 0) + 1
+  if not totals:
+    return
+
+  outf.write('Total {0} census.'.format(kind.upper()))
+  outf.write(' Showing no more than {0} classes of objects.\n'.format(args.num_to_show))
+  outf.write('   total     logs\n')
+  for cls, n in sorted(totals.items(), key=lambda c: (-c[1], c[0]))[:args.num_to_show]:
+    outf.write('%(num)8d %(logs)8d %(label)s\n' % {'num':n, 'logs':numLogs[cls], 'label':cls})
+  outf.write('\n')
+
+
+def printFindRootsSummary(outf, reports):
+  found = [rep for rep in reports if rep.result]
+  outf.write('Found targets in {0} of {1} logs.\n'.format(len(found), len(reports)))
+  for rep in found:
+    outf.write('%(num)8d %(label)s\n' % {'num':len(rep.result), 'label':os.path.basename(rep.fname)})
+  outf.write('\n')
+
+
+def printSummary(args, outf, reports):
+  reports.sort(key=lambda rep: rep.fname)
+
+  outf.write('==== Summary of {0} logs ====\n'.format(len(reports)))
+  if args.analysis == 'census':
+    printCensusSummary(args, outf, reports, 'cc')
+    printCensusSummary(args, outf, reports, 'gc')
+  else:
+    printFindRootsSummary(outf, reports)
+
+  failed = [rep for rep in reports if not rep.ok]
+  if failed:
+    outf.write('The analysis failed on {0} logs:\n'.format(len(failed)))
+    for rep in failed:
+      outf.write('  ' + rep.fname + '\n')
+    outf.write('\n')
+
+
+def batchLogs():
+  args = parser.parse_args()
+
+  fnames = findLogs(args.path)
+  if not fnames:
+    sys.stderr.write('Didn\'t find any log files starting with cc or gc in ' + args.path + '\n')
+    exit(-1)
+
+  if args.output_file_name:
+    outf = open(args.output_file_name, 'w')
+  else:
+    outf = sys.stdout
+
+  reports = []
+
+  def finished(rep):
+    reports.append(rep)
+    writeSection(outf, rep)
+    sys.stderr.write('Finished {0} ({1} of {2}).\n'.format(rep.fname, len(reports), len(fnames)))
+
+  if args.jobs <= 1 or len(fnames) == 1:
+    for fname in fnames:
+      try:
+        finished(runAnalysis(args.analysis, fname, args.tool_args))
+      except Exception as e:
+        finished(failedReport(fname, e))
+  else:
+    with ProcessPoolExecutor(max_workers=min(args.jobs, len(fnames))) as executor:
+      futures = {}
+      for fname in fnames:
+        futures[executor.submit(runAnalysis, args.analysis, fname, args.tool_args)] = fname
+      for future in as_completed(futures):
+        try:
+          finished(future.result())
+        except Exception as e:
+          finished(failedReport(futures[future], e))
+
+  printSummary(args, outf, reports)
+
+  if args.output_file_name:
+    outf.close()
+
+
+if __name__ == "__main__":
+  batchLogs()
@@ -7,7 +7,7 @@
 import sys
 import re
 from collections import namedtuple
-import node_parse_cc_graph
+from . import node_parse_cc_graph
 import argparse
 
 
@@ -199,6 +199,8 @@ def analyze_nodes(args, nodes, ga, garb):
     print('ContentParent count seems high. There are', content_parent_count, 'of them.')
     print()
 
+  return nls
+
 
 #######
 
@@ -218,13 +220,15 @@ def loadGraph(fname):
 ####################
 
 
+# Returns a map from classes to the number of objects of that class,
+# so that batch_logs.py can combine the census of many logs.
 def cycleCollectorCensus():
   args = parser.parse_args()
 
   (g, ga, res) = loadGraph(args.file_name)
   (ke, garb) = res
 
-  analyze_nodes(args, g, ga, garb)
+  return analyze_nodes(args, g, ga, garb)
 
 
 
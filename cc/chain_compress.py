@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Library for shrinking a graph before it is laid out by graphviz.
+#
+# Most of the layout time for big graphs goes into long chains of
+# nodes, like DOM sibling lists and shape lineages, and into nodes
+# with lots of children that all look the same.  compressGraph removes
+# both, in time linear in the size of the graph.
+#
+# compressGraph (g, keep, key, minStar, minChain): g is a graph,
+#   represented as a dictionary that maps each node to the set of its
+#   successors.  Nodes in keep are never removed.  Returns a tuple
+#   (ng, chains, stars).
+#
+#   - ng is the compressed graph, in the same form as g.  Every node of
+#     ng is a key of ng.
+#
+#   - stars maps a node of ng to the number of nodes of g it stands
+#     for.  If a node has at least minStar children that have no
+#     other parents and no children of their own, and for which key
+#     returns the same value, the children are replaced by the least
+#     of them.
+#
+#   - chains maps an edge (x, y) of ng to the number of nodes of g
+#     that were removed from between x and y.  A link is a node with
+#     exactly one predecessor and one successor, neither of which is
+#     itself.  Each maximal path x -> a1 -> ... -> ak -> y where the ai
+#     are links and x and y are not is replaced by the edge x -> y, if
+#     k is at least minChain.  There is at most one edge x -> y in ng,
+#     so a chain is only replaced if x has no edge straight to y and no
+#     other chain to y has been replaced already.  Any other chains
+#     from x to y are left as they are.  Cycles made up of nothing but
+#     links are left alone.
+#
+# Nothing is done with the names of removed nodes and edges, so it is
+# up to the caller to show the counts in chains and stars.
+
+
+def compressGraph (g, keep, key, minStar, minChain):
+  preds = {}
+  for x, edges in g.items():
+    preds.setdefault(x, 0)
+    for y in edges:
+      preds[y] = preds.get(y, 0) + 1
+
+  def isLeaf (x):
+    return preds[x] == 1 and not g.get(x) and not x in keep
+
+  # Merge stars.
+  stars = {}
+  removed = set([])
+  for x, edges in g.items():
+    if len(edges) < minStar:
+      continue
+    groups = {}
+    for y in edges:
+      if isLeaf(y):
+        groups.setdefault(key(y), []).append(y)
+    for l in groups.values():
+      if len(l) < minStar:
+        continue
+      rep = min(l)
+      stars[rep] = len(l)
+      for y in l:
+        if y != rep:
+          removed.add(y)
+
+  succs = {}
+  for x in preds:
+    if not x in removed:
+      succs[x] = [y for y in g.get(x, []) if not y in removed]
+
+  def isLink (x):
+    return preds[x] == 1 and len(succs[x]) == 1 and succs[x][0] != x and \
+        not x in keep and not x in stars
+
+  # Collapse chains, starting from every node that isn't a link.
+  ng = {}
+  chains = {}
+  visited = set([])
+  for x, edges in succs.items():
+    if isLink(x):
+      continue
+    ng.setdefault(x, set([]))
+    for y in edges:
+      if not isLink(y):
+        ng[x].add(y)
+        ng.setdefault(y, set([]))
+    # Go through the chains in order, so the same one is replaced every
+    # time.
+    for y in sorted(edges):
+      if not isLink(y):
+        continue
+      links = []
+      while isLink(y):
+        visited.add(y)
+        links.append(y)
+        y = succs[y][0]
+      if len(links) < minChain or y in ng[x]:
+        # Keep the short chain as it is.
+        prev = x
+        for z in links:
+          ng[prev].add(z)
+          ng[z] = set([])
+          prev = z
+        ng[prev].add(y)
+      else:
+        ng[x].add(y)
+        chains[(x, y)] = len(links)
+      ng.setdefault(y, set([]))
+
+  # Anything left is a cycle of links.
+  for x, edges in succs.items():
+    if isLink(x) and not x in visited:
+      ng[x] = set(edges)
+
+  return (ng, chains, stars)
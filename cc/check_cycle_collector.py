@@ -1,13 +1,15 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import sys
-from optparse import OptionParser
-from collections import namedtuple
-import parse_cc_graph
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from . import csr_graph
+from . import simulate_collector
 
 # CCC: Cycle collector checker.
 #
@@ -24,207 +26,147 @@ import parse_cc_graph
 #   - Compute the set of ref-counted roots, which are ref-counted
 #     objects where the ref count is greater than the internal count.
 #
-#   - Compute live set of objects reachable from marked GC objects or
-#     ref-counted roots.
+#   - Compute live set of objects reachable from marked GC objects,
+#     ref-counted roots or incremental roots, taking weak maps into
+#     account.
 #
-#   - Convert output to the same format as the FX CC.  Any objects in
-#     the set of live objects are garbage.
-
-
-# Arguments: one or more cycle collector edge files, which will be checked in sequence.
-
-usage = "usage: %prog FILE1 FILE2 ... FILEn\n\
-  Each FILE is a cycle collector graph file to check."
-description = 'Check one or more cycle collector result files for correctness relative to the cycle collector graph.'
-parser = OptionParser(description=description, usage=usage)
-
-options, args = parser.parse_args()
-
-
-# Calculate how many references are accounted for by edges in the graph.
-def computeInternalCounts (g, ga):
-  ics = {}
-
-  for src, edges in g.iteritems():
-    for dst, count in edges.iteritems():
-      if dst in ga.rcNodes:
-        ics[dst] = ics.get(dst, 0) + count
-
-  return ics
-
-
-# A refcounted node is a root if its ref count > its computed internal count.
-def computeRefCountedRoots (ga, ics):
-  roots = set([])
-
-  for x, rc in ga.rcNodes.iteritems():
-    ic = ics.get(x, 0)
-    if rc > ic:
-      roots.add(x)
-    elif ic > rc:
-      print 'Error: computed internal count of', x, 'greater than supplied reference count.'
-      exit(-1)
+#   - Convert output to the same format as the FX CC.  Any objects not
+#     in the set of live objects are garbage.
+#
+# The collection itself is done by simulate_collector, on a graph
+# loaded with csr_graph, so all of the per-node data is kept in flat
+# arrays indexed by node id.  Files are checked in parallel in a pool
+# of processes.
 
-  return roots
 
-# Compute the set of live objects reachable from the roots.
-def reachableFromRoots (g, ga, rcRoots):
-  live = set([])
+# Arguments: one or more cycle collector edge files.
 
-  def floodLive (x):
-    live.add(x)
-    assert(x in g)
-    for y in g[x].keys():
-      if not y in live:
-        floodLive(y)
+parser = argparse.ArgumentParser(description='Check one or more cycle collector result files for correctness relative to the cycle collector graph.')
 
-  # flood from ref counted roots
-  for x in rcRoots:
-    if not x in live:
-      floodLive(x)
+parser.add_argument('file_names', metavar='FILE', nargs='+',
+                    help='cycle collector graph file to check')
 
-  # flood from garbage collected roots
-  for x, marked in ga.gcNodes.iteritems():
-    if marked and not x in live:
-      floodLive(x)
+parser.add_argument('--jobs', '-j', dest='jobs', type=int,
+                    default=os.cpu_count(),
+                    help='Number of files to check in parallel. Defaults to the number of CPUs.')
 
-  return live
 
+# perform cycle collection on the graph.  Returns None if the graph has
+# a node with more internal references than its ref count, because
+# then the graph itself is wrong.
+def cycleCollect (ig, errors):
+  sim = simulate_collector.simulate(ig)
 
-# perform cycle collection on the graph
-def cycleCollect (g, ga):
-  # compute results
-  ics = computeInternalCounts(g, ga)
-  rcRoots = computeRefCountedRoots (ga, ics)
-  live = reachableFromRoots (g, ga, rcRoots)
+  if sim.overCounted:
+    x = sim.overCounted[0]
+    errors.append('Error: computed internal count of {0} greater than supplied reference count.'.format(ig.names[x]))
+    return None
 
   # produce results in the same format as the Fx CC
   knownEdges = {}
-  for x in rcRoots:
-    knownEdges[x] = ics.get(x, 0)
-  garbage = set(g.keys()) - live
+  for x, ic in sim.knownEdges.items():
+    knownEdges[ig.names[x]] = ic
+  garbage = set([ig.names[x] for x in sim.garbage])
 
   return (knownEdges, garbage)
 
 
-def graphRange (g):
-  r = set([])
-  for edges in g.values():
-    r |= set(edges.keys())
-  return r
-
-
 # some basic coherence checks on the graph
-def checkGraph (g, ga):
-  rcs = set(ga.rcNodes.keys())  # RCed nodes
-  gcs = set(ga.gcNodes.keys())  # GCed nodes
-
-  # no nodes can be both RC and GC
-  if (rcs & gcs) != set([]):
-    print 'Some nodes are both ref counted and gced:',
-    for x in rcs & gcs:
-      print x
-    exit(-1)
-
+def checkGraph (ig, errors):
   # all ref counts must be non-zero positive integers
-  for v in ga.rcNodes.values():
-    if v <= 0:
-      print 'Found a negative or zero ref count.'
-      exit(-1)
-
-  # all GC nodes map to either True or False
-  assert(set(ga.gcNodes.values()) - set([True, False]) == set([]))
-
-  gd = set(g.keys())
+  for x in range(ig.numNodes):
+    if ig.kinds[x] == csr_graph.RC and ig.refCounts[x] <= 0:
+      errors.append('Found a negative or zero ref count.')
+      break
 
   # everything in the graph range is in the domain
-  if graphRange(g) - gd != set([]):
-    print '\nError: nodes in graph range but not domain:', graphRange(g) - gd
-    exit(-1)
-  # all nodes are either ref counted or GCed
-  assert(gd == rcs | gcs)
+  missing = ig.names[ig.numNodes:]
+  if missing:
+    errors.append('Error: nodes in graph range but not domain: ' + ', '.join(missing))
 
   # Nothing related to labels is checked.
 
 
-def checkResults (g, ga, (knownEdgesFx, garbageFx), r1Name,
-                         (knownEdgesPy, garbagePy), r2Name):
-  resultsOk = True
-
+def checkResults (ig, knownEdgesFx, garbageFx, r1Name,
+                  knownEdgesPy, garbagePy, r2Name, errors):
   # check that calculated garbage is identical
-  if garbageFx != garbagePy:
-    print
-    resultsOk = False
-    s1 = garbageFx - garbagePy
-    for x in s1:
-      print '  Error:', x, 'was reported as garbage by ' + r1Name + ' but not ' + r2Name
-      foundAnyBad = True
-    s2 = garbagePy - garbageFx
-    for x in s2:
-      print '  Error:', x, 'was reported as garbage by ' + r1Name + ' but not ' + r2Name
-      foundAnyBad = True
-    assert(s1 != set([]) or s2 != set([]))
+  for x in garbageFx - garbagePy:
+    errors.append('  Error: ' + x + ' was reported as garbage by ' + r1Name + ' but not ' + r2Name)
+  for x in garbagePy - garbageFx:
+    errors.append('  Error: ' + x + ' was reported as garbage by ' + r2Name + ' but not ' + r1Name)
 
   # check that roots and known edges match up
   if knownEdgesFx != knownEdgesPy:
-    if resultsOk:
-      print
-    resultsOk = False
-    for x in g.keys():
+    for x in ig.names:
       if x in knownEdgesFx:
         if not x in knownEdgesPy:
-          print '  Error:', x, 'had known edges reported, but ' + r2Name + ' did not think it was a root.'
-        else:
-          if knownEdgesFx[x] != knownEdgesPy[x]:
-            sys.stdout.write ('  Error: results disagree on internal count for {0} (computed {1}, reported {2})\n'.format\
-                                (x, knownEdgesPy[x], knownEdgesFx[x]))
-      else:
-        if x in knownEdgesPy:
-          print '  Error:', x, 'in ' + r2Name + ' root set, but not ' + r1Name + ' root set.'
+          errors.append('  Error: ' + x + ' had known edges reported, but ' + r2Name + ' did not think it was a root.')
+        elif knownEdgesFx[x] != knownEdgesPy[x]:
+          errors.append('  Error: results disagree on internal count for {0} (computed {1}, reported {2})'.format\
+                          (x, knownEdgesPy[x], knownEdgesFx[x]))
+      elif x in knownEdgesPy:
+        errors.append('  Error: ' + x + ' in ' + r2Name + ' root set, but not ' + r1Name + ' root set.')
 
-  return resultsOk
 
+# Check a single file.  This runs in a worker process, so rather than
+# printing anything it returns the file name, whether it was okay,
+# whether the checker should stop, and a list of error messages.
+def parseAndCheckResults (fname):
+  errors = []
 
+  (ig, (knownEdgesFx, garbageFx)) = csr_graph.loadCCGraph(fname)
 
-def parseAndCheckResults(fname):
-  print 'Checking ' + fname + '.',
+  checkGraph(ig, errors)
+  if errors:
+    return (fname, False, False, errors)
 
-  print 'Parsing.',
-  sys.stdout.flush()
-  pef = parse_cc_graph.parseCCEdgeFile(fname)
-  g = pef[0]
-  ga = pef[1]
-  resFx = pef[2]
+  resPy = cycleCollect(ig, errors)
+  if resPy is None:
+    return (fname, False, True, errors)
 
-  print 'Checking graph.',
-  sys.stdout.flush()
-  checkGraph(g, ga)
+  (knownEdgesPy, garbagePy) = resPy
+  checkResults(ig, knownEdgesFx, garbageFx, 'Firefox cycle collector',
+               knownEdgesPy, garbagePy, 'Python cycle collector', errors)
 
-  print 'Running PyCC.',
-  sys.stdout.flush()
-  resPy = cycleCollect(g, ga)
+  return (fname, not errors, False, errors)
 
-  print 'Comparing results.',
-  sys.stdout.flush()
-  ok = checkResults (g, ga, resFx, 'Firefox cycle collector',
-                            resPy, 'Python cycle collector')
-  if ok:
-    print 'Ok.'
-  else:
-    print 'Error.'
-    exit(-1)
 
-  return ok
+def printResult (fname, ok, errors):
+  print('Checking ' + fname + '.', 'Ok.' if ok else 'Error.')
+  for e in errors:
+    print(e)
+  sys.stdout.flush()
 
 
-####################
+def checkCycleCollector ():
+  args = parser.parse_args()
+  allOk = True
 
+  if args.jobs <= 1 or len(args.file_names) == 1:
+    for fname in args.file_names:
+      (_, ok, fatal, errors) = parseAndCheckResults(fname)
+      printResult(fname, ok, errors)
+      if fatal:
+        exit(-1)
+      allOk &= ok
+  else:
+    # Report each file as soon as it is done.
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+      futures = [executor.submit(parseAndCheckResults, fname) for fname in args.file_names]
+      for future in as_completed(futures):
+        (fname, ok, fatal, errors) = future.result()
+        printResult(fname, ok, errors)
+        if fatal:
+          executor.shutdown(wait=False, cancel_futures=True)
+          exit(-1)
+        allOk &= ok
+
+  if allOk:
+    print('All files were okay.')
+  else:
+    print('Error: One or more files failed checking.')
+    exit(-1)
 
-allOk = True
-for fname in args:
-  allOk &= parseAndCheckResults(fname)
 
-if allOk:
-  print 'All files were okay.'
-else:
-  print 'Error: One or more files failed checking.'
+if __name__ == "__main__":
+  checkCycleCollector()
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import sys
+import argparse
+from . import shared_graph
+from . import quotient_graph
+
+
+# Look at a CC graph at the level of classes: which classes hold onto
+# which other classes, and how many times.  The graph is collapsed into
+# its quotient graph of classes once, and all of the queries run on
+# that, so they only look at thousands of classes instead of millions
+# of nodes.
+
+
+parser = argparse.ArgumentParser(description='Show which classes of objects hold onto which other classes in a CC graph.')
+
+parser.add_argument('file_name',
+                    help='cycle collector graph file name')
+
+parser.add_argument('--combine-labels', '-c', dest='canonize', action='store_true',
+                    default=False,
+                    help='Combine similar labels, like all XUL nodes, or JS objects with different globals.')
+
+parser.add_argument('--holders', dest='holders',
+                    help='Print out the classes that hold onto objects of this class.')
+
+parser.add_argument('--holdees', dest='holdees',
+                    help='Print out the classes that objects of this class hold onto.')
+
+parser.add_argument('--dot', dest='dot', action='store_true',
+                    default=False,
+                    help='Write the class graph to FILE_NAME.classes.dot.')
+
+parser.add_argument('--min', dest='min_weight', type=int,
+                    default=1,
+                    help='Only show class edges that stand for at least this many edges.')
+
+
+def loadGraph(fname):
+  sys.stderr.write ('Parsing {0}. '.format(fname))
+  sys.stderr.flush()
+  (ig, res) = shared_graph.loadCCGraph(fname)
+  sys.stderr.write('Done loading graph.\n')
+  sys.stderr.flush()
+
+  return ig
+
+
+def classId (args, qg, name):
+  if args.canonize:
+    name = quotient_graph.canonicalLabel(name)
+  if not name in qg.classIds:
+    print(name, 'is not in the graph.')
+    exit(-1)
+  return qg.classIds[name]
+
+
+def printWeights (args, qg, weights):
+  for c, w in sorted(weights.items(), key=lambda cw: -cw[1]):
+    if w >= args.min_weight:
+      print('%(num)8d %(label)s' % {'num':w, 'label':qg.classNames[c]})
+
+
+def classGraph ():
+  args = parser.parse_args()
+
+  ig = loadGraph(args.file_name)
+  canonicalize = quotient_graph.canonicalLabel if args.canonize else None
+  qg = quotient_graph.classGraph(ig, canonicalize)
+  sys.stderr.write('Found {0} classes.\n'.format(len(qg.classNames)))
+
+  if args.holders != None:
+    c = classId(args, qg, args.holders)
+    print('Classes holding onto', qg.nodeCounts[c], 'objects of class', qg.classNames[c])
+    printWeights(args, qg, quotient_graph.predecessorClasses(qg, c))
+
+  if args.holdees != None:
+    c = classId(args, qg, args.holdees)
+    print('Classes held by', qg.nodeCounts[c], 'objects of class', qg.classNames[c])
+    printWeights(args, qg, qg.edges.get(c, {}))
+
+  if args.dot:
+    fname = args.file_name + '.classes.dot'
+    quotient_graph.writeDotFile(qg, fname, args.min_weight)
+    sys.stderr.write('Wrote class graph to {0}.\n'.format(fname))
+
+
+if __name__ == "__main__":
+  classGraph()
@@ -0,0 +1,496 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Library for parsing cycle collector log files into a compact integer
+# graph, for analyses that need to scale to very large logs.
+
+
+# loadCCGraph (file_name, recordEdgeLabels=False): given the file name
+#   of a CC edge file, parse
+#   and return the data.  This function returns a tuple with two
+#   components.
+#
+#   The first component is an IntGraph.  Every node address is
+#   interned to a small integer id.  Nodes that are described in the
+#   log get the ids 0 through numNodes - 1, in the order they appear
+#   in the log.  Addresses that only appear as the target of an edge
+#   get ids after that, and have the kind MISSING.
+#
+#   Edges are stored in compressed sparse row (CSR) form: the targets
+#   of the edges from node x are targets[offsets[x]:offsets[x+1]].
+#   There is one entry per edge, so multiple edges from x to y appear
+#   multiple times.
+#
+#      - names maps ids to addresses, and ids maps addresses to ids.
+#      - kinds is a bytearray holding the kind of each node: RC, GC,
+#        GC_MARKED or MISSING.
+#      - refCounts holds the ref count of each RC node, and 0 for
+#        everything else.
+#      - labels maps ids to a label id, and labelNames maps label ids
+#        to the label string.  Nodes without a label have the label ''.
+#      - incrRoots is an array of the ids of incremental roots.
+#      - weakMapEntries is a list of WeakMapEntry, with addresses as in
+#        parse_cc_graph.
+#      - edgeLabels is None, unless recordEdgeLabels is True, in which
+#        case it holds the label id of each edge, aligned with targets.
+#        Edge and node labels share labelNames.
+#
+#   The second component contains the results of the cycle collector,
+#   in the same format as parse_cc_graph.parseResults.
+#
+# GraphBuilder (recordEdgeLabels): parses the graph part of a log a few
+#   lines at a time, for logs that are still being written.
+#   parseLines (lines) parses lines until the end of the graph, and
+#   returns True if it got there.  snapshot () returns an IntGraph of
+#   the graph so far, and finish () returns the IntGraph once the
+#   whole graph has been parsed.
+#
+# transpose (numIds, offsets, targets, edgeLabels): compute the reversed
+#   graph of a CSR graph with a counting sort, in linear time and
+#   without allocating anything per node.  Returns (offsets, sources,
+#   labels): the sources of the edges to node x are
+#   sources[offsets[x]:offsets[x+1]], and labels is aligned with
+#   sources, or None if edgeLabels is None.
+#
+# reverseDictGraph (g): reverse a graph represented as a map from each
+#   node to a collection of its successors, as produced by
+#   toSinglegraph, via transpose.  Returns a PredecessorMap, which acts
+#   like a map from each node with at least one predecessor to a list of
+#   its predecessors, without the overhead of a set or list per node.
+#
+# stringTable (strings): pack a list of strings into (offsets, data),
+#   an array of the offset of each string and a bytearray of the
+#   strings in UTF-8, so they can be written to a file or shared
+#   memory and used from there with a StringTable.
+#
+# StringTable (offsets, data): read-only list of the strings in a
+#   string table, which decodes each string when it is looked up.
+#
+# addressOrder (names): an array of ids sorted by name.
+#
+# AddressIndex (names, order): read-only map from names to ids, given
+#   the order from addressOrder, which does a binary search instead of
+#   using a dict.
+
+
+import sys
+from array import array
+from collections import namedtuple
+from . import parse_cc_graph
+
+
+IntGraph = namedtuple('IntGraph',
+                      'numNodes names ids offsets targets kinds refCounts labels labelNames incrRoots weakMapEntries edgeLabels')
+
+
+# Node kinds.
+MISSING = 0
+RC = 1
+GC = 2
+GC_MARKED = 3
+
+
+####
+####  Log parsing
+####
+
+nodePatt = parse_cc_graph.nodePatt
+weakMapEntryPatt = parse_cc_graph.weakMapEntryPatt
+incrRootPatt = parse_cc_graph.incrRootPatt
+
+
+# The state of a parse of the graph part of a CC log, which can be fed
+# the log a few lines at a time, for logs that are still being written.
+# Nodes get ids in the order their addresses are first seen, and are
+# renumbered into log order when an IntGraph is made.
+class GraphBuilder:
+  def __init__(self, recordEdgeLabels):
+    self.ids = {}
+    self.names = []
+    self.kinds = bytearray()
+    self.refCounts = array('i')
+    self.labels = array('i')
+    self.labelIds = {'':0}
+    self.labelNames = ['']
+    self.incrRoots = []
+    self.weakMapEntries = []
+
+    # The node ids of each node described in the log, in order, and the
+    # start of its edges in targets.
+    self.rows = array('i')
+    self.rowOffsets = array('q')
+    self.targets = array('i')
+    self.edgeLabels = array('i') if recordEdgeLabels else None
+
+  # Parse lines until the end of the graph.  Returns True if the end of
+  # the graph was reached, in which case any lines after it are left in
+  # lines.
+  def parseLines(self, lines):
+    ids = self.ids
+    names = self.names
+    kinds = self.kinds
+    refCounts = self.refCounts
+    labels = self.labels
+    labelIds = self.labelIds
+    labelNames = self.labelNames
+    rows = self.rows
+    rowOffsets = self.rowOffsets
+    targets = self.targets
+    edgeLabels = self.edgeLabels
+    recordEdgeLabels = edgeLabels is not None
+
+    def intern (addr):
+      x = ids.get(addr)
+      if x is None:
+        x = len(names)
+        ids[addr] = x
+        names.append(addr)
+        kinds.append(MISSING)
+        refCounts.append(0)
+        labels.append(0)
+      return x
+
+    def internLabel (lbl):
+      lblId = labelIds.get(lbl)
+      if lblId is None:
+        lblId = len(labelNames)
+        labelIds[lbl] = lblId
+        labelNames.append(lbl)
+      return lblId
+
+    for l in lines:
+      if l[0] == '>':
+        # Avoid regexps for edges, as there are many more edges than nodes.
+        end = l.find(' ', 2)
+        if end == -1:
+          end = len(l.rstrip())
+        targets.append(intern(l[2:end]))
+        if recordEdgeLabels:
+          edgeLabels.append(internLabel(l[end + 1:].rstrip('\r\n')))
+        continue
+
+      nm = nodePatt.match(l)
+      if nm:
+        x = intern(nm.group(1))
+        assert kinds[x] == MISSING, 'Node ' + nm.group(1) + ' was logged twice.'
+        rows.append(x)
+        rowOffsets.append(len(targets))
+
+        nodeTy = nm.group(2)
+        if nodeTy == 'gc':
+          kinds[x] = GC
+        elif nodeTy == 'gc.marked':
+          kinds[x] = GC_MARKED
+        else:
+          kinds[x] = RC
+          refCounts[x] = int(nodeTy[3:])
+
+        labels[x] = internLabel(nm.group(3))
+      elif l[:10] == '==========':
+        return True
+      else:
+        wmem = weakMapEntryPatt.match(l)
+        if wmem:
+          self.weakMapEntries.append(parse_cc_graph.WeakMapEntry(weakMap=wmem.group(1), key=wmem.group(2),
+                                                                 keyDelegate=wmem.group(3), value=wmem.group(4)))
+          continue
+        iroot = incrRootPatt.match(l)
+        if iroot:
+          self.incrRoots.append(intern(iroot.group(1)))
+        elif l[0] != '#':
+          sys.stderr.write('Error: skipping unknown line:' + l[:-1] + '\n')
+
+    return False
+
+  # Return an IntGraph of the graph so far, without changing the
+  # builder, so it can keep going.  The last node may be missing some
+  # of its edges.
+  def snapshot(self):
+    rowOffsets = array('q', self.rowOffsets)
+    rowOffsets.append(len(self.targets))
+    edgeLabels = array('i', self.edgeLabels) if self.edgeLabels is not None else None
+    return renumber(dict(self.ids), self.names, self.kinds, self.refCounts,
+                    self.labels, list(self.labelNames), self.rows, rowOffsets,
+                    array('i', self.targets), self.incrRoots,
+                    list(self.weakMapEntries), edgeLabels)
+
+  # Return an IntGraph of the whole graph.  The builder can't be used
+  # after this, as its arrays are reused by the IntGraph.
+  def finish(self):
+    self.rowOffsets.append(len(self.targets))
+    return renumber(self.ids, self.names, self.kinds, self.refCounts,
+                    self.labels, self.labelNames, self.rows, self.rowOffsets,
+                    self.targets, self.incrRoots, self.weakMapEntries,
+                    self.edgeLabels)
+
+
+def parseGraph (f, recordEdgeLabels):
+  builder = GraphBuilder(recordEdgeLabels)
+  builder.parseLines(f)
+  return builder.finish()
+
+
+# Renumber the nodes so that the nodes described in the log come
+# first, in log order.  This makes the edges of each node contiguous
+# in targets without having to move them around.
+def renumber (ids, names, kinds, refCounts, labels, labelNames, rows,
+              rowOffsets, targets, incrRoots, weakMapEntries, edgeLabels):
+  numNodes = len(rows)
+  numIds = len(names)
+
+  perm = array('i', [-1]) * numIds
+  for r in range(numNodes):
+    perm[rows[r]] = r
+  nextId = numNodes
+  for x in range(numIds):
+    if perm[x] == -1:
+      perm[x] = nextId
+      nextId += 1
+
+  newNames = [None] * numIds
+  newKinds = bytearray(numIds)
+  newRefCounts = array('i', [0]) * numIds
+  newLabels = array('i', [0]) * numIds
+  for x in range(numIds):
+    y = perm[x]
+    newNames[y] = names[x]
+    newKinds[y] = kinds[x]
+    newRefCounts[y] = refCounts[x]
+    newLabels[y] = labels[x]
+
+  for i in range(len(targets)):
+    targets[i] = perm[targets[i]]
+
+  # Nodes that only appear as edge targets have no edges.
+  offsets = rowOffsets
+  offsets.extend(array('q', [len(targets)]) * (numIds - numNodes))
+
+  for addr, x in ids.items():
+    ids[addr] = perm[x]
+
+  return IntGraph(numNodes=numNodes, names=newNames, ids=ids,
+                  offsets=offsets, targets=targets, kinds=newKinds,
+                  refCounts=newRefCounts, labels=newLabels,
+                  labelNames=labelNames,
+                  incrRoots=array('i', [perm[x] for x in incrRoots]),
+                  weakMapEntries=weakMapEntries, edgeLabels=edgeLabels)
+
+
+def loadCCGraph (fname, recordEdgeLabels=False):
+  try:
+    f = open(fname, 'r')
+  except:
+    sys.stderr.write('Error opening file ' + fname + '\n')
+    exit(-1)
+
+  ig = parseGraph(f, recordEdgeLabels)
+  res = parse_cc_graph.parseResults(f)
+  f.close()
+  return (ig, res)
+
+
+####
+####  Graph queries
+####
+
+def successors (ig, x):
+  return ig.targets[ig.offsets[x]:ig.offsets[x + 1]]
+
+
+def nodeLabel (ig, x):
+  return ig.labelNames[ig.labels[x]]
+
+
+def isGC (ig, x):
+  return ig.kinds[x] == GC or ig.kinds[x] == GC_MARKED
+
+
+####
+####  Reversed graphs
+####
+
+def transpose (numIds, offsets, targets, edgeLabels=None):
+  # Count the in-degree of each node, then turn the counts into offsets.
+  revOffsets = array('q', [0]) * (numIds + 1)
+  for dst in targets:
+    revOffsets[dst + 1] += 1
+  for x in range(numIds):
+    revOffsets[x + 1] += revOffsets[x]
+
+  # Scatter the edges into place.  Sources are visited in order, so the
+  # predecessors of each node end up sorted.
+  nextSlot = revOffsets[:numIds]
+  sources = array('i', [0]) * len(targets)
+  if edgeLabels is None:
+    labels = None
+    for src in range(numIds):
+      for j in range(offsets[src], offsets[src + 1]):
+        dst = targets[j]
+        sources[nextSlot[dst]] = src
+        nextSlot[dst] += 1
+  else:
+    labels = array('i', [0]) * len(targets)
+    for src in range(numIds):
+      for j in range(offsets[src], offsets[src + 1]):
+        dst = targets[j]
+        k = nextSlot[dst]
+        sources[k] = src
+        labels[k] = edgeLabels[j]
+        nextSlot[dst] = k + 1
+
+  return (revOffsets, sources, labels)
+
+
+def transposeGraph (ig):
+  return transpose(len(ig.names), ig.offsets, ig.targets, ig.edgeLabels)
+
+
+# Convert a map from nodes to collections of successors into CSR form.
+# Nodes that are keys of g get the first ids.  Returns (names, ids,
+# offsets, targets).
+def fromDictGraph (g):
+  ids = {}
+  names = list(g)
+  for x, addr in enumerate(names):
+    ids[addr] = x
+
+  offsets = array('q', [0])
+  targets = array('i')
+  for x in range(len(g)):
+    for dst in g[names[x]]:
+      y = ids.get(dst)
+      if y is None:
+        y = len(names)
+        ids[dst] = y
+        names.append(dst)
+      targets.append(y)
+    offsets.append(len(targets))
+  offsets.extend(array('q', [len(targets)]) * (len(names) - len(g)))
+
+  return (names, ids, offsets, targets)
+
+
+# Read-only list of the names of the nodes with the ids in an array,
+# which looks up each name as it is used.
+class NameList:
+  def __init__(self, names, ids):
+    self.names = names
+    self.ids = ids
+
+  def __len__(self):
+    return len(self.ids)
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return NameList(self.names, self.ids[i])
+    return self.names[self.ids[i]]
+
+  def __iter__(self):
+    names = self.names
+    for x in self.ids:
+      yield names[x]
+
+
+# Read-only map from node names to lists of the names of their
+# predecessors, backed by the output of transpose.  Each list is a
+# NameList over a slice of sources, so nothing is copied when it is
+# looked up.  There is one entry per edge, so a node with multiple
+# edges to x is listed multiple times.
+class PredecessorMap:
+  def __init__(self, names, ids, offsets, sources):
+    self.names = names
+    self.ids = ids
+    self.offsets = offsets
+    self.sources = memoryview(sources)
+
+  def __contains__(self, addr):
+    x = self.ids.get(addr)
+    return x is not None and self.offsets[x] != self.offsets[x + 1]
+
+  def __getitem__(self, addr):
+    if not addr in self:
+      raise KeyError(addr)
+    x = self.ids[addr]
+    return NameList(self.names, self.sources[self.offsets[x]:self.offsets[x + 1]])
+
+  def get(self, addr, default=None):
+    if not addr in self:
+      return default
+    return self[addr]
+
+
+def reverseDictGraph (g):
+  (names, ids, offsets, targets) = fromDictGraph(g)
+  (revOffsets, sources, _) = transpose(len(names), offsets, targets)
+  return PredecessorMap(names, ids, revOffsets, sources)
+
+
+####
+####  String tables
+####
+
+def stringTable (strings):
+  offsets = array('q', [0])
+  data = bytearray()
+  for s in strings:
+    data += s.encode('utf-8')
+    offsets.append(len(data))
+  return (offsets, data)
+
+
+class StringTable:
+  def __init__(self, offsets, data):
+    self.offsets = offsets
+    self.data = data
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self[j] for j in range(*i.indices(len(self)))]
+    if i < 0:
+      i += len(self)
+    if i < 0 or i >= len(self):
+      raise IndexError(i)
+    return str(self.data[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+
+def addressOrder (names):
+  return array('i', sorted(range(len(names)), key=names.__getitem__))
+
+
+class AddressIndex:
+  def __init__(self, names, order):
+    self.names = names
+    self.order = order
+
+  def __len__(self):
+    return len(self.order)
+
+  def get(self, addr, default=None):
+    lo = 0
+    hi = len(self.order)
+    while lo < hi:
+      mid = (lo + hi) // 2
+      x = self.order[mid]
+      name = self.names[x]
+      if name == addr:
+        return x
+      if name < addr:
+        lo = mid + 1
+      else:
+        hi = mid
+    return default
+
+  def __contains__(self, addr):
+    return self.get(addr) is not None
+
+  def __getitem__(self, addr):
+    x = self.get(addr)
+    if x is None:
+      raise KeyError(addr)
+    return x
@@ -1,119 +1,90 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import sys
-from collections import namedtuple
-import parse_cc_graph
-from optparse import OptionParser
+import argparse
+from . import csr_graph
+from . import shared_graph
 
 
-# Find the objects that are rooting a particular object (or objects of
-# a certain class) in the cycle collector graph
+# Given a garbage object, find every member of the strongly connected
+# component containing it, considering only garbage nodes.  These are
+# the garbage objects that are reachable from the target and that can
+# reach the target.
 #
-# This works by reversing the graph, then flooding to find roots.
-#
-# There are various options to alter what is treated as a root, but
-# these are mostly experimental, so they may not produce particularly
-# useful results.
-#
-# --node-name-as-root nsRange (for example) will treat all objects
-# with the node name nsRange as roots.  This is useful if a previous
-# analysis has determined that a leak always involves an object being
-# held onto by a certain class, and you want to continue with manual
-# analysis starting at that object.
-
+# The graph is loaded with csr_graph, and the backwards direction is
+# computed on its transpose, so no per-node sets are allocated.
 
 
-# Command line arguments
+parser = argparse.ArgumentParser(description='Find the garbage objects that are in a cycle with a garbage object.')
 
-usage = "usage: %prog file_name target\n\
-  file_name is the name of the cycle collector graph file\n\
-  target is the object to look for"
-parser = OptionParser(usage=usage)
+parser.add_argument('file_name',
+                    help='cycle collector graph file name')
 
-options, args = parser.parse_args()
-
-if len(args) != 2:
-  print 'Expected two arguments.'
-  exit(0)
-
-
-def reverseGraph (g):
-  g2 = {}
-  print 'Reversing graph.'
-  sys.stdout.flush()
-  for src, dsts in g.iteritems():
-    for d in dsts:
-      g2.setdefault(d, set([])).add(src)
-  return g2
+parser.add_argument('target',
+                    help='address of the target object')
 
 
 def loadGraph(fname):
   sys.stdout.write ('Parsing {0}. '.format(fname))
   sys.stdout.flush()
-  (g, ga, res) = parse_cc_graph.parseCCEdgeFile(fname)
-  #sys.stdout.write ('Converting to single graph. ') 
-  #sys.stdout.flush()
-  g = parse_cc_graph.toSinglegraph(g)
-  print 'Done loading graph.',
-
-  return (g, ga, res)
+  (ig, res) = shared_graph.loadCCGraph(fname)
+  print('Done loading graph.', end=' ')
 
+  return (ig, res)
 
-def reachableFrom (g, garb, x):
-  if not x in garb:
-    print x, "is not garbage"
-    exit -1
 
-  visited = {x:True}
+# Return the set of ids of garbage nodes reachable from x, including x,
+# in the CSR graph given by offsets and targets.
+def reachableFrom (offsets, targets, garb, x):
+  visited = set([x])
   working = [x]
-  s = set([x])
 
-  while [] != working:
+  while working:
     curr = working.pop()
+    for j in range(offsets[curr], offsets[curr + 1]):
+      y = targets[j]
+      if not y in visited and y in garb:
+        visited.add(y)
+        working.append(y)
 
-    if not curr in g:
-      continue
-
-    for next in g[curr]:
-      if not next in visited and next in garb:
-        visited[next] = True
-        working.append(next)
-        s.add(next)
-
-  return s
-
+  return visited
 
-####################
 
-file_name = args[0]
-target = args[1]
+def cycleFriends ():
+  args = parser.parse_args()
 
-(g, ga, res) = loadGraph (file_name)
+  (ig, res) = loadGraph(args.file_name)
 
-print
-print "Computing forward direction"
+  target = ig.ids.get(args.target)
+  if target is None:
+    print(args.target, 'is not in the graph.')
+    exit(-1)
 
-# garbage objects reachable from target
-forw = reachableFrom(g, res[1], target)
+  garb = set([ig.ids[x] for x in res[1] if x in ig.ids])
+  if not target in garb:
+    print(args.target, 'is not garbage.')
+    exit(-1)
 
-print "Computing backwards direction"
+  print()
+  print('Computing forward direction')
 
-# garbage objects that reach target
-revg = reverseGraph(g)
-backw = reachableFrom(revg, res[1], target)
+  # garbage objects reachable from target
+  forw = reachableFrom(ig.offsets, ig.targets, garb, target)
 
-# members of garbage cycle including target
-print "Cycle members:", 
-cyc = list(forw & backw)
-cyc.sort()
+  print('Computing backwards direction')
 
-for i in cyc:
-  print i,
-print
+  # garbage objects that reach target
+  (revOffsets, sources, _) = csr_graph.transposeGraph(ig)
+  backw = reachableFrom(revOffsets, sources, garb, target)
 
+  # members of garbage cycle including target
+  cyc = sorted([ig.names[x] for x in forw & backw])
+  print('Cycle members:', ' '.join(cyc))
 
 
+if __name__ == "__main__":
+  cycleFriends()
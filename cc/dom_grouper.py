@@ -1,16 +1,25 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 # associate each DOM node with its uppermost parent.
+#
+# Addresses are interned to integer ids, and the union-find structure
+# is kept in flat arrays indexed by id, so it takes a constant amount
+# of memory per node.  Finding uses path halving, so it is iterative
+# and can't hit the recursion limit on long parent chains.  The
+# information needed to merge DOM parents is gathered in the same pass
+# and resolved against the final groups at the end, so the log is only
+# read once.
 
 
 import sys
 import re
-import parse_cc_graph
 import argparse
+from array import array
+from . import parse_cc_graph
 
 
 # Argument parsing.
@@ -24,60 +33,84 @@ argparser.add_argument('--only-orphans', '-oo', dest='only_orphans', action='sto
 argparser.add_argument('--no-garbage', '-ng', dest='no_garbage', action='store_true',
                        default=False,
                        help='Don\'t print out information about garbage')
-
-
-args = argparser.parse_args()
-
-
-# union find with path compression and union by rank
-
-def findi (m, x):
-  if not x in m:
-    m[x] = [x, 0]
-    return m[x]
-  if m[x][0] == x:
-    return m[x]
-  z = findi (m, m[x][0])
-  m[x] = z
-  return z
-
-def find (m, x):
-  return findi(m, x)[0]
-
-def union (m, rep, x, y):
-  xp = findi (m, x)
-  yp = findi (m, y)
-  if xp == yp:
-    return
-  if xp[1] < yp[1]:
-    rep[yp[0]] = rep.get(xp[0], xp[0])
-    if xp[0] in rep:
-      del rep[xp[0]]
-    m[xp[0]][0] = yp[0]
-  elif xp[1] > yp[1]:
-    m[yp[0]][0] = xp[0]
-  else:
-    m[yp[0]][0] = xp[0]
-    m[xp[0]][1] += 1
-
-
-def print_grouper_results (counts, rootLabels, docParents, docURLs, garb):
+argparser.add_argument('--print-merging', '-pm', dest='print_merging', action='store_true',
+                       default=False,
+                       help='Print out the members of each DOM, and DOM parents that could be merged')
+
+
+# union find with path halving and union by rank, on integer ids.
+#
+# - parents holds the parent of each id in the union-find forest.
+# - ranks holds the rank of each root.
+# - reps holds the representative of each root, which is the node that
+#   is reported as the top of the DOM.  This is tracked separately from
+#   the root, so that union by rank doesn't change which node is on top.
+# - inDOM is 1 for every id that has been passed to union.
+
+class UnionFind:
+  def __init__(self):
+    self.parents = array('i')
+    self.ranks = bytearray()
+    self.reps = array('i')
+    self.inDOM = bytearray()
+
+  def add(self):
+    x = len(self.parents)
+    self.parents.append(x)
+    self.ranks.append(0)
+    self.reps.append(x)
+    self.inDOM.append(0)
+    return x
+
+  def find(self, x):
+    parents = self.parents
+    while parents[x] != x:
+      parents[x] = parents[parents[x]]
+      x = parents[x]
+    return x
+
+  # Merge the DOM containing y into the DOM containing x.  The top of
+  # the DOM containing x becomes the top of the merged DOM.
+  def union(self, x, y):
+    self.inDOM[x] = 1
+    self.inDOM[y] = 1
+    xr = self.find(x)
+    yr = self.find(y)
+    if xr == yr:
+      return
+    rep = self.reps[xr]
+    if self.ranks[xr] < self.ranks[yr]:
+      (xr, yr) = (yr, xr)
+    self.parents[yr] = xr
+    if self.ranks[xr] == self.ranks[yr]:
+      self.ranks[xr] += 1
+    self.reps[xr] = rep
+
+  # The top of the DOM containing x, or x if it isn't in a DOM.
+  def top(self, x):
+    if not self.inDOM[x]:
+      return x
+    return self.reps[self.find(x)]
+
+
+def print_grouper_results (args, names, counts, rootLabels, docParents, docURLs, garb):
   garbage_total = 0
   in_doc_total = 0
   orphan_total = 0
 
   fout = open('counts.log', 'w')
   sys.stderr.write('Printing grouping results to counts.log\n')
-  for x, n in counts.iteritems():
+  for x, n in counts.items():
+    addr = names[x]
     print_this = True
     if args.only_orphans and x in docParents:
       print_this = False
-    if args.no_garbage and x in garb:
+    if args.no_garbage and addr in garb:
       print_this = False
 
     if print_this:
-      fout.write('%(num)8d %(label)s' % {'num':n, 'label':x})
-    if x in garb:
+      fout.write('%(num)8d %(label)s' % {'num':n, 'label':addr})
+    if addr in garb:
       garbage_total += n
       if print_this:
         fout.write(' is garbage')
@@ -85,7 +118,7 @@ def print_grouper_results (counts, rootLabels, docParents, docURLs, garb):
       in_doc_total += n
       if print_this:
         fout.write(' in document %(addr)s %(label)s\n' \
-                   % {'addr':docParents[x], 'label':docURLs[docParents[x]]})
+                   % {'addr':names[docParents[x]], 'label':docURLs[docParents[x]]})
     else:
       orphan_total += n
       if print_this:
@@ -113,91 +146,133 @@ def getURL(s):
   return s
 
 
-nodePatt = re.compile ('([a-zA-Z0-9]+) \[(?:rc=[0-9]+|gc(?:.marked)?)\] (.*)$')
-edgePatt = re.compile ('> ([a-zA-Z0-9]+) (.*)$')
-weakMapEntryPatt = re.compile ('WeakMapEntry map=([a-zA-Z0-9]+|\(nil\)) key=([a-zA-Z0-9]+|\(nil\)) keyDelegate=([a-zA-Z0-9]+|\(nil\)) value=([a-zA-Z0-9]+)\r?$')
+nodePatt = re.compile (r'([a-zA-Z0-9]+) \[(?:rc=[0-9]+|gc(?:.marked)?)\] (.*)$')
+edgePatt = re.compile (r'> ([a-zA-Z0-9]+) (.*)$')
+weakMapEntryPatt = parse_cc_graph.weakMapEntryPatt
+incrRootPatt = parse_cc_graph.incrRootPatt
 
-printMergingInformation = False
 
+def parseGraph (f, uf, ids, names, labels, labelNames, findMerging):
+  labelIds = {}
 
-def parseGraph (f):
-  currNode = None
-  currNodeLabel = ''
+  def intern (addr):
+    x = ids.get(addr)
+    if x is None:
+      x = uf.add()
+      ids[addr] = x
+      names.append(addr)
+      labels.append(-1)
+    return x
 
-  nodeLabels = {}
-  docsChildren = {}
+  docsChildren = []
   docURLs = {}
+
+  # For merging DOM parents, if findMerging is True: (child, parent
+  # class, parent) for each parent, and (DOM member, target) for each
+  # listener manager edge.
+  domParentEdges = []
+  listenerEdges = []
+  possibleChildren = set([])
+
+  currNode = None
   doneCurrEdges = False
   isDoc = False
-
-  m = {}
-  rep = {}
+  parentClass = None
+  childField = None
 
   for l in f:
     if l[0] == '>':
-      if doneCurrEdges:
-        continue
       e = edgePatt.match(l)
-      target = e.group(1)
       edgeLabel = e.group(2)
+      if findMerging:
+        if childField != None:
+          if edgeLabel == childField:
+            domParentEdges.append((intern(e.group(1)), parentClass, currNode))
+            childField = None
+        elif edgeLabel == '[via hash] mListenerManager':
+          listenerEdges.append((currNode, intern(e.group(1))))
+      if doneCurrEdges:
+        continue
       if edgeLabel == 'GetParent()':
         assert(not isDoc)
         assert(currNode != None)
         doneCurrEdges = True
-        union (m, rep, target, currNode)
+        uf.union(intern(e.group(1)), currNode)
       elif isDoc and edgeLabel == 'mChildren[i]':
-        docsChildren[currNode].add(target)
+        docsChildren.append((currNode, intern(e.group(1))))
     else:
       nm = nodePatt.match(l)
       if nm:
-        currNode = nm.group(1)
+        currNode = intern(nm.group(1))
         currNodeLabel = nm.group(2)
         isDoc = currNodeLabel.startswith('nsDocument')
         if isDoc:
-          docsChildren[currNode] = set([])
           docURLs[currNode] = getURL(currNodeLabel)
         else:
-          nodeLabels[currNode] = currNodeLabel
+          lblId = labelIds.get(currNodeLabel)
+          if lblId is None:
+            lblId = len(labelNames)
+            labelIds[currNodeLabel] = lblId
+            labelNames.append(currNodeLabel)
+          labels[currNode] = lblId
         doneCurrEdges = False
-      elif l == '==========\n':
+
+        parentClass = None
+        childField = None
+        if findMerging:
+          if currNodeLabel == 'nsDOMCSSAttributeDeclaration':
+            parentClass = 'nsDOMCSSAttributeDeclaration'
+            childField = 'mElement'
+          elif currNodeLabel.startswith('XPCWrappedNative'):
+            parentClass = 'XPCWrappedNative'
+            childField = 'mIdentity'
+          elif currNodeLabel == 'nsEventListenerManager':
+            possibleChildren.add(currNode)
+      elif l[:10] == '==========':
         break
       elif l.startswith('#'):
         # skip comments
         continue
+      elif weakMapEntryPatt.match(l) or incrRootPatt.match(l):
+        # ignore weak map entries and incremental roots
+        continue
       else:
-        wmem = weakMapEntryPatt.match(l)
-        if wmem:
-          # ignore weak map entries
-          continue
-        else:
-          sys.stderr.write('Error: skipping unknown line:' + l[:-1] + '\n')
+        sys.stderr.write('Error: skipping unknown line:' + l[:-1] + '\n')
+
+  return (docsChildren, docURLs, domParentEdges, listenerEdges, possibleChildren)
 
+
+def groupDOMs (args, f):
+  uf = UnionFind()
+  ids = {}
+  names = []
+  labels = array('i')
+  labelNames = []
+
+  (docsChildren, docURLs, domParentEdges, listenerEdges, possibleChildren) = \
+      parseGraph(f, uf, ids, names, labels, labelNames, args.print_merging)
   (known, garb) = parse_cc_graph.parseResults(f)
 
   # invert the children map
   docParents = {}
-
-  for x, s in docsChildren.iteritems():
-    for y in s:
-      assert(not y in docParents)
-      docParents[y] = x
-
+  for (x, y) in docsChildren:
+    assert(not y in docParents)
+    docParents[y] = x
 
   # compute DOM trees.
   counts = {}
   trees = {}
   rootLabels = {}
 
-  for x in m:
-    y = find(m, x)
-    if y in rep:
-      y = rep[y]
+  for x in range(len(names)):
+    if not uf.inDOM[x]:
+      continue
+    y = uf.top(x)
     counts[y] = counts.get(y, 0) + 1
-    if not y in trees:
-      trees[y] = []
-    trees[y].append(x)
+    if args.print_merging:
+      trees.setdefault(y, []).append(x)
     if y not in rootLabels:
-      currLabel = nodeLabels[y]
+      currLabel = labelNames[labels[y]] if labels[y] != -1 else ''
       if currLabel.startswith("nsGenericElement (xhtml)"):
         currLabel = getURL(currLabel)
       elif currLabel.startswith("nsGenericElement (XUL)"):
@@ -205,134 +280,52 @@ def parseGraph (f):
       rootLabels[y] = currLabel
 
   # print out results
-  print_grouper_results(counts, rootLabels, docParents, docURLs, garb)
+  print_grouper_results(args, names, counts, rootLabels, docParents, docURLs, garb)
 
-  # print out merging information
-  if printMergingInformation:
-    for x, l in trees.iteritems():
-      print x,
-      for y in l:
-        print y,
-      print
+  if args.print_merging:
+    for x, l in trees.items():
+      print(names[x], ' '.join([names[y] for y in l]))
+    printMergedDOMParents(uf, names, domParentEdges, listenerEdges, possibleChildren)
 
-  return trees
 
-
-def mergeDOMParents (f, trees):
+def printMergedDOMParents (uf, names, domParentEdges, listenerEdges, possibleChildren):
   sys.stderr.write('Merging DOM parents.\n')
 
-  # compute direct DOM merge map
-  merge = {}
-  for x, l in trees.iteritems():
-    for y in l:
-      merge[y] = x
-
-  currNode = None
-
-  parentsOfDOM = {} # map from a DOM to types of DOM parents to a list of parent nodes pointing at that DOM
-  inParent = False
-  parentClass = None
-  childField = None
+  # map from a DOM to types of DOM parents to a list of parent nodes pointing at that DOM
+  parentsOfDOM = {}
+  for (child, parentClass, parent) in domParentEdges:
+    parentsOfDOM.setdefault(uf.top(child), {}).setdefault(parentClass, []).append(parent)
 
-  possibleChildren = set([])
   childrenOfDOM = {}
-
-  # compute DOM parents to merge
-  for l in f:
-    if l[0] == '>':
-      e = edgePatt.match(l)
-      assert(e != None)
-      target = e.group(1)
-      edgeLabel = e.group(2)
-      if inParent:
-        assert(currNode != None)
-        assert(childField != None)
-        if edgeLabel != childField:
-          continue
-        domChild = merge.get(target, target)
-        if not domChild in parentsOfDOM:
-          parentsOfDOM[domChild] = {}
-        if not parentClass in parentsOfDOM[domChild]:
-          parentsOfDOM[domChild][parentClass] = []
-        parentsOfDOM[domChild][parentClass].append(currNode)
-        inParent = False
-      elif edgeLabel == '[via hash] mListenerManager':
-        assert(currNode != None)
-        domParent = merge.get(currNode, currNode)
-        # will have to do something else if we generalize this
-        if not domParent in childrenOfDOM:
-          childrenOfDOM[domParent] = []
-        childrenOfDOM[domParent].append(target)
-    else:
-      nm = nodePatt.match(l)
-      if nm:
-        currNode = nm.group(1)
-        currNodeLabel = nm.group(2)
-        if currNodeLabel == 'nsDOMCSSAttributeDeclaration':
-          inParent = True
-          parentClass = 'nsDOMCSSAttributeDeclaration'
-          childField = 'mElement'
-          continue
-        if currNodeLabel.startswith('XPCWrappedNative'):
-          inParent = True
-          parentClass = 'XPCWrappedNative'
-          childField = 'mIdentity'
-          continue
-        inParent = False
-        if currNodeLabel == 'nsEventListenerManager':
-          possibleChildren.add(currNode)
-
-      elif l.startswith('=========='):
-        break
-      elif l.startswith('#'):
-        # skip comments
-        continue
-      else:
-        wmem = weakMapEntryPatt.match(l)
-        if wmem:
-          # ignore weak map entries
-          continue
-        else:
-          sys.stderr.write('Error: Unknown line in mergeDOMParents: ' + l[:-1] + '\n')
+  for (x, target) in listenerEdges:
+    childrenOfDOM.setdefault(uf.top(x), []).append(target)
 
   # print out parent merging information
   for m in parentsOfDOM.values():
     for l in m.values():
-      print l[0],
-      for y in l:
-        print y,
-      print
+      print(names[l[0]], ' '.join([names[y] for y in l]))
 
   # print out child
-  elmCounts = 0
-  for x, l in childrenOfDOM.iteritems():
-    foundAny = False
-    assert(len(l) != 0)
+  for x, l in childrenOfDOM.items():
     if len(l) == 1:
       continue
-    for y in l:
-      if y in possibleChildren:
-        foundAny = True
-        elmCounts += 1
-        print y,
-    if foundAny:
-      print
+    found = [names[y] for y in l if y in possibleChildren]
+    if found:
+      print(' '.join(found))
+
 
+def parseFile ():
+  args = argparser.parse_args()
 
-def parseFile (fname):
   try:
-    f = open(fname, 'r')
+    f = open(args.file_name, 'r')
   except:
-    sys.stderr.write('Error opening file' + fname + '\n')
+    sys.stderr.write('Error opening file' + args.file_name + '\n')
     exit(-1)
 
-  trees = parseGraph(f)
+  groupDOMs(args, f)
   f.close()
 
-  if printMergingInformation:
-    f = open(fname, 'r')
-    mergeDOMParents(f, trees)
-    f.close()
-
 
-parseFile(sys.argv[1])
+if __name__ == "__main__":
+  parseFile()
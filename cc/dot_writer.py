@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Library for writing .dot files one component at a time.
+#
+# DotWriter writes each component to the output file as soon as the
+# caller produces it, so nothing about the output is held in memory.
+# It can also keep the output small enough for graphviz to lay out:
+#
+#   - maxNodes and maxEdges are a budget for the whole output.  A
+#     component that doesn't fit into what is left of the budget is
+#     skipped, but later, smaller components may still be written.
+#
+#   - shardNodes is the most nodes to put into a single file.  When a
+#     component doesn't fit into the current file, a new file is
+#     started.  The first file is baseName + '.dot', and the ones after
+#     it are baseName + '.1.dot', baseName + '.2.dot' and so on.  Each
+#     file is a complete graph that starts with the same header, so the
+#     files can be laid out separately.  A component is never split
+#     between files, so a file can have more than shardNodes nodes if
+#     a single component does.
+#
+#   A limit of -1 means there is no limit.
+#
+# Which components are kept when the budget runs out depends on the
+# order they are written in.  orderComponents sorts components for one
+# of the SELECT_MODES:
+#
+#   - 'order' leaves them in the order they were given.
+#   - 'largest' puts the biggest first, so the budget is spent on the
+#     top-K components by size.
+#   - 'sample' shuffles them by a hash of their names, so a budget
+#     gives the same sample of the components every time.
+
+
+import sys
+import zlib
+
+
+SELECT_MODES = ['order', 'largest', 'sample']
+
+
+class DotWriter:
+  # header is written at the start of every file, and must open the
+  # graph, for instance with 'digraph {\n'.
+  def __init__(self, baseName, header, maxNodes=-1, maxEdges=-1, shardNodes=-1):
+    self.baseName = baseName
+    self.header = header
+    self.maxNodes = maxNodes
+    self.maxEdges = maxEdges
+    self.shardNodes = shardNodes
+
+    self.fileNames = []
+    self.outf = None
+    self.shardNumNodes = 0
+
+    self.numNodes = 0
+    self.numEdges = 0
+    self.numWritten = 0
+    self.numSkipped = 0
+
+  def newShard(self):
+    self.closeShard()
+    if self.fileNames:
+      fname = '{0}.{1}.dot'.format(self.baseName, len(self.fileNames))
+    else:
+      fname = self.baseName + '.dot'
+    self.fileNames.append(fname)
+    self.outf = open(fname, 'w')
+    self.outf.write(self.header)
+    self.shardNumNodes = 0
+
+  def closeShard(self):
+    if self.outf:
+      self.outf.write('}\n')
+      self.outf.close()
+      self.outf = None
+
+  # The index of the file being written, which changes when a new
+  # file is started.
+  def shard(self):
+    return len(self.fileNames) - 1
+
+  # Start a component with the given number of nodes and edges.
+  # Returns False if it doesn't fit into the budget, in which case
+  # nothing should be written for it.  Otherwise, the component is
+  # written with write().
+  def beginComponent(self, numNodes, numEdges):
+    if (self.maxNodes != -1 and self.numNodes + numNodes > self.maxNodes) or \
+          (self.maxEdges != -1 and self.numEdges + numEdges > self.maxEdges):
+      self.numSkipped += 1
+      return False
+
+    if self.outf is None or \
+          (self.shardNodes != -1 and self.shardNumNodes != 0 and
+           self.shardNumNodes + numNodes > self.shardNodes):
+      self.newShard()
+
+    self.numNodes += numNodes
+    self.numEdges += numEdges
+    self.shardNumNodes += numNodes
+    self.numWritten += 1
+    return True
+
+  def write(self, s):
+    self.outf.write(s)
+
+  def close(self):
+    if self.outf is None and not self.fileNames:
+      self.newShard()
+    self.closeShard()
+
+  def printSummary(self):
+    sys.stderr.write('Wrote {0} nodes and {1} edges to {2}.\n'.format(self.numNodes, self.numEdges,
+                                                                     ', '.join(self.fileNames)))
+    if self.numSkipped != 0:
+      sys.stderr.write('Skipped {0} of {1} components that did not fit into the budget.\n'.format(
+        self.numSkipped, self.numSkipped + self.numWritten))
+
+
+# Return the list of components in the order given by select.  size
+# and name are functions that return the size and the name of a
+# component.
+def orderComponents (comps, size, name, select):
+  if select == 'largest':
+    return sorted(comps, key=lambda c: -size(c))
+  elif select == 'sample':
+    return sorted(comps, key=lambda c: zlib.crc32(name(c).encode()))
+  assert(select == 'order')
+  return comps
@@ -1,4 +1,4 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
@@ -6,9 +6,15 @@
 
 import sys
 import re
+import argparse
+import multiprocessing
+from array import array
 from collections import namedtuple
-import parse_cc_graph
-from optparse import OptionParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from . import parse_cc_graph
+from . import dot_writer
+from . import chain_compress
+from . import csr_graph
 
 
 
@@ -30,85 +36,121 @@ from optparse import OptionParser
 # Circles are refcounted DOM nodes, squares are GCed JS nodes,
 # triangles are objects the CC has identified as garbage.
 
+# With --jobs, the disconnected components of the graph are analyzed
+# in a pool of processes.  The output is the same as without it.
+
 
 
 
 ### Display options
 
 
-usage = "usage: %prog [options] file_name\n\
-  file_name is the name of the cycle collector graph file"
-parser = OptionParser(usage=usage)
+parser = argparse.ArgumentParser(description='Convert a cycle collector graph file into a .dot file.')
+
+parser.add_argument('file_name',
+                    help='cycle collector graph file name')
+
+parser.add_argument('--min',
+                    dest='min_graph_size', type=int,
+                    default=0,
+                    help='minimum size of subgraph to display')
+
+parser.add_argument('--max',
+                    dest='max_graph_size', type=int,
+                    default=-1,
+                    help='maximum size of subgraph to display')
+
+parser.add_argument('--show-labels',
+                    action='store_true', dest='node_class_labels',
+                    help='show labels of nodes')
+
+parser.add_argument('--show-edge-labels',
+                    action='store_true', dest='edge_labels',
+                    help='show labels of nodes')
+
+parser.add_argument('--show-addresses',
+                    action='store_true', dest='node_address_labels',
+                    help='show addresses of nodes')
 
-parser.add_option('--min',
-                  action='store', dest='min_graph_size', type='int',
-                  default=0,
-                  help='minimum size of subgraph to display')
+parser.add_argument('--html-labels',
+                    action='store_true', dest='html_labels',
+                    help='show tag labels for nsGenericElement (xhtml) nodes')
 
-parser.add_option('--max',
-                  action='store', dest='max_graph_size', type='int',
-                  default=-1,
-                  help='maximum size of subgraph to display')
+parser.add_argument('--prune-js',
+                    action='store_true', dest='prune_js',
+                    help='prune JS nodes from the graph')
 
-parser.add_option('--show-labels',
-                  action='store_true', dest='node_class_labels',
-                  help='show labels of nodes')
+parser.add_argument('--prune-non-js',
+                    action='store_true', dest='prune_non_js',
+                    help='prune non-JS nodes from the graph')
 
-parser.add_option('--show-edge-labels',
-                  action='store_true', dest='edge_labels',
-                  help='show labels of nodes')
+parser.add_argument('--prune-non-js-border',
+                    action='store_true', dest='prune_non_js_border',
+                    help='prune non-JS, non-border nodes from the graph')
 
-parser.add_option('--show-addresses',
-                  action='store_true', dest='node_address_labels',
-                  help='show addresses of nodes')
+parser.add_argument('--prune-marked-js',
+                    action='store_true', dest='prune_marked_js',
+                    help='prune marked JS nodes from the graph')
 
-parser.add_option('--html-labels',
-                  action='store_true', dest='html_labels',
-                  help='show tag labels for nsGenericElement (xhtml) nodes')
+parser.add_argument('--prune-green-js',
+                    action='store_true', dest='prune_green_js',
+                    help='prune JS nodes that don\'t reach non-JS nodes from the graph')
 
-parser.add_option('--prune-js',
-                  action='store_true', dest='prune_js',
-                  help='prune JS nodes from the graph')
+parser.add_argument('--prune-garbage',
+                    action='store_true', dest='prune_garbage',
+                    help='prune garbage nodes from the graph')
 
-parser.add_option('--prune-non-js',
-                  action='store_true', dest='prune_non_js',
-                  help='prune non-JS nodes from the graph')
+parser.add_argument('--no-info-parent-prune',
+                    action='store_true', dest='no_info_parent_prune',
+                    help='don\'t prune nsNodeInfo and GetParent() edges from the graph')
 
-parser.add_option('--prune-non-js-border',
-                  action='store_true', dest='prune_non_js_border',
-                  help='prune non-JS, non-border nodes from the graph')
+parser.add_argument('--merge-file',
+                    action='store_true', dest='merge_file',
+                    help='Reading merging information from a file')
 
-parser.add_option('--prune-marked-js',
-                  action='store_true', dest='prune_marked_js',
-                  help='prune marked JS nodes from the graph')
+parser.add_argument('--min-copies',
+                    dest='min_copies', type=int,
+                    default=0,
+                    help='only display subgraphs with at least this many copies')
 
-parser.add_option('--prune-garbage',
-                  action='store_true', dest='prune_garbage',
-                  help='prune garbage nodes from the graph')
+parser.add_argument('--merge-js',
+                    action='store_true', dest='merge_js',
+                    help='merge JS in strongly connected components')
 
-parser.add_option('--no-info-parent-prune',
-                  action='store_true', dest='no_info_parent_prune',
-                  help='don\'t prune nsNodeInfo and GetParent() edges from the graph')
+parser.add_argument('--no-merge-larger',
+                    action='store_true', dest='no_merge_larger',
+                    help='don\'t combine identical looking subgraphs with more than three nodes')
 
-parser.add_option('--merge-file',
-                  action='store_true', dest='merge_file',
-                  help='Reading merging information from a file')
+parser.add_argument('--compress',
+                    action='store_true', dest='compress',
+                    help='collapse chains of nodes with one parent and one child into a single bold edge labeled with the number of nodes, and children of a node that look the same and have no children into one node labeled with the count')
 
-parser.add_option('--min-copies',
-                  action='store', dest='min_copies', type='int',
-                  default=0,
-                  help='only display subgraphs with at least this many copies')
+parser.add_argument('--max-nodes',
+                    dest='max_nodes', type=int,
+                    default=-1,
+                    help='most nodes to write out, skipping subgraphs that don\'t fit')
 
-parser.add_option('--merge-js',
-                  action='store_true', dest='merge_js',
-                  help='merge JS in strongly connected components')
+parser.add_argument('--max-edges',
+                    dest='max_edges', type=int,
+                    default=-1,
+                    help='most edges to write out, skipping subgraphs that don\'t fit')
 
-options, args = parser.parse_args()
+parser.add_argument('--shard-nodes',
+                    dest='shard_nodes', type=int,
+                    default=-1,
+                    help='split the output into .dot files with at most this many nodes each')
 
+parser.add_argument('--select',
+                    dest='select', choices=dot_writer.SELECT_MODES,
+                    default='order',
+                    help='order to write subgraphs in, which decides which are kept by --max-nodes and --max-edges: in order, largest first, or a deterministic sample')
 
-if len(sys.argv) < 2:
-  print 'Not enough arguments.  Run with --help for help.'
-  exit()
+parser.add_argument('--jobs', '-j', dest='jobs', type=int,
+                    default=1,
+                    help='Number of processes to use to analyze the components of the graph, where processes can be forked. Defaults to 1.')
+
+# set by dotify()
+options = None
 
 
 
@@ -136,7 +178,6 @@ print_all_tris = False
 
 COMPUTE_ACYCLIC = False   # compute set of nodes that are not members of cycles
 REMOVE_ACYCLIC = False    # remove acyclic nodes.  if False, then just highlight them on the graph.
-#ACYCLIC_DEPTH = 3         # one of the acyclic algorithms only works to a fixed depth
 
 # This gets rid of a lot of boring parts of the graph, so it can be handy for browsing.
 CALC_DUPS = True       # find JS nodes that duplicate other nodes (eg have same parents and children)
@@ -146,7 +187,7 @@ REMOVE_DUPS = False     # remove duplicates.  If False, highlight them on the gr
 ####################
 
 
-DrawAttribs = namedtuple('DrawAttribs', 'edgeLabels nodeLabels rcNodes gcNodes roots garbage colors mergeCounts')
+DrawAttribs = namedtuple('DrawAttribs', 'edgeLabels nodeLabels rcNodes gcNodes roots garbage colors mergeCounts shadies')
 
 
 ####
@@ -157,7 +198,7 @@ DrawAttribs = namedtuple('DrawAttribs', 'edgeLabels nodeLabels rcNodes gcNodes r
 # compute set of source and target nodes
 def graph_nodes (g):
   nodes = set([])
-  for src, edges in g.iteritems():
+  for src, edges in g.items():
     nodes |= set([src])
     nodes |= edges
   return nodes
@@ -170,7 +211,7 @@ def graph_counts (g):
   num_edges = 0
   srcs = set([])
   dsts = set([])
-  for src, edges in g.iteritems():
+  for src, edges in g.items():
     num_edges += len(edges)
     if len(edges) != 0:
       srcs |= set([src])
@@ -179,82 +220,68 @@ def graph_counts (g):
 
 
 # counting the acyclicity ranks of nodes  (see bug 641243)
-
-def get_rank_0 (g):
-  c = graph_counts(g)
-  return graph_nodes(g) - c[1]
-
-def get_rank_k (g, kprev):
-  s = set([])
-  for src, edges in g.iteritems():
-    all_prev = True
-    for e in edges:
-      if not e in kprev:
-        all_prev = False
-        break
-    if all_prev:
-      s |= set([src])
-  return s
-
-
-# compute and print out acyclic nodes
+#
+# Nodes with no successors have rank 0, and a node whose successors all
+# have ranks has the rank one more than the largest of them.  Nodes that
+# can reach a cycle don't have a rank.
+#
+# The ranks are computed by peeling: every node starts with a count of
+# its successors, and when a node gets its rank, the count of each of
+# its predecessors goes down by one.  A node gets its rank when its
+# count reaches zero.  This looks at each edge once, on integer arrays.
+
+def acyclic_ranks (g):
+  (names, ids, offsets, targets) = csr_graph.fromDictGraph(g)
+  numIds = len(names)
+  (revOffsets, sources, _) = csr_graph.transpose(numIds, offsets, targets)
+
+  counts = array('i', [offsets[x + 1] - offsets[x] for x in range(numIds)])
+  ranks = array('i', [-1]) * numIds
+  work_list = [x for x in range(numIds) if counts[x] == 0]
+  for x in work_list:
+    ranks[x] = 0
+
+  while work_list:
+    x = work_list.pop()
+    r = ranks[x] + 1
+    for j in range(revOffsets[x], revOffsets[x + 1]):
+      y = sources[j]
+      if ranks[y] < r:
+        ranks[y] = r
+      counts[y] -= 1
+      if counts[y] == 0:
+        work_list.append(y)
+
+  return dict([(names[x], ranks[x]) for x in range(numIds) if counts[x] == 0])
+
+
+# compute and print out acyclic nodes, up to rank k.  If k is None,
+# all acyclic nodes are returned.
 def compute_acyclic (g, k, ga):
   num_nodes = len(graph_nodes(g))
   sys.stdout.write('total number of nodes is {0}.\n'.format(num_nodes))
 
-  rnks = get_rank_0(g)
-
-  prev_len = 0
-  for x in range(k):
-    l = len(rnks)
-    #sys.stdout.write('{0},{1}\n'.format(x, l))
-    sys.stdout.write('|acyc_{0}| = {1} / {2}  /  {3}%\n'.format(x, l, l - prev_len, (100 * l)/num_nodes))
-    prev_len = l
-    rnks = get_rank_k(g, rnks)
+  lrnks = acyclic_ranks(g)
 
-  return rnks
+  rank_counts = {}
+  for r in lrnks.values():
+    rank_counts[r] = rank_counts.get(r, 0) + 1
+  max_rank = max(rank_counts.keys()) if rank_counts else -1
+  if k is None:
+    k = max_rank
 
+  l = 0
+  for x in range(min(k, max_rank) + 1):
+    n = rank_counts.get(x, 0)
+    l += n
+    sys.stdout.write('|acyc_{0}| = {1} / {2}  /  {3}%\n'.format(x, l, n, (100 * l) // max(num_nodes, 1)))
 
-  # analyze zero-successor nodes
-  #zero_counts = {}
-  #s = set(['nsDocument', 'nsGenericDOMDataNode', 'nsGenericElement', 'nsDOMAttribute'])
-  #for z in rnks:
-  #  if z in ga.node_names and (not z in ga.roots or z in ga.black_rced):
-  #    v = zero_counts.pop(ga.node_names[z], 0) + 1
-  #    zero_counts[ga.node_names[z]] = v
-  #total1 = 0
-  #total2 = 0
-  #for n, c in zero_counts.iteritems():
-  #  print c, n
-  #  if n in s:
-  #    total1 += c
-  #  else:
-  #    total2 += c
-
-  print 'zero covered:', total1, (100 * total1 / (total1 + total2)), '%'
-
-
-# compute and print out acyclic nodes, but separate ranks
-def compute_acyclic_sep (g, k):
-  lrnks = {}
-  rnks = get_rank_0(g)
-  curr_rank = 0
-  for x in rnks:
-    lrnks[x] = curr_rank
-
-  for x in range(k):
-    rnks = get_rank_k(g, rnks)
-    curr_rank += 1
-    for x in rnks:
-      if not x in lrnks:
-        lrnks[x] = curr_rank
-
-  return lrnks
+  return set([x for x, r in lrnks.items() if r <= k])
 
 
 def remove_nodes (g, s):
   ng = {}
-  for src, edges in g.iteritems():
+  for src, edges in g.items():
     if not src in s:
       ng[src] = edges - s
   return ng
@@ -280,205 +307,52 @@ def calc_tiny_loops (g, s):
   return tiny_mems
 
 
-# Generate inverse of graph: if a points to b in the graph, then in the inverse b points to a.
-def graph_inverse (g):
-  ng = {}
-  for x, edges in g.iteritems():
-    for e in edges:
-      s = ng.pop(e, set([]))
-      s |= set([x])
-      ng[e] = s
-  return ng
-
-
 # If a and b have the same parents and successors, and they are both
-# GCed we can remove one of them from the graph
+# GCed we can remove one of them from the graph.
+#
+# The signature of a GC node is its sorted successor ids, its sorted
+# predecessor ids and whether it is marked, in a CSR copy of the graph.
+# Only the 64-bit hash of the signature is kept for each node, and
+# signatures are only compared exactly when two nodes have the same
+# hash.  The first node with a given signature is kept.
 def calc_dups (g, ga):
-  gn = graph_nodes(g)
-  gnodes = gn & ga.black_gced
-  ginv = graph_inverse(g)
-  eq_nodes = {}
-  for x in gnodes:
-    if x in ginv:
-      ki = ginv[x]
-    else:
-      ki = set([])
+  (names, ids, offsets, targets) = csr_graph.fromDictGraph(g)
+  (revOffsets, sources, _) = csr_graph.transpose(len(names), offsets, targets)
 
-    k = (frozenset(g[x]), frozenset(ki))
-    s = eq_nodes.pop(k, set([]))
-    eq_nodes[k] = s | set([x])
+  def signature (x):
+    succs = tuple(sorted(set(targets[offsets[x]:offsets[x + 1]])))
+    preds = tuple(sorted(set(sources[revOffsets[x]:revOffsets[x + 1]])))
+    return (succs, preds, ga.gcNodes[names[x]])
 
+  firsts = {}
+  exact = {}
   dups = set([])
-  for s in eq_nodes.values():
-    dups |= s - set([set_select(s)])
+  for x in range(len(names)):
+    if not names[x] in ga.gcNodes:
+      continue
+    sig = signature(x)
+    digest = hash(sig)
+    y = firsts.setdefault(digest, x)
+    if y == x:
+      continue
+    if not digest in exact:
+      exact[digest] = {signature(y): y}
+    if sig in exact[digest]:
+      dups.add(names[x])
+    else:
+      exact[digest][sig] = x
 
-  print len(dups), '/', len(gn), 'duplicate nodes (', (100 * len(dups) / len(gn)), '%)'
+  print(len(dups), '/', len(names), 'duplicate nodes (', (100 * len(dups) // max(len(names), 1)), '%)')
 
   return dups
 
 
 
-# Calculate acyclic nodes in a lower level way.
-
-
-def calc_acyc_dfs_rec (g, n, nodes, ng, has_children):
-  if n in has_children:
-    return has_children[n]
-  if n in nodes:
-    return True
-  nodes.append(n)
-  n_has_children = False
-
-  if n in g:
-    for e in g[n]:
-      eacyc = calc_acyc_dfs_rec (g, e, nodes, ng, has_children)
-      n_has_children |= eacyc
-      if not eacyc:
-        s = ng.pop(n, set([]))
-        ng[n] = s | set([e])
-
-  has_children[n] = n_has_children
-  nodes.pop()
-  return n_has_children
-
-
-def calc_acyc_dfs (g):
-  nodes = []
-  ng = {}
-  has_children = {}
-  for x in g.keys():
-    calc_acyc_dfs_rec (g, x, nodes, ng, has_children)
-
-  pruned = set([])
-  for x, hc in has_children.iteritems():
-    if not hc:
-      pruned |= set([x])
-
-  print 'Found', len(pruned), ' acyclic nodes.'
-  return pruned
-
-
-# acyc with edge pooling
-
-def calc_acyc_dfs_rec2 (g, n, edges, ng, has_children):
-  if n in has_children:
-    return 0
-  has_children[n] = True   # temp value to prevent loops
-  num_children = 0
-
-  if n in g:
-    for e in g[n]:
-      num_gchildren = calc_acyc_dfs_rec2 (g, e, edges, ng, has_children)
-      child_interesting = has_children[e]
-      if child_interesting:
-        num_children += 1
-        edges.append(e)
-
-  n_edges = set([])
-  for i in range(num_children):
-    n_edges |= set([edges.pop()])
-  if num_children != 0:
-    ng[n] = n_edges
-
-  has_children[n] = num_children != 0
-  return num_children
-
-
-def calc_acyc_dfs2 (g):
-  depth = 0
-  edges = []
-  ng = {}
-  has_children = {}
-  for x in g.keys():
-    calc_acyc_dfs_rec2 (g, x, edges, ng, has_children)
-  assert (edges == [])
-  pruned = set([])
-  for x, hc in has_children.iteritems():
-    if not hc:
-      pruned |= set([x])
-
-  print 'Found', len(pruned), 'acyclic nodes.'
-  return pruned
-
-
-
-def commit_edges (g, edges, n, num_children):
-  if num_children == 0:
-    return
-  n_edges = set([])
-  for i in range(num_children):
-    n_edges |= set([edges.pop()])
-  g[n] = n_edges
-
-
-
-# Compute acyclic and chained nodes.
-
-def calc_acyc_dfs_rec3 (g, ch, n, edges, ng, has_children):
-  if n in has_children:
-    return 0
-  has_children[n] = True   # temp value to prevent loops
-  num_children = 0
-
-  if n in g:
-    for e in g[n]:
-      num_inherit = calc_acyc_dfs_rec3 (g, ch, e, edges, ng, has_children)
-      if has_children[e]:
-        assert(num_inherit == 0)
-        num_children += 1
-        edges.append(e)
-      else:
-        num_children += num_inherit
-
-  if n in ch:
-    has_children[n] = False
-    return num_children
-  else:
-    commit_edges(ng, edges, n, num_children)
-    has_children[n] = num_children != 0
-    return 0
-
-
-def one_parent_rc_nodes (g, ga):
-  rc = computeRefCounts(g)
-  # this computes the ref count from the graph, but we also don't
-  # includes roots (which the CC has decided has external refs, so it
-  # is a bit circular in terms of reasoning, but should simulate
-  # external refs.
-
-  s = set([])
-  for x in g.keys():
-    if x in rc and rc[x] == 1 and not x in ga.black_gced and not x in ga.roots:
-      s |= set([x])
-  return s
-
-def calc_acyc_dfs3 (g, ga):
-  edges = []
-  ng = {}
-  has_children = {}
-  ch = one_parent_rc_nodes(g, ga)
-
-  for x in g.keys():
-    calc_acyc_dfs_rec3 (g, ch, x, edges, ng, has_children)
-    # commit any remaining edges
-    if len(edges) != 0:
-      has_children[x] = True
-      commit_edges(ng, edges, x, len(edges))
-
-  pruned = set([])
-  for x, hc in has_children.iteritems():
-    if not hc:
-      pruned |= set([x])
-
-  print 'Found', len(pruned), 'acyclic and chained nodes.'
-  return pruned
-
-
 def paths_to (g, leak):
   work_list = set([leak])
   wlen = 1
   parents = set([leak])
-  ginv = graph_inverse(g)
+  ginv = csr_graph.reverseDictGraph(g)
 
   while (wlen != 0):
     x = set_select(work_list)
@@ -538,17 +412,17 @@ def ok_js_merge (ga, x):
 
 
     # only merge if both are GCed
-def merge_map_lookup (m, x):
+def merge_map_lookup (m, x, ga):
   if x in m and x in ga.gcNodes and m[x] in ga.gcNodes:
     return m[x]
   else:
     return x
 
 
-def calc_loopynodes (m):
+def calc_loopynodes (m, ga):
   loopynodes = set([])
   for x in m.keys():
-    if merge_map_lookup(m, x) != x:
+    if merge_map_lookup(m, x, ga) != x:
       loopynodes.add(x)
   return loopynodes
 
@@ -556,8 +430,8 @@ def calc_loopynodes (m):
 
 def merge_nodes (g):
   ng = {}
-  for x, edges in g.iteritems():
-    x2 = merge_map_lookup(m, x)
+  for x, edges in g.items():
+    x2 = merge_map_lookup(m, x, ga)
 
     # if the node being merged away is a root, make the survivor a root
     if x in ga.roots and not x2 in ga.roots:
@@ -566,7 +440,7 @@ def merge_nodes (g):
     edges2 = ng.pop(x2, set([]))
     ne = set([])
     for e in edges:
-      ne.add(merge_map_lookup(m, e))
+      ne.add(merge_map_lookup(m, e, ga))
 
     ng[x2] = ne | edges2
 
@@ -600,21 +474,21 @@ def merginator(g, ga):
   #assert (m == calc_scc2(g, ga))
   #check_scc_map (g, ga, m)
 
-  loopynodes = calc_loopynodes(m)
+  loopynodes = calc_loopynodes(m, ga)
   gn = graph_nodes(g)
   gOrigLen = len(gn)
   #print 'approx num JS nodes:', len(gn - ga.black_rced)
   sys.stdout.write('EXPERIMENTAL AND WRONG: found {0} out of {1} ({2}%) nodes in SCCs.\n'.format( \
-    len(loopynodes), gOrigLen, 100 * len(loopynodes) / gOrigLen))
+    len(loopynodes), gOrigLen, 100 * len(loopynodes) // gOrigLen))
 
   if False:
-    print '(marking)'
+    print('(marking)')
     ga = ga._replace(shadies = loopynodes)
   else:
-    print 'EXPERIMENTAL AND WRONG (merging nodes)'
+    print('EXPERIMENTAL AND WRONG (merging nodes)')
     ng = {}
-    for x, edges in g.iteritems():
-      x2 = merge_map_lookup(m, x)
+    for x, edges in g.items():
+      x2 = merge_map_lookup(m, x, ga)
 
       # ideally, if node being merged away is a root, should make the
       # survivor a root.
@@ -622,7 +496,7 @@ def merginator(g, ga):
       edges2 = ng.pop(x2, set([]))
       ne = set([])
       for e in edges:
-        ne.add(merge_map_lookup(m, e))
+        ne.add(merge_map_lookup(m, e, ga))
 
       ng[x2] = ne | edges2
 
@@ -678,25 +552,25 @@ def calc_scc1 (g):
 
 
 def check_scc_map (g, ga, m):
-  print 'Checking scc results:',
+  print('Checking scc results:', end=' ')
   sccs = calc_scc1(g)
   fwdMap = {}
 
-  for x, v1 in sccs.iteritems():
+  for x, v1 in sccs.items():
     if v1 in fwdMap:
       if fwdMap[v1] != m[x]:
-        print 'WRONG!'
+        print('WRONG!')
         exit(-1)
     else:
       fwdMap[v1] = m[x]
 
   assert(len(fwdMap.keys()) == len(fwdMap.values()))
 
-  print 'ok.'
+  print('ok.')
 
   # take a census of the non-trivial SCCs
   s = {}
-  for x, v in m.iteritems():
+  for x, v in m.items():
     z = s.pop(v, set([]))
     assert(not x in z)
     z.add(x)
@@ -754,10 +628,10 @@ def check_scc_map (g, ga, m):
       elif x in ga.black_gced:
         sccsum['gc'] += 1
       else:
-        print 'Did not expect garbage in a mixed SCC.'
+        print('Did not expect garbage in a mixed SCC.')
         exit(-1)
     total = sccsum['gc'] + sccsum['rc']
-    print (100 * sccsum['gc'] / total), '% out of', total, '((rc=', sccsum['rc']
+    print((100 * sccsum['gc'] // total), '% out of', total, '((rc=', sccsum['rc'])
 
 
 
@@ -831,10 +705,10 @@ def calc_scc2 (g, ga):
               else:
                 controlStack.append(w)
 
-  print 'Grandchild analysis'
-  print '  unvisited grandchildren:', unvisitedGrandchildren
-  print '  open grandchildren', openGrandchildren
-  print '  closed grandchildren', closedGrandchildren
+  print('Grandchild analysis')
+  print('  unvisited grandchildren:', unvisitedGrandchildren)
+  print('  open grandchildren', openGrandchildren)
+  print('  closed grandchildren', closedGrandchildren)
 
   return m
 
@@ -961,7 +835,7 @@ def calc_scc (g, ga):
 
   # convert nodeState to a merge map
   m = {}
-  for n, ns in nodeState.iteritems():
+  for n, ns in nodeState.items():
     assert(not ns[0])
     m[n] = ns[1]
 
@@ -1199,18 +1073,18 @@ def calc_scc_merge (g, ga):
 def split_graph (g):
   m = {}
 
-  for src, edges in g.iteritems():
+  for src, edges in g.items():
     for dst in edges:
       union (m, src, dst)
 
   gg = {}
-  for src, edges in g.iteritems():
+  for src, edges in g.items():
     src2 = find(m, src)
     gg2 = gg.pop(src2, {})
     gg2[src] = g[src]
     gg[src2] = gg2
 
-  return gg.values()
+  return list(gg.values())
 
 
 # node_format_string computes the string used to describe a node: By
@@ -1259,8 +1133,7 @@ def node_format_string (x, ga):
   s = ''
 
   # style
-  #if x in ga.shadies or (x in ga.roots and show_roots):
-  if x in ga.roots and show_roots:
+  if x in ga.shadies or (x in ga.roots and show_roots):
     s += 'style=filled, '
 
   l = node_label_string(x, ga)
@@ -1281,7 +1154,7 @@ def node_format_string (x, ga):
       shape = 'circle'
   else:
     if not x in ga.gcNodes:
-      print x, "not found in gcNodes!"
+      print(x, "not found in gcNodes!")
       exit(-1)
     if x in ga.garbage:
       shape = 'box' # 'invtriangle'
@@ -1301,16 +1174,28 @@ def gnodes (g):
 # For all graphs of size 1 and 2, and some of size 3, we aggregate
 # graphs that will be displayed identically (except I think for edge
 # names, which we ignore).
+# Any other graphs are aggregated by analyze_wl_graph, unless
+# --no-merge-larger is passed.
 
 
-# Analyze a graph of size 1.
+# The analyze functions compute the key a graph is combined on.  Graphs
+# with the same key are displayed identically.  The keys only depend
+# on the graph and the draw attributes of its nodes, so they can be
+# computed in a different process than the one that combines them.
+
 
-def analyze_1_graph (x, solo_graphs, ga):
-  z = x.keys()[0]
-  p = (len(x[z]), node_format_string (z, ga))
-  l = solo_graphs.pop(p, [])
+# push a graph onto a combiner at a key
+def add_to_combiner (combiner, key, x):
+  l = combiner.pop(key, [])
   l.append(x)
-  solo_graphs[p] = l
+  combiner[key] = l
+
+
+# Analyze a graph of size 1.
+
+def analyze_1_graph (x, ga):
+  z = list(x.keys())[0]
+  return (len(x[z]), node_format_string (z, ga))
 
 
 # turn a set of edges into a unique key
@@ -1318,19 +1203,15 @@ def set_to_type_list (s, ga):
   l = []
   for x in s:
     l.append(x)
-  l = map(lambda x: node_format_string (x, ga), l)
+  l = [node_format_string (x, ga) for x in l]
   l.sort()
   return tuple(l)
 
 
 # Analyze a graph with two nodes.
-def analyze_2_graph(x, pair_graphs, ga):
+def analyze_2_graph(x, ga):
   c = graph_counts(x)
-  p = (c[0], set_to_type_list(c[1], ga), set_to_type_list(c[2], ga))
-  l = pair_graphs.pop(p, [])
-  l.append(x)
-  pair_graphs[p] = l
-  return True
+  return (c[0], set_to_type_list(c[1], ga), set_to_type_list(c[2], ga))
 
 
 # In a simple loop a -> b, b -> c, c -> a, choose the
@@ -1343,23 +1224,17 @@ def pure_cycle_head (nn, ga):
   return l[0]
 
 # Combine graphs with three nodes.  Unlike for 1 and 2, this is not
-# complete: we just cover a few common cases.  We return True if we've
-# classified the graph and added it to tri_graphs, otherwise return
-# False so it can get added to the default case.
-def analyze_3_graph (g, tri_graphs, ga):
+# complete: we just cover a few common cases.  We return the key if
+# we've classified the graph, otherwise return None so it can get
+# added to the default case.
+def analyze_3_graph (g, ga):
   c = graph_counts(g)
   if c[0] == 2:
     # only 2 edges
     hd = set_to_type_list(c[1] - c[2], ga)  # source, but not dest, of edges
     mid = set_to_type_list(c[1] & c[2], ga) # source and dest of edges
     tl = set_to_type_list(c[2] - c[1], ga) # dest but not source of edges
-    # create key
-    gt = (2, hd, mid, tl)
-    # push current graph onto combiner at key
-    gsub = tri_graphs.pop(gt, [])
-    gsub.append(g)
-    tri_graphs[gt] = gsub
-    return True
+    return (2, hd, mid, tl)
   elif c[0] == 3 and len(c[1]) == 3 and len(c[2]) == 3:
     # must be a pure cycle: select the node with the 'least' type
     # as the first part of the key, then the successor node,
@@ -1367,14 +1242,10 @@ def analyze_3_graph (g, tri_graphs, ga):
     hd = pure_cycle_head(c[2], ga)
     mid = set_select(g[hd])
     tl = set_select(g[mid])
-    gt = (3, node_format_string(hd, ga),
-          node_format_string(mid, ga), node_format_string(tl, ga))
-    gsub = tri_graphs.pop(gt, [])
-    gsub.append(g)
-    tri_graphs[gt] = gsub
-    return True
+    return (3, node_format_string(hd, ga),
+            node_format_string(mid, ga), node_format_string(tl, ga))
   else:
-    return False
+    return None
 
 
 # only pass in things with 11 nodes
@@ -1418,6 +1289,75 @@ def analyze_death_star (g, death_stars, ga):
 
 
 
+# Combine graphs of any size that look the same, using Weisfeiler-Lehman
+# label refinement.  This is done in two steps.
+#
+# analyze_wl_shape computes a cheap key from the number of nodes and
+# edges and the sorted node_format_string of the nodes.  Most big
+# graphs have a key no other graph has, and can't be combined, so only
+# graphs that share a key with another graph go through the second
+# step.
+#
+# analyze_wl_graph does the refinement.  Each node starts out colored
+# by its node_format_string, so graphs are only combined if their
+# nodes are displayed the same.  In each round, the color of a node is
+# replaced by a hash of its color and the sorted colors of its
+# successors and predecessors, along with the displayed edge labels.
+# This stops when a round doesn't split any color class, or after
+# WL_MAX_ROUNDS rounds, so long chains don't take quadratic time.  The
+# key is a hash of the sorted final colors.  The hashes are only
+# compared within a run, and workers are forked from the main process,
+# so the built in hash is good enough.
+#
+# Graphs with the same key are isomorphic with high probability, but
+# not for certain: regular graphs with the same degrees, for instance,
+# can't be told apart.  As only one representative of each group is
+# displayed, this only matters for graphs that are odd in the first
+# place.
+
+WL_MAX_ROUNDS = 20
+
+
+def edge_label_string (x, y, ga):
+  if options.edge_labels and x in ga.edgeLabels and y in ga.edgeLabels[x]:
+    return ga.edgeLabels[x][y][0]
+  return ''
+
+
+def analyze_wl_shape (g, num_nodes, ga):
+  num_edges = 0
+  for edges in g.values():
+    num_edges += len(edges)
+  colors = sorted([node_format_string(x, ga) for x in graph_nodes(g)])
+  return (num_nodes, num_edges, hash(tuple(colors)))
+
+
+def analyze_wl_graph (g, ga):
+  nodes = graph_nodes(g)
+  preds = {}
+  for src, edges in g.items():
+    for dst in edges:
+      preds.setdefault(dst, []).append(src)
+
+  colors = dict([(x, node_format_string(x, ga)) for x in nodes])
+  num_colors = len(set(colors.values()))
+
+  for i in range(min(len(nodes), WL_MAX_ROUNDS)):
+    new_colors = {}
+    for x in nodes:
+      out_colors = sorted([(edge_label_string(x, y, ga), colors[y]) for y in g.get(x, [])])
+      in_colors = sorted([(edge_label_string(y, x, ga), colors[y]) for y in preds.get(x, [])])
+      new_colors[x] = hash((colors[x], tuple(out_colors), tuple(in_colors)))
+    colors = new_colors
+    new_num_colors = len(set(colors.values()))
+    if new_num_colors == num_colors:
+      break
+    num_colors = new_num_colors
+
+  return hash(tuple(sorted(colors.values())))
+
+
+
 # if this is true, at least one node in the graph is CC garbage
 def has_garbage (x, ga):
   return len((graph_nodes(x) - ga.black_rced) - ga.black_gced) != 0
@@ -1442,12 +1382,17 @@ def node_count_label_string (x, count, ga):
 
 
 
-# Print out a dot representation of a graph.
-def print_graph (outf, g, ga):
+# Print out a dot representation of a graph.  chains maps edges that
+# stand for a chain of nodes removed by compress_graph to the length
+# of the chain.
+def print_graph (outf, g, ga, chains={}):
   allNodes = graph_nodes(g)
 
-  for src, edges in g.iteritems():
+  for src, edges in g.items():
     for dst in edges:
+      if (src, dst) in chains:
+        outf.write('  q{0} -> q{1} [style=bold, label="{2}"];\n'.format(src, dst, chains[(src, dst)]))
+        continue
       if options.edge_labels and src in ga.edgeLabels \
             and dst in ga.edgeLabels[src]:
         # could be more than one, in which case we just show the first for simplicity
@@ -1464,69 +1409,132 @@ def print_graph (outf, g, ga):
     outf.write('  q{0} [{1}];\n'.format(r, node_format_string(r, ga)))
 
 
-# print out dot representations of the single node graphs
-def print_solo_graphs(outf, solo_graphs, ga):
-  for p, x in solo_graphs.iteritems():
+# Print out a component of the output: a graph, and if hd isn't None,
+# the number of copies of it, count, as the label of hd.  The nodes
+# that stand for a star of nodes removed by compress_graph are labeled
+# with the size of the star.
+def print_component (outf, g, hd, count, ga, chains={}, stars={}):
+  print_graph(outf, g, ga, chains)
+  if hd != None:
+    outf.write('  q{0} [label="{1}"];\n'.format(hd, node_count_label_string(hd, count, ga)))
+  for x in sorted(stars.keys()):
+    outf.write('  q{0} [label="{1}"];\n'.format(x, node_count_label_string(x, stars[x], ga)))
+
+
+# Fewest leaves of the same kind with the same parent to merge, and
+# fewest nodes in a chain to collapse, with --compress.
+STAR_MIN = 3
+CHAIN_MIN = 2
+
+
+# Collapse chains and stars in a component with --compress.  The node
+# with the count of the copies of the graph, and roots, are kept.
+def compress_graph (g, hd, ga):
+  keep = graph_nodes(g) & ga.roots
+  if hd != None:
+    keep.add(hd)
+  return chain_compress.compressGraph(g, keep, lambda x: node_format_string(x, ga),
+                                      STAR_MIN, CHAIN_MIN)
+
+
+# The functions below compute the components to print out for each
+# combiner, as a list of (g, hd, count).
+
+
+# single node graphs
+def solo_components (solo_graphs, ga):
+  comps = []
+  for p, x in solo_graphs.items():
     if print_all_singletons:
       for y in x:
-        print_graph(outf, y, ga)
+        comps.append((y, None, 1))
     else:
       if should_print_graph(x[0], ga, len(x)):
-        print_graph(outf, x[0], ga)
-        n = x[0].keys()[0]
-        outf.write('  q{0} [label="{1}"];\n'.format(n, node_count_label_string(n, len(x), ga)))
+        n = list(x[0].keys())[0]
+        comps.append((x[0], n, len(x)))
+  return comps
 
 
-# print out dot representations of two node graphs
-def print_pair_graphs (outf, pair_graphs, ga):
-  for p, l in pair_graphs.iteritems():
+# two node graphs
+def pair_components (pair_graphs, ga):
+  comps = []
+  for p, l in pair_graphs.items():
     if should_print_graph(l[0], ga, len(l)):
       if print_all_pairs:
         for x in l:
-          print_graph(outf, x, ga)
+          comps.append((x, None, 1))
       else:
-        print_graph(outf, l[0], ga)
-        if len(l[0][l[0].keys()[0]]) != 0:
-          hd = l[0].keys()[0]
+        if len(l[0][list(l[0].keys())[0]]) != 0:
+          hd = list(l[0].keys())[0]
         else:
-          hd = l[0].keys()[1]
+          hd = list(l[0].keys())[1]
         le = len(l)
         if le != 1:
-          outf.write('  q{0} [label="{1}"];\n'.format(hd, node_count_label_string(hd, le, ga)))
+          comps.append((l[0], hd, le))
+        else:
+          comps.append((l[0], None, 1))
+  return comps
+
 
-# print out dot representations of three node graphs
-def print_tri_graphs (outf, tri_graphs, ga):
-  for p, l in tri_graphs.iteritems():
+# three node graphs
+def tri_components (tri_graphs, ga):
+  comps = []
+  for p, l in tri_graphs.items():
     if should_print_graph(l[0], ga, len(l)):
       if print_all_tris:
         for x in l:
-          print_graph(outf, x, ga)
+          comps.append((x, None, 1))
       else:
-        print_graph(outf, l[0], ga)
         if len(l) != 1:
           c = graph_counts(l[0])
           hd = set_select(c[1] - c[2])
           if hd == None:
             hd = set_select(c[1] & c[2])
-          outf.write('  q{0} [label="{1}"];\n'.format(hd, node_count_label_string(hd, len(l), ga)))
+          comps.append((l[0], hd, len(l)))
+        else:
+          comps.append((l[0], None, 1))
+  return comps
 
 
 # assume g is a death star
 def death_star_head (g):
-  for x, e in g.iteritems():
+  for x, e in g.items():
     if len(e) == 10:
       return x
   assert(False)
 
 
-def print_death_stars (outf, death_stars, ga):
-  for k, ds in death_stars.iteritems():
+def death_star_components (death_stars, ga):
+  comps = []
+  for k, ds in death_stars.items():
     if should_print_graph(ds[0], ga, len(ds)):
-      print_graph(outf, ds[0], ga)
       # only add a count label if the count isn't 1
       if len(ds) != 1:
-        hd = death_star_head(ds[0])
-        outf.write('  q{0} [label="{1}"];\n'.format(hd, node_count_label_string(hd, len(ds), ga)))
+        comps.append((ds[0], death_star_head(ds[0]), len(ds)))
+      else:
+        comps.append((ds[0], None, 1))
+  return comps
+
+
+# Choose the node in a combined graph that gets the count: a node
+# without predecessors, if there is one, with the least
+# node_format_string.
+def wl_graph_head (g, ga):
+  dsts = set([])
+  for edges in g.values():
+    dsts |= edges
+  return min(graph_nodes(g), key=lambda x: (x in dsts, node_format_string(x, ga), x))
+
+
+def wl_components (wl_graphs, ga):
+  comps = []
+  for k, l in wl_graphs.items():
+    if should_print_graph(l[0], ga, len(l)):
+      if len(l) != 1:
+        comps.append((l[0], wl_graph_head(l[0], ga), len(l)))
+      else:
+        comps.append((l[0], None, 1))
+  return comps
 
 
 ##################
@@ -1537,7 +1545,7 @@ def print_death_stars (outf, death_stars, ga):
 if False:
   ng = {}
   nsl = 0
-  for x, edges in g.iteritems():
+  for x, edges in g.items():
     if x in ga.black_gced:
       nedges = set([])
       for e in edges:
@@ -1549,43 +1557,11 @@ if False:
       nedges = edges
     ng[x] = nedges
 
-  print 'removed', nsl, 'self-loops from JS objects'
+  print('removed', nsl, 'self-loops from JS objects')
 
   g = ng
 
 
-if COMPUTE_ACYCLIC:
-  #acycnodes = compute_acyclic(g, ACYCLIC_DEPTH, ga)
-  acycnodes = calc_acyc_dfs2(g)
-  #acycnodes = calc_acyc_dfs3(g, ga)
-
-  #acycnodes = get_rank_0(g)
-  if REMOVE_ACYCLIC:
-    print 'removing acyclic nodes'
-    g = remove_nodes(g, acycnodes)
-    # can't just remove the calculated nodes with dfs3
-  else:
-    print 'marking acyclic nodes'
-    ga = ga._replace(shadies = ga.shadies | acycnodes)
-
-  if False:
-    careAbout = set(['nsDocument', 'nsGenericDOMDataNode', 'nsGenericElement', 'nsDOMAttribute'])
-    # show the classes of the acyclic nodes
-    cyc_counts = {}
-    for x in graph_nodes(g):
-      (a, b) = cyc_counts.pop(ga.node_names[x], (0, 0))
-      if x in acycnodes:
-        cyc_counts[ga.node_names[x]] = (a+1, b)
-      else:
-        cyc_counts[ga.node_names[x]] = (a, b+1)
-    for x, (v, w) in cyc_counts.iteritems():
-      if not x in careAbout:
-        continue
-      if True: #v + w > 50:
-        print '%(perc)3d%% %(cl)s (out of %(tot)d)' % \
-            {"perc":(100 * v / (v + w)), "ac":v, "tot":v+w, "cl" : x}
-
-
 # don't remove acyclic nodes after this, as we must keep around the graph residue
 #tiny_mems = calc_tiny_loops (g, black_gced)
 #print 'found', len(tiny_mems), 'tiny loops nodes to remove (', 100 * len(tiny_mems) / len(graph_nodes(g)) , '% )'
@@ -1613,182 +1589,352 @@ solo_graphs = {}
 pair_graphs = {}
 tri_graphs = {}
 death_stars = {}
+wl_graphs = {}
 other_graphs = []
 size_counts = {}
 
 
 
-def generic_remover (g, pred, desc):
-  nn = set([])
-  count = 0
-
-  for x in g.keys():
-    if pred(x):
-      nn.add(x)
-      del g[x]
-      count += 1
-
-  print 'Removed', count, desc
-
-  for x in g.keys():
-    g[x] = g[x] - nn
+####
+#### Pruning
+####
 
+# Pruning is done with masks, so the graph is only rewritten once, by
+# apply_masks, no matter how many prunes there are.  The node mask is
+# the set of nodes to remove, and the edge mask maps a node to the set
+# of its successors to remove.
+#
+# Each node prune takes the graph, the draw attributes and a function
+# succs that returns the successors of a node that survive the edge
+# mask and the node prunes that come before it, and returns a predicate
+# that is true for the nodes it removes.  Most prunes don't look at the
+# graph, but prune_non_js_border and prune_green_js see the graph left
+# by the prunes before them.
 
 
-def prune_no_childs (g):
+def prune_no_childs (g, ga, succs):
   def no_ch_pred (x):
-    return len(g[x]) == 0
-
-  generic_remover (g, no_ch_pred, 'childless nodes.')
+    return len(succs(x)) == 0
 
+  return no_ch_pred
 
-def prune_js (g, ga):
-  gcn = set(ga.gcNodes.keys())
 
+def prune_js (g, ga, succs):
   def js_pred (x):
-    return x in gcn
+    return x in ga.gcNodes
 
-  generic_remover (g, js_pred, 'JS nodes.')
+  return js_pred
 
 
-def prune_non_js (g, ga):
-  gcn = set(ga.gcNodes.keys())
-
+def prune_non_js (g, ga, succs):
   def js_pred (x):
-    return not x in gcn
-
-  generic_remover (g, js_pred, 'non-JS nodes.')
+    return not x in ga.gcNodes
 
+  return js_pred
 
-def prune_non_js_border (g, ga):
-  gcn = set(ga.gcNodes.keys())
-  rcn = set(ga.rcNodes.keys())
 
+def prune_non_js_border (g, ga, succs):
   border = set([])
 #  for x in rcn:
 #    if x in g:
 #      for y in g[x]:
 #        if y in gcn:
 #          border.add(x)
-  for x in gcn:
+  for x in ga.gcNodes:
     if x in g:
-      for y in g[x]:
-        if y in rcn:
+      for y in succs(x):
+        if y in ga.rcNodes:
           border.add(y)
 
   def js_pred (x):
-    return not (x in gcn or x in border)
-
-  generic_remover (g, js_pred, 'non-border-JS nodes.')
+    return not (x in ga.gcNodes or x in border)
 
+  return js_pred
 
-def prune_marked_js (g, ga):
-  s = set([])
-  for x, marked in ga.gcNodes.iteritems():
-    if marked:
-      s.add(x)
 
+def prune_marked_js (g, ga, succs):
   def js_pred (x):
-    return x in s
+    return ga.gcNodes.get(x, False)
 
-  generic_remover (g, js_pred, 'marked JS nodes.')
+  return js_pred
 
 
-def prune_js_listener (g, ga):
+def prune_js_listener (g, ga, succs):
   def js_listener_pred (x):
     return ga.nodeLabels.get(x, '') == 'nsJSEventListener'
 
-  generic_remover (g, js_listener_pred, 'JS listeners.')
+  return js_listener_pred
 
 
-def prune_garbage (g, ga):
+def prune_garbage (g, ga, succs):
   def garb_pred (x):
     return x in ga.garbage
 
-  generic_remover (g, garb_pred, 'garbage nodes.')
+  return garb_pred
 
 
-# these create a lot of noise in the graph
-def prune_info_parent_edges (g, ga):
-  niCount = 0
-  gpCount = 0
-  momCount = 0
-
-  for x in g.keys():
-    for e in list(g[x]):
-      ename = ga.edgeLabels[x].get(e, [''])[0]
-      if ename == 'mNodeInfo':
-        g[x].remove(e)
-        niCount += 1
-      if ename == 'GetParent()':
-        g[x].remove(e)
-        gpCount += 1
-      if ename == 'mOwnerManager':
-        g[x].remove(e)
-        momCount += 1
-      # remove this
-      #if ename == 'parent':
-      #  g[x].remove(e)
-      # remove this
-      #if ename == 'type_proto':
-      #  g[x].remove(e)
-
-  print 'Removed', niCount, 'nsNodeInfo,', gpCount, 'GetParent(), and', momCount, 'mOwnerManager edges.'
-
-
-# compute the set of GCed nodes that don't reach RCed nodes.
-def green_gc_nodes (g, ga):
-  gcn = set(ga.gcNodes.keys())
-  non_green = set(ga.rcNodes.keys())
-  any_new = True
-
-  while any_new:
-    any_new = False
-    new_non_green = set([])
-    for x in gcn:
-      if x in g:
-        if len(g[x].intersection(non_green)) != 0:
-          new_non_green.add(x)
-          anyNew = True
-    gcn = gcn - new_non_green
-    non_green = non_green | new_non_green
-
-  return gcn
-
-
-def prune_green_js (g, ga):
-  green = green_gc_nodes(g, ga)
+# compute the set of GCed nodes that don't reach RCed nodes.  If succs
+# is given, only the successors it returns are followed.
+#
+# A GCed node reaches an RCed node if it points to one, or points to a
+# GCed node that reaches one.  This works backwards from the RCed nodes
+# over the predecessors of each node, so each edge is looked at once.
+def green_gc_nodes (g, ga, succs=None):
+  if succs is None:
+    succs = lambda x: g[x]
+
+  # Only edges from GCed nodes matter, so only those are reversed.
+  gc_preds = {}
+  for x in g:
+    if x in ga.gcNodes:
+      for y in succs(x):
+        gc_preds.setdefault(y, []).append(x)
+
+  non_green = set([])
+  work_list = [x for x in ga.rcNodes if x in gc_preds]
+
+  while work_list:
+    x = work_list.pop()
+    for y in gc_preds.get(x, []):
+      if not y in non_green:
+        non_green.add(y)
+        work_list.append(y)
+
+  return set(ga.gcNodes.keys()) - non_green
+
+
+def prune_green_js (g, ga, succs):
+  green = green_gc_nodes(g, ga, succs)
 
   def green_pred (x):
     return x in green
 
-  generic_remover (g, green_pred, 'green nodes.')
+  return green_pred
+
+
+# The node prunes, in the order they are applied, with the option that
+# turns each one on.
+NODE_PRUNES = [
+  ('prune_garbage', prune_garbage, 'garbage nodes.'),
+  ('prune_js', prune_js, 'JS nodes.'),
+  ('prune_non_js', prune_non_js, 'non-JS nodes.'),
+  ('prune_non_js_border', prune_non_js_border, 'non-border-JS nodes.'),
+  ('prune_marked_js', prune_marked_js, 'marked JS nodes.'),
+  ('prune_green_js', prune_green_js, 'green nodes.'),
+]
+
+
+# Compute the node mask for the prunes turned on by the options.  The
+# predicates of all of the prunes are evaluated together in one pass
+# over the graph, and each removed node is counted against the first
+# prune that removes it.
+def node_mask (g, ga, edge_mask):
+  # The successors of x in the graph left by the prunes in earlier.
+  def live_succs (earlier):
+    def succs (x):
+      if any(pred(x) for pred in earlier):
+        return []
+      drop = edge_mask.get(x, ())
+      return [y for y in g[x] if not y in drop and
+              not any(pred(y) for pred in earlier)]
+    return succs
+
+  preds = []
+  for (opt, prune, desc) in NODE_PRUNES:
+    if getattr(options, opt):
+      earlier = [pred for (pred, _) in preds]
+      preds.append((prune(g, ga, live_succs(earlier)), desc))
+
+  removed = set([])
+  counts = [0] * len(preds)
+  if preds:
+    for x in g:
+      for i, (pred, desc) in enumerate(preds):
+        if pred(x):
+          removed.add(x)
+          counts[i] += 1
+          break
 
+  for i, (pred, desc) in enumerate(preds):
+    print('Removed', counts[i], desc)
 
+  return removed
 
-# analyze the graphs
 
-def analyze_graphs():
-  for x in gg:
-    num_nodes = gnodes(x)
+# these create a lot of noise in the graph
+INFO_PARENT_EDGES = ['mNodeInfo', 'GetParent()', 'mOwnerManager']
 
-    scnn = size_counts.pop(num_nodes, 0)
-    size_counts[num_nodes] = scnn + 1
+# Compute the edge mask of the edges with labels in INFO_PARENT_EDGES.
+def info_parent_edge_mask (g, ga):
+  counts = dict([(ename, 0) for ename in INFO_PARENT_EDGES])
+  edge_mask = {}
 
-    if num_nodes < options.min_graph_size or \
-          not (num_nodes <= options.max_graph_size or options.max_graph_size == -1):
-      continue
-    if num_nodes == 1:
-      analyze_1_graph (x, solo_graphs, ga)
-    elif num_nodes == 2 and analyze_2_graph(x, pair_graphs, ga):
+  for x, edges in g.items():
+    labels = ga.edgeLabels.get(x)
+    if not labels:
       continue
-    elif num_nodes == 3 and analyze_3_graph(x, tri_graphs, ga):
+    for e, elabels in labels.items():
+      ename = elabels[0]
+      if ename in counts and e in edges:
+        edge_mask.setdefault(x, set([])).add(e)
+        counts[ename] += 1
+
+  print('Removed', counts['mNodeInfo'], 'nsNodeInfo,', counts['GetParent()'], 'GetParent(), and',
+        counts['mOwnerManager'], 'mOwnerManager edges.')
+  return edge_mask
+
+
+# Return a new graph without the nodes in removed and the edges in
+# edge_mask.  Successor sets that don't change are shared with g.
+def apply_masks (g, removed, edge_mask):
+  ng = {}
+  for x, edges in g.items():
+    if x in removed:
       continue
+    drop = edge_mask.get(x)
+    if drop:
+      edges = edges - drop
+    if not removed.isdisjoint(edges):
+      edges = edges - removed
+    ng[x] = edges
+  return ng
+
+
+
+# analyze the graphs
+
+# Returns (num_nodes, combiner, key) for a graph.  combiner is the
+# name of the combiner the graph is added to with key, 'other' if the
+# graph isn't combined, or None if the graph isn't displayed.
+def analyze_graph (x, ga):
+  num_nodes = gnodes(x)
+
+  if num_nodes < options.min_graph_size or \
+        not (num_nodes <= options.max_graph_size or options.max_graph_size == -1):
+    return (num_nodes, None, None)
+  if num_nodes == 1:
+    return (num_nodes, 'solo', analyze_1_graph(x, ga))
+  elif num_nodes == 2:
+    return (num_nodes, 'pair', analyze_2_graph(x, ga))
+  elif num_nodes == 3:
+    k = analyze_3_graph(x, ga)
+    if k != None:
+      return (num_nodes, 'tri', k)
 # why did merging break that?
-#    elif num_nodes == 11 and analyze_death_star(x, death_stars, ga):
-#      continue
-    else:
+#  elif num_nodes == 11 and analyze_death_star(x, death_stars, ga):
+#    ...
+  if not options.no_merge_larger:
+    return (num_nodes, 'wl', analyze_wl_shape(x, num_nodes, ga))
+  return (num_nodes, 'other', None)
+
+
+# Replace the key of every graph in the wl combiner that shares its
+# key with another graph with the result of analyze_wl_graph.
+def refine_wl_keys (gg, analysis, ga, jobs):
+  counts = {}
+  for (num_nodes, combiner, key) in analysis:
+    if combiner == 'wl':
+      counts[key] = counts.get(key, 0) + 1
+
+  shared = [i for i, (num_nodes, combiner, key) in enumerate(analysis)
+            if combiner == 'wl' and counts[key] > 1]
+
+  for i, k in zip(shared, map_graphs(analyze_wl_graph, gg, shared, ga, jobs)):
+    (num_nodes, combiner, key) = analysis[i]
+    analysis[i] = (num_nodes, combiner, (key, k))
+
+
+# Add the graphs to the combiners, given the result of analyze_graph
+# for each of them.  This is always done in the order of the graphs,
+# so the output doesn't depend on how the analysis was done.
+def combine_graphs (gg, analysis):
+  combiners = {'solo':solo_graphs, 'pair':pair_graphs, 'tri':tri_graphs,
+               'wl':wl_graphs}
+
+  for x, (num_nodes, combiner, key) in zip(gg, analysis):
+    scnn = size_counts.pop(num_nodes, 0)
+    size_counts[num_nodes] = scnn + 1
+
+    if combiner == 'other':
       other_graphs.append((num_nodes, x))
+    elif combiner != None:
+      add_to_combiner(combiners[combiner], key, x)
+
+
+def analyze_graphs (gg, ga, jobs):
+  analysis = map_graphs(analyze_graph, gg, range(len(gg)), ga, jobs)
+  refine_wl_keys(gg, analysis, ga, jobs)
+  combine_graphs(gg, analysis)
+
+
+# Parallel analysis.
+#
+# With more than one job, the graphs are sorted by size, largest
+# first, and cut into chunks with roughly the same number of nodes, so
+# the huge number of tiny garbage graphs in some logs are analyzed a
+# few thousand at a time, while a big graph gets a chunk to itself.
+# The workers are forked after the graph is loaded, so they already
+# have the graphs, the draw attributes and the options: only the
+# indexes of the graphs in each chunk and the results are sent between
+# processes.  The results are put back in the original order of the
+# graphs before combining them.  Forking is also what makes the built in
+# hash of the WL keys agree between workers.  Where fork isn't
+# available, like on Windows, the graphs are analyzed serially.  dotify
+# doesn't start any threads, so forking is safe where it is available.
+
+# Number of chunks to aim for per worker.  More chunks even out the
+# load better, but each chunk has some overhead.
+CHUNKS_PER_JOB = 8
+
+# (gg, ga) while the workers are running.
+analysis_input = None
+
+
+def analyze_chunk (f, chunk):
+  (gg, ga) = analysis_input
+  return [(i, f(gg[i], ga)) for i in chunk]
+
+
+def chunk_graphs (gg, indexes, numChunks):
+  order = sorted(indexes, key=lambda i: len(gg[i]), reverse=True)
+  total = sum([len(gg[i]) for i in indexes])
+  chunkSize = max(1, total // numChunks)
+
+  chunks = []
+  curr = []
+  currSize = 0
+  for i in order:
+    curr.append(i)
+    currSize += len(gg[i])
+    if currSize >= chunkSize:
+      chunks.append(curr)
+      curr = []
+      currSize = 0
+  if curr:
+    chunks.append(curr)
+
+  return chunks
+
+
+# Return the list of f(gg[i], ga) for every i in indexes.
+def map_graphs (f, gg, indexes, ga, jobs):
+  if jobs <= 1 or len(indexes) <= 1 or not 'fork' in multiprocessing.get_all_start_methods():
+    return [f(gg[i], ga) for i in indexes]
+
+  global analysis_input
+  analysis_input = (gg, ga)
+  results = {}
+
+  with ProcessPoolExecutor(max_workers=jobs,
+                           mp_context=multiprocessing.get_context('fork')) as executor:
+    futures = [executor.submit(analyze_chunk, f, chunk)
+               for chunk in chunk_graphs(gg, indexes, jobs * CHUNKS_PER_JOB)]
+    for future in as_completed(futures):
+      for (i, r) in future.result():
+        results[i] = r
+
+  analysis_input = None
+  return [results[i] for i in indexes]
 
 
 label_color = { #'nsJSEventListener':'purple',
@@ -1807,7 +1953,7 @@ label_color = { #'nsJSEventListener':'purple',
 
 def make_colors_from_labels (nodeLabels):
   colors = {}
-  for x, lbl in nodeLabels.iteritems():
+  for x, lbl in nodeLabels.items():
     if lbl in label_color:
       colors[x] = label_color[lbl]
 #    elif lbl.startswith('nsGenericElement (XUL)'):
@@ -1840,7 +1986,7 @@ def make_colors (ga):
 def make_draw_attribs (ga, res):
   roots = set([])
 
-  for x, marked in ga.gcNodes.iteritems():
+  for x, marked in ga.gcNodes.items():
     if marked:
       roots.add(x)
 
@@ -1850,7 +1996,7 @@ def make_draw_attribs (ga, res):
   return DrawAttribs (edgeLabels=ga.edgeLabels, nodeLabels=ga.nodeLabels,
                       rcNodes=ga.rcNodes, gcNodes=ga.gcNodes, roots=roots,
                       garbage=res[1], colors=make_colors(ga),
-                      mergeCounts = {})
+                      mergeCounts = {}, shadies = set([]))
 
 
 # remove graph nodes that aren't within k steps of nodes of a given name
@@ -1874,7 +2020,7 @@ def split_neighbor (g, ga, name, k):
   visited = set(visited.keys())
 
   # remove other objects
-  for n in g.keys():
+  for n in list(g.keys()):
     if n in visited:
       g[n] = g[n] & visited
     else:
@@ -1899,7 +2045,7 @@ def merge_from_file(g, fname):
 
   # merge nodes
   g2 = {}
-  for src, edges in g.iteritems():
+  for src, edges in g.items():
     src2 = merges.get(src, src)
     if not src2 in g2:
       g2[src2] = set([])
@@ -1917,101 +2063,133 @@ def loadGraph(fname):
   #sys.stdout.flush()
   g = parse_cc_graph.toSinglegraph(g)
   ga = make_draw_attribs (ga, res)
-  print 'Done loading graph.'
+  print('Done loading graph.')
   return (g, ga, res)
 
 
-file_name = args[0]
+def num_edges (g):
+  n = 0
+  for edges in g.values():
+    n += len(edges)
+  return n
 
-(g, ga, res) = loadGraph(file_name)
 
+def write_dot_file (file_name, ga, res, mergies):
 
-# pre-pruning
+  # print out stats at the start of each file
 
-if not options.no_info_parent_prune:
-  prune_info_parent_edges(g, ga)
+  header = '// '
+  for x, v in sorted(size_counts.items()):
+    header += '{0}={1}({2}), '.format(x, v, x * v)
+  header += '\n'
 
-if options.merge_file:
-  (g, merged_to) = merge_from_file(g, 'merging.txt')
-  ga = ga._replace(mergeCounts = merged_to)
+  # number of nodes the CC collected
+  header += '// num nodes collected is '
+  header += '{0}\n'.format(len(res[1] - set(ga.gcNodes.keys())))
+    # should we count JS nodes as garbage here?
 
-if options.prune_garbage:
-  prune_garbage(g, ga)
-if options.prune_js:
-  prune_js(g, ga)
-if options.prune_non_js:
-  prune_non_js (g, ga)
-if options.prune_non_js_border:
-  prune_non_js_border (g, ga)
-if options.prune_marked_js:
-  prune_marked_js(g, ga)
+  # number of JS roots
+  #header += '// num of JS roots is {0}\n'.format(len(ga.roots & ga.black_gced))
 
-#prune_green_js (g, ga)
 
-#prune_js_listener(g, ga)
-#prune_no_childs(g)
-if options.merge_js:
-  (g, mergies) = merginator(g, ga)
 
-gg = split_graph(g)
+  header += 'digraph graph_name {\n'
 
+  outf = dot_writer.DotWriter(file_name, header, maxNodes=options.max_nodes,
+                              maxEdges=options.max_edges, shardNodes=options.shard_nodes)
 
-analyze_graphs()
+  comps = []
+  for x in other_graphs:
+    if should_print_graph(x[1], ga, 1):
+      comps.append((x[1], None, 1))
 
+  #for x in other_graphs:
+  #  if x[0] != 10 and x[0] != 36:
+  #    continue
+  #  #if should_print_graph(x[1], ga):
+  #  c = size_counts.get(x[0], 0)
+  #  if c < 20:
+  #    size_counts[x[0]] = c + 1
+  #    print_graph(outf, x[1], ga)
 
+  comps += solo_components(solo_graphs, ga)
+  comps += pair_components(pair_graphs, ga)
+  comps += tri_components(tri_graphs, ga)
+  comps += death_star_components(death_stars, ga)
+  comps += wl_components(wl_graphs, ga)
 
-# print out graphs
+  comps = dot_writer.orderComponents(comps, lambda c: gnodes(c[0]),
+                                     lambda c: min(graph_nodes(c[0])), options.select)
 
-outf = open(file_name + '.dot', 'w')
+  for (g, hd, count) in comps:
+    if options.compress:
+      (g, chains, stars) = compress_graph(g, hd, ga)
+    else:
+      (chains, stars) = ({}, {})
+    if outf.beginComponent(gnodes(g), num_edges(g)):
+      print_component(outf, g, hd, count, ga, chains, stars)
 
+  if mergies != None and outf.beginComponent(0, 0):
+    for x, count in mergies.items():
+      if count > 10:
+        outf.write('  q{0} [label="{1}", shape=square, color=red];'.format(x, count))
 
-# print out stats at the start of a file
+  #for x, count in merged_to.items():
+  #  outf.write('  q{0} [label="{1}", shape=circle, color=red];\n'.format(x, count))
 
-outf.write('// ')
-for x, v in sorted(size_counts.iteritems()):
-  outf.write('{0}={1}({2}), '.format(x, v, x * v))
-outf.write('\n')
+  outf.close()
+  outf.printSummary()
 
-# number of nodes the CC collected
-outf.write('// num nodes collected is ')
-outf.write('{0}\n'.format(len(res[1] - set(ga.gcNodes.keys()))))
-  # should we count JS nodes as garbage here?
 
-# number of JS roots
-#outf.write('// num of JS roots is {0}\n'.format(len(ga.roots & ga.black_gced)))
+def dotify ():
+  global options
+  options = parser.parse_args()
 
+  (g, ga, res) = loadGraph(options.file_name)
 
 
-outf.write('digraph graph_name {\n')
+  # pre-pruning
+
+  if options.no_info_parent_prune:
+    edge_mask = {}
+  else:
+    edge_mask = info_parent_edge_mask(g, ga)
+
+  if options.merge_file:
+    # Merging renames nodes, so the edge mask is applied first.
+    g = apply_masks(g, set([]), edge_mask)
+    edge_mask = {}
+    (g, merged_to) = merge_from_file(g, 'merging.txt')
+    ga = ga._replace(mergeCounts = merged_to)
+
+  g = apply_masks(g, node_mask(g, ga, edge_mask), edge_mask)
+
+  if COMPUTE_ACYCLIC:
+    acycnodes = compute_acyclic(g, None, ga)
+    if REMOVE_ACYCLIC:
+      print('removing acyclic nodes')
+      g = remove_nodes(g, acycnodes)
+    else:
+      print('marking acyclic nodes')
+      ga = ga._replace(shadies = ga.shadies | acycnodes)
+
+  if CALC_DUPS:
+    dups = calc_dups(g, ga)
+    if REMOVE_DUPS:
+      g = remove_nodes(g, dups)
+    else:
+      ga = ga._replace(shadies = ga.shadies | dups)
+
+  mergies = None
+  if options.merge_js:
+    (g, mergies) = merginator(g, ga)
+
+  gg = split_graph(g)
+
+  analyze_graphs(gg, ga, options.jobs)
+
+  write_dot_file(options.file_name, ga, res, mergies)
 
-# don't print more than 100 of each size of other graph
-size_counts = {}
 
-for x in other_graphs:
-  if should_print_graph(x[1], ga, 1):
-    print_graph(outf, x[1], ga)
-
-#for x in other_graphs:
-#  if x[0] != 10 and x[0] != 36:
-#    continue
-#  #if should_print_graph(x[1], ga):
-#  c = size_counts.get(x[0], 0)
-#  if c < 20:
-#    size_counts[x[0]] = c + 1
-#    print_graph(outf, x[1], ga)
-
-print_solo_graphs(outf, solo_graphs, ga)
-print_pair_graphs(outf, pair_graphs, ga)
-print_tri_graphs(outf, tri_graphs, ga)
-print_death_stars(outf, death_stars, ga)
-
-if options.merge_js:
-  for x, count in mergies.iteritems():
-    if count > 10:
-      outf.write('  q{0} [label="{1}", shape=square, color=red];'.format(x, count))
-
-#for x, count in merged_to.iteritems():
-#  outf.write('  q{0} [label="{1}", shape=circle, color=red];\n'.format(x, count))
-
-outf.write('}\n')
-outf.close()
+if __name__ == "__main__":
+  dotify()
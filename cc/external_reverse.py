@@ -0,0 +1,338 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import sys
+import os
+import re
+import heapq
+import mmap
+import struct
+import argparse
+import tempfile
+from array import array
+from collections import namedtuple
+from . import parse_cc_graph
+from . import csr_graph
+
+
+# Reverse the graph in a CC or GC log without holding the edges in
+# memory, for logs that are too big to reverse with reverseMultigraph
+# or a dict of sets.
+#
+# The log is streamed once.  Addresses and edge labels are interned to
+# integer ids, and each edge is turned into a (dst, src, label id)
+# record.  Records are buffered until there are --run-size of them,
+# then sorted and written to a temporary run file.  The runs are then
+# merged with a k-way merge and written out as a reversed graph in
+# compressed sparse row form.  Only the address table, the in-degree of
+# each node and one run are in memory at a time.
+#
+# The output file is laid out so that it can be mmapped and used
+# without parsing it:
+#
+#   header: magic, numIds, numEdges, numLabels, and the file offsets of
+#     the edge array, the address table, the address order and the
+#     label table.
+#
+#   offsets: numIds + 1 unsigned 64-bit integers.  The predecessors of
+#     node x are the entries offsets[x] to offsets[x+1] of the edge array.
+#
+#   edges: numEdges pairs of unsigned 32-bit integers, the id of the
+#     source node and the id of the edge label.  There is one entry per
+#     edge, so multiple edges appear multiple times.  Within each node,
+#     entries are sorted by source id.
+#
+#   addresses and labels: csr_graph string tables, indexed by id.
+#     Label id 0 is the empty label.
+#
+#   address order: numIds signed 32-bit integers, the ids sorted by
+#     address, for looking up addresses with a binary search.
+#
+# Integers are stored in native byte order, and each section starts on
+# an 8 byte boundary.
+#
+# openReversedGraph (fname): returns a ReversedGraph for the file.
+#   Nothing in the file is parsed or copied: names and labelNames are
+#   csr_graph.StringTables and ids is a csr_graph.AddressIndex, all
+#   backed by the mmapped file.  graph is a csr_graph.PredecessorMap,
+#   which can be used in place of the reversed graph produced by
+#   reverseGraph in find_roots.
+
+
+parser = argparse.ArgumentParser(description='Write the reversed graph of a CC or GC log to a file that can be mmapped.')
+
+parser.add_argument('file_name',
+                    help='CC or GC log file name.  The kind of log is determined by whether the name starts with cc or gc.')
+
+parser.add_argument('output_file_name',
+                    help='file name for the reversed graph')
+
+parser.add_argument('--run-size', dest='run_size', type=int,
+                    default=2000000,
+                    help='Number of edges to sort in memory at a time. Default is 2000000.')
+
+parser.add_argument('--temp-dir', dest='temp_dir',
+                    default=None,
+                    help='Directory for the sorted runs. Defaults to the directory of the output file.')
+
+
+MAGIC = b'RVCSR002'
+headerFmt = '=8sQQQQQQQ'
+headerSize = struct.calcsize(headerFmt)
+
+# Bits used for the label id and source id in packed records.
+labelBits = 24
+srcBits = 32
+
+# Number of records to read from each run at a time while merging.
+mergeChunkSize = 65536
+
+
+ReversedGraph = namedtuple('ReversedGraph', 'numIds numEdges names ids labelNames offsets edges graph')
+
+
+####
+####  Log streaming
+####
+
+gcEdgePatt = re.compile(r'> ((?:0x)?[a-fA-F0-9]+) (?:(?:B|G|W) )?([^\r\n]*)\r?$')
+gcNodePatt = re.compile(r'((?:0x)?[a-fA-F0-9]+) (?:(?:B|G|W) )?([^\r\n]*)\r?$')
+
+
+# Yield (src, dst, label) for every edge in the graph part of a log.
+def logEdges (f, isGC):
+  if isGC:
+    # Skip the roots.
+    for l in f:
+      if l[:10] == '==========':
+        break
+    nodePatt = gcNodePatt
+  else:
+    nodePatt = parse_cc_graph.nodePatt
+
+  currNode = None
+  for l in f:
+    if l[0] == '>':
+      if isGC:
+        em = gcEdgePatt.match(l)
+        yield (currNode, em.group(1), em.group(2))
+      else:
+        end = l.find(' ', 2)
+        if end == -1:
+          yield (currNode, l[2:].rstrip(), '')
+        else:
+          yield (currNode, l[2:end], l[end + 1:].rstrip('\r\n'))
+      continue
+    if not isGC and l[:10] == '==========':
+      break
+    if l[0] == '#':
+      continue
+    nm = nodePatt.match(l)
+    if nm:
+      currNode = nm.group(1)
+    else:
+      currNode = None
+
+
+####
+####  Sorted runs
+####
+
+def writeRun (records, tmpDir, runs):
+  records.sort()
+  fname = os.path.join(tmpDir, 'run{0}'.format(len(runs)))
+  a = array('I')
+  srcMask = (1 << srcBits) - 1
+  labelMask = (1 << labelBits) - 1
+  for r in records:
+    a.append(r >> (srcBits + labelBits))
+    a.append((r >> labelBits) & srcMask)
+    a.append(r & labelMask)
+  with open(fname, 'wb') as f:
+    a.tofile(f)
+  runs.append(fname)
+  del records[:]
+
+
+def readRun (fname):
+  with open(fname, 'rb') as f:
+    while True:
+      a = array('I')
+      try:
+        a.fromfile(f, 3 * mergeChunkSize)
+      except EOFError:
+        pass
+      for i in range(0, len(a), 3):
+        yield (a[i] << (srcBits + labelBits)) | (a[i + 1] << labelBits) | a[i + 2]
+      if len(a) < 3 * mergeChunkSize:
+        break
+
+
+def padTo8 (f):
+  f.write(b'\0' * (-f.tell() % 8))
+
+
+# Write a string table as its offsets followed by its data, and return
+# where it starts.
+def writeStringTable (f, strings):
+  start = f.tell()
+  (offsets, data) = csr_graph.stringTable(strings)
+  offsets.tofile(f)
+  f.write(data)
+  padTo8(f)
+  return start
+
+
+def readStringTable (mv, start, n):
+  dataStart = start + 8 * (n + 1)
+  offsets = mv[start:dataStart].cast('q')
+  return csr_graph.StringTable(offsets, mv[dataStart:dataStart + offsets[n]])
+
+
+# Reverse the graph in the log f, writing the result to outf, which
+# must be opened in binary mode.
+def reverseLog (f, isGC, outf, runSize, tmpDir):
+  ids = {}
+  names = []
+  inDegrees = array('Q')
+  labelIds = {'':0}
+  labelNames = ['']
+
+  def intern (addr):
+    x = ids.get(addr)
+    if x is None:
+      x = len(names)
+      ids[addr] = x
+      names.append(addr)
+      inDegrees.append(0)
+    return x
+
+  records = []
+  runs = []
+  numEdges = 0
+
+  for (src, dst, lbl) in logEdges(f, isGC):
+    if src is None:
+      continue
+    s = intern(src)
+    d = intern(dst)
+    lblId = labelIds.get(lbl)
+    if lblId is None:
+      lblId = len(labelNames)
+      labelIds[lbl] = lblId
+      labelNames.append(lbl)
+    inDegrees[d] += 1
+    numEdges += 1
+    records.append((((d << srcBits) | s) << labelBits) | lblId)
+    if len(records) >= runSize:
+      writeRun(records, tmpDir, runs)
+  if records:
+    writeRun(records, tmpDir, runs)
+
+  assert len(names) < (1 << srcBits), 'Too many nodes.'
+  assert len(labelNames) < (1 << labelBits), 'Too many edge labels.'
+
+  numIds = len(names)
+  outf.write(b'\0' * headerSize)
+
+  # Offsets are the prefix sums of the in-degrees.
+  offsets = array('Q', [0]) * (numIds + 1)
+  for x in range(numIds):
+    offsets[x + 1] = offsets[x] + inDegrees[x]
+  del inDegrees
+  offsets.tofile(outf)
+
+  edgesStart = outf.tell()
+  srcMask = (1 << srcBits) - 1
+  labelMask = (1 << labelBits) - 1
+  buf = array('I')
+  for r in heapq.merge(*[readRun(run) for run in runs]):
+    buf.append((r >> labelBits) & srcMask)
+    buf.append(r & labelMask)
+    if len(buf) >= 2 * mergeChunkSize:
+      buf.tofile(outf)
+      buf = array('I')
+  buf.tofile(outf)
+  for run in runs:
+    os.remove(run)
+
+  namesStart = writeStringTable(outf, names)
+  orderStart = outf.tell()
+  csr_graph.addressOrder(names).tofile(outf)
+  padTo8(outf)
+  labelsStart = writeStringTable(outf, labelNames)
+
+  outf.seek(0)
+  outf.write(struct.pack(headerFmt, MAGIC, numIds, numEdges, len(labelNames),
+                         edgesStart, namesStart, orderStart, labelsStart))
+
+  return (numIds, numEdges, len(runs))
+
+
+####
+####  Reading the reversed graph
+####
+
+def openReversedGraph (fname):
+  try:
+    f = open(fname, 'rb')
+  except:
+    sys.stderr.write('Error opening file ' + fname + '\n')
+    exit(-1)
+  mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  f.close()
+
+  (magic, numIds, numEdges, numLabels, edgesStart, namesStart, orderStart, labelsStart) = \
+    struct.unpack_from(headerFmt, mm)
+  if magic != MAGIC:
+    sys.stderr.write(fname + ' is not a reversed graph file.\n')
+    exit(-1)
+
+  mv = memoryview(mm)
+  offsets = mv[headerSize:headerSize + 8 * (numIds + 1)].cast('Q')
+  edges = mv[edgesStart:edgesStart + 8 * numEdges].cast('I')
+  names = readStringTable(mv, namesStart, numIds)
+  ids = csr_graph.AddressIndex(names, mv[orderStart:orderStart + 4 * numIds].cast('i'))
+  labelNames = readStringTable(mv, labelsStart, numLabels)
+
+  return ReversedGraph(numIds=numIds, numEdges=numEdges, names=names, ids=ids,
+                       labelNames=labelNames, offsets=offsets, edges=edges,
+                       graph=csr_graph.PredecessorMap(names, ids, offsets, edges[::2]))
+
+
+# Return the ids of the sources of the edges to x, with one entry per edge.
+def predecessors (rg, x):
+  return rg.edges[2 * rg.offsets[x]:2 * rg.offsets[x + 1]:2]
+
+
+# Return the label ids of the edges to x, in the same order as predecessors.
+def predecessorLabels (rg, x):
+  return rg.edges[2 * rg.offsets[x] + 1:2 * rg.offsets[x + 1]:2]
+
+
+def externalReverse ():
+  args = parser.parse_args()
+
+  baseFileName = os.path.basename(args.file_name)
+  isGC = baseFileName.startswith('gc') or baseFileName.startswith('incomplete-gc')
+
+  try:
+    f = open(args.file_name, 'r')
+  except:
+    sys.stderr.write('Error opening file ' + args.file_name + '\n')
+    exit(-1)
+
+  tmpDir = args.temp_dir or os.path.dirname(os.path.abspath(args.output_file_name))
+  with open(args.output_file_name, 'wb') as outf, tempfile.TemporaryDirectory(dir=tmpDir) as runDir:
+    (numIds, numEdges, numRuns) = reverseLog(f, isGC, outf, args.run_size, runDir)
+  f.close()
+
+  print('Wrote the reversed graph of', numIds, 'nodes and', numEdges, 'edges to',
+        args.output_file_name, 'using', numRuns, 'sorted runs.')
+
+
+if __name__ == "__main__":
+  externalReverse()
@@ -9,6 +9,11 @@ import sys
 from collections import deque
 from collections import namedtuple
 from . import parse_cc_graph
+from . import label_index
+from . import external_reverse
+from . import csr_graph
+from . import reachability
+from . import graph_overlay
 import argparse
 import re
 
@@ -84,6 +89,14 @@ parser.add_argument('--hide-weak-maps', '-hwm', dest='hide_weak_maps', action='s
                     default=False,
                     help='If selected, don\'t show why any weak maps in the path are alive.')
 
+parser.add_argument('--reversed-graph', dest='reversed_graph', metavar='FILE',
+                    default=None,
+                    help='Use the reversed graph in FILE, written by external_reverse, instead of reversing the graph in memory. Implies --depth-first.')
+
+parser.add_argument('--reachable-from', dest='reachable_from', metavar='ADDR', action='append',
+                    default=None,
+                    help='Instead of finding paths, say whether the object at ADDR reaches each target.  Can be given more than once.')
+
 # print a node description
 def print_node (ga, x):
   sys.stdout.write ('{0} [{1}]'.format(x, ga.nodeLabels.get(x, '')))
@@ -246,15 +259,15 @@ def findRootsBFS(args, g, ga, num_known, roots, target):
     if wme.keyDelegate != '0x0':
       weakData.setdefault(wme.keyDelegate, set([])).add(wme)
 
-  # Create a fake start object that points to the roots and
-  # add it to the graph.
-  startObject = 'FAKE START OBJECT'
+  # Start from a fake object that points to the roots, without adding
+  # it to the graph.  The labels of weak map edges also go into an
+  # overlay, so neither g nor ga is changed.
+  startObject = graph_overlay.START
   rootEdges = set([])
   for r in roots:
     rootEdges.add(r)
-
-  assert not startObject in g
-  g[startObject] = rootEdges
+  ov = graph_overlay.makeOverlay(rootEdges)
+  ga = ga._replace(edgeLabels=graph_overlay.EdgeLabels(ga.edgeLabels))
   distances[startObject] = (-1, None)
   workList.append(startObject)
 
@@ -272,14 +285,10 @@ def findRootsBFS(args, g, ga, num_known, roots, target):
       # This will just find the shortest path to the object.
       continue
 
-    if not x in g:
-      # x does not point to any other nodes.
-      continue
-
     newDist = dist + 1
     newDistNode = (newDist, x)
 
-    for y in g[x]:
+    for y in graph_overlay.successors(g, ga.edgeLabels, ov, x):
       if y in distances:
         assert distances[y][0] <= newDist
       else:
@@ -304,7 +313,7 @@ def findRootsBFS(args, g, ga, num_known, roots, target):
   def knownEdgesFn(node):
     knownEdges = []
     for src, dsts in g.items():
-      if node in dsts and src != startObject:
+      if node in dsts:
         knownEdges.append(src)
     return knownEdges
 
@@ -321,7 +330,7 @@ def findRootsBFS(args, g, ga, num_known, roots, target):
         # so follow it, and worry about the weak map later.
         [_, k, m, lbl] = dist
 
-        ga.edgeLabels[k].setdefault(p, []).append(lbl)
+        ga.edgeLabels.addLabel(k, p, lbl)
         p = k
         if not m in printedThings and not args.hide_weak_maps:
           printWorkList.append(m)
@@ -340,8 +349,6 @@ def findRootsBFS(args, g, ga, num_known, roots, target):
       print()
       printKnownEdges(args, knownEdgesFn(p), ga, p)
 
-  del g[startObject]
-
   return
 
 
@@ -350,21 +357,29 @@ def findRootsBFS(args, g, ga, num_known, roots, target):
 ########################################################
 
 def reverseGraph (g):
-  g2 = {}
   sys.stdout.write('Reversing graph. ')
-  for src, dsts in g.items():
-    for d in dsts:
-      g2.setdefault(d, set([])).add(src)
+  g2 = csr_graph.reverseDictGraph(g)
   sys.stdout.write('Done.\n\n')
   return g2
 
+# The reversed graph from --reversed-graph, or else g reversed in memory.
+def reversedGraph(args, g):
+  if args.reversed_graph != None:
+    return external_reverse.openReversedGraph(args.reversed_graph).graph
+  return reverseGraph(g)
+
 def reverseGraphKnownEdges(revg, target):
   known = []
   for x in revg.get(target, []):
     known.append(x)
   return known
 
-def pretendAboutWeakMaps(args, g, ga):
+# Return a map of the edges from weak map keys to their values, to be
+# used as the extra edges of an overlay, and add their labels to
+# ga.edgeLabels, which must be an EdgeLabels.
+def pretendAboutWeakMaps(args, ga):
+  extraEdges = {}
+
   def nullToNone(s):
     if s == '0x0':
       return None
@@ -385,22 +400,30 @@ def pretendAboutWeakMaps(args, g, ga):
     if not v:
       continue
 
-    g[k].add(v)
+    extraEdges.setdefault(k, set([])).add(v)
 
     if m:
       edgeLabel = 'weak map key-value edge in map ' + m
     else:
       edgeLabel = 'weak map key-value edge in black map'
 
-    ga.edgeLabels[k].setdefault(v, []).append(edgeLabel)
+    ga.edgeLabels.addLabel(k, v, edgeLabel)
+
+  return extraEdges
 
 # Look for roots and print out the paths to the given object.
 # This works by reversing the graph, then flooding to find roots.
-def findRootsDFS(args, g, ga, num_known, roots, x):
+def findRootsDFS(args, revg, ga, num_known, roots, x):
+  # Reverse the weak map edges separately, so they aren't added to g.
+  ga = ga._replace(edgeLabels=graph_overlay.EdgeLabels(ga.edgeLabels))
+  revExtra = {}
   if args.weak_maps or args.weak_maps_maps_live:
-    pretendAboutWeakMaps(args, g, ga)
+    for k, vs in pretendAboutWeakMaps(args, ga).items():
+      for v in vs:
+        revExtra.setdefault(v, []).append(k)
 
-  revg = reverseGraph(g)
+  def predecessors(y):
+    return reverseGraphKnownEdges(revg, y) + revExtra.get(y, [])
   visited = set([])
   revPath = []
   anyFound = [False]
@@ -411,25 +434,24 @@ def findRootsDFS(args, g, ga, num_known, roots, x):
     visited.add(y)
 
     if y in roots:
-      def knownEdgesFn(node):
-        return reverseGraphKnownEdges(revg, node)
       path = copy.copy(revPath)
       path.reverse()
       path.append(x)
-      printPath(args, knownEdgesFn, ga, num_known, roots, path)
+      printPath(args, predecessors, ga, num_known, roots, path)
       anyFound[0] = True
     else:
-      if not y in revg:
+      preds = predecessors(y)
+      if not preds:
         return False
       revPath.append(None)
-      for z in revg[y]:
+      for z in preds:
         revPath[-1] = z
         if findRootsInner(z):
           return True
       revPath.pop()
     return False
 
-  if not (x in revg or x in roots):
+  if not (predecessors(x) or x in roots):
     sys.stdout.write ('No other nodes point to {0} and it is not a root.\n\n'.format(x))
     return
 
@@ -437,8 +459,7 @@ def findRootsDFS(args, g, ga, num_known, roots, x):
 
   if not anyFound[0] and not args.print_roots_only:
     print('No roots found for', x)
-    knownEdges = reverseGraphKnownEdges(revg, x)
-    printKnownEdges(args, knownEdges, ga, x)
+    printKnownEdges(args, predecessors(x), ga, x)
 
 
 ########################################################
@@ -455,7 +476,7 @@ def loadGraph(fname):
   return (g, ga, res)
 
 
-def selectRoots(args, g, ga, res):
+def selectRoots(args, g, ga, res, li):
   roots = {}
 
   for x in list(g.keys()):
@@ -463,8 +484,11 @@ def selectRoots(args, g, ga, res):
       roots[x] = 'rcRoot'
     elif not args.ignore_js_roots and (ga.gcNodes.get(x, False) or x in ga.incrRoots):
       roots[x] = 'gcRoot'
-    elif ga.nodeLabels.get(x, '') == args.node_roots:
-      roots[x] = 'stopNodeLabel'
+
+  if args.node_roots != None:
+    for x in label_index.labelNodes(li, args.node_roots):
+      if not x in roots:
+        roots[x] = 'stopNodeLabel'
 
   return roots
 
@@ -473,7 +497,7 @@ targetDebug = False
 addrPatt = re.compile('[A-F0-9]+$|0x[a-f0-9]+$')
 
 
-def selectTargets (g, ga, target):
+def selectTargets (g, ga, li, target):
   if addrPatt.match(target):
     if targetDebug:
       print('Address matched.')
@@ -483,13 +507,11 @@ def selectTargets (g, ga, target):
     print('No address found in target.')
     exit(0)
 
-  targs = []
-
   # Magic target: look for an nsFrameLoader with a refcount of 1.
   if target == 'nsFrameLoader1':
-    target = 'nsFrameLoader'
-    for x in list(g.keys()):
-      if ga.nodeLabels.get(x, '')[0:len(target)] == target and ga.rcNodes[x] == 1:
+    targs = []
+    for x in label_index.prefixNodes(li, 'nsFrameLoader'):
+      if ga.rcNodes.get(x) == 1:
         targs.append(x)
     if len(targs) == 0:
       print('Didn\'t find any nsFrameLoaders with refcount of 1')
@@ -497,9 +519,7 @@ def selectTargets (g, ga, target):
     return targs
 
   # look for objects with a class name prefix, not a particular object
-  for x in list(g.keys()):
-    if ga.nodeLabels.get(x, '')[0:len(target)] == target:
-      targs.append(x)
+  targs = label_index.prefixNodes(li, target)
   if targs == []:
     sys.stdout.write('Didn\'t find any targets.\n')
     #sys.stdout.write('Guessing that argument ' + target + ' is an address.\n')
@@ -508,23 +528,49 @@ def selectTargets (g, ga, target):
   return targs
 
 
+# Answer every question with one index, instead of a search for each.
+def printReachable(args, g, ga, targs):
+  (ids, idx) = reachability.dictGraphIndex(g)
+  for src in args.reachable_from:
+    for a in targs:
+      if reachability.addrReaches(ids, idx, src, a):
+        print(src, 'reaches', end=' ')
+      else:
+        print(src, 'does not reach', end=' ')
+      print_node(ga, a)
+      print()
+
+
 def findCCRoots():
   args = parser.parse_args()
 
+  if args.reversed_graph != None:
+    args.use_dfs = True
+
   (g, ga, res) = loadGraph(args.file_name)
 
-  roots = selectRoots(args, g, ga, res)
-  targs = selectTargets(g, ga, args.target)
+  li = label_index.buildLabelIndex(g, ga.nodeLabels)
+  roots = selectRoots(args, g, ga, res, li)
+  targs = selectTargets(g, ga, li, args.target)
+
+  if args.reachable_from != None:
+    print()
+    printReachable(args, g, ga, targs)
+    return [a for a in targs if a in g]
 
   if args.output_to_file:
     args.output_file = open(args.file_name + '.out', 'w')
   else:
     args.output_file = sys.stdout
 
+  # The reversed graph is shared by every target.
+  revg = None
   for a in targs:
     if a in g:
       if args.use_dfs:
-        findRootsDFS(args, g, ga, res[0], roots, a)
+        if revg is None:
+          revg = reversedGraph(args, g)
+        findRootsDFS(args, revg, ga, res[0], roots, a)
       else:
         print()
         findRootsBFS(args, g, ga, res[0], roots, a)
@@ -534,5 +580,7 @@ def findCCRoots():
   if args.output_to_file:
     args.output_file.close()
 
+  return [a for a in targs if a in g]
+
 if __name__ == "__main__":
   findCCRoots()
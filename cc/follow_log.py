@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import sys
+import os
+import time
+import argparse
+from array import array
+from . import csr_graph
+from . import parse_cc_graph
+from . import label_index
+
+
+# Parse a CC log while Firefox is still writing it.
+#
+# Firefox writes each log to a file whose name starts with incomplete-,
+# and renames it once the log is done.  Dumping a huge log takes a long
+# time, so instead of waiting for it, a LogFollower reads whatever has
+# been written each time it is polled, and parses it with a
+# csr_graph.GraphBuilder, which appends to its arrays in place.  Only
+# complete lines are parsed, and the rest is kept for the next poll, so
+# nothing is read twice.
+#
+# LogFollower (fname, recordEdgeLabels=False): follow the log in fname.
+#
+#    - poll () parses everything that has been written since the last
+#      poll, and returns the number of lines parsed.
+#    - snapshot () returns (ig, res) for the log so far, like
+#      csr_graph.loadCCGraph.  The results are empty until the graph
+#      part of the log has been written.
+#    - finished is True once the whole log has been parsed.  A log
+#      whose name doesn't start with incomplete- is finished after the
+#      first poll.
+#
+# HolderTracker (builder, target): find the objects that hold onto the
+#   target objects as a GraphBuilder parses them.  The targets are the
+#   node whose address is target, and every node whose label starts with
+#   target.
+#
+#    - update () looks at the nodes and edges the builder has parsed since
+#      the last update, and returns a list of the new (holder, target)
+#      pairs of builder ids.  Each edge is only looked at once.
+#    - targets is a list of the builder ids of the targets found so far.
+#
+# When run on a log, this prints the objects that hold onto the target
+# as they show up, until the log is finished.
+
+
+INCOMPLETE_PREFIX = 'incomplete-'
+
+
+class LogFollower:
+  def __init__(self, fname, recordEdgeLabels=False):
+    try:
+      self.f = open(fname, 'r')
+    except:
+      sys.stderr.write('Error opening file ' + fname + '\n')
+      exit(-1)
+    self.fname = fname
+    self.incomplete = os.path.basename(fname).startswith(INCOMPLETE_PREFIX)
+    self.builder = csr_graph.GraphBuilder(recordEdgeLabels)
+    self.graphDone = False
+    self.knownEdges = {}
+    self.garbage = set([])
+    # The start of a line that hasn't been finished yet.
+    self.partial = ''
+    self.finished = False
+
+  def poll(self):
+    if self.finished:
+      return 0
+
+    # Check whether the log has been renamed before reading, so that
+    # everything written before then is read.
+    done = not self.incomplete or not os.path.exists(self.fname)
+    data = self.partial + self.f.read()
+    if done:
+      end = len(data)
+    else:
+      end = data.rfind('\n') + 1
+    self.partial = data[end:]
+    lines = data[:end].splitlines(True)
+
+    rest = iter(lines)
+    if not self.graphDone:
+      self.graphDone = self.builder.parseLines(rest)
+    if self.graphDone:
+      (knownEdges, garbage) = parse_cc_graph.parseResults(rest)
+      self.knownEdges.update(knownEdges)
+      self.garbage |= garbage
+
+    if done:
+      self.finished = True
+      self.f.close()
+    return len(lines)
+
+  def snapshot(self):
+    return (self.builder.snapshot(), (dict(self.knownEdges), set(self.garbage)))
+
+
+# The label of a node is only known once its own line has been parsed,
+# which is often after edges to it have been.  The holders of nodes that
+# haven't been described yet are kept in pending until they are, and are
+# then either reported or dropped.
+class HolderTracker:
+  def __init__(self, builder, target):
+    self.builder = builder
+    self.target = target
+    self.targets = []
+    self.isTarget = set([])
+    self.pending = {}
+    self.rowsSeen = 0
+    self.edgesSeen = 0
+
+  def addTarget(self, y, found):
+    if y in self.isTarget:
+      return
+    self.targets.append(y)
+    self.isTarget.add(y)
+    for x in self.pending.pop(y, []):
+      found.append((x, y))
+
+  def update(self):
+    b = self.builder
+    found = []
+
+    x = b.ids.get(self.target)
+    if x is not None:
+      self.addTarget(x, found)
+
+    # Every newly described node either is a target or can't become one.
+    newRows = b.rows[self.rowsSeen:]
+    newLabels = {}
+    for y in newRows:
+      newLabels[y] = b.labelNames[b.labels[y]]
+    li = label_index.buildLabelIndex(newRows, newLabels)
+    for y in label_index.prefixNodes(li, self.target):
+      self.addTarget(y, found)
+    for y in newRows:
+      if not y in self.isTarget:
+        self.pending.pop(y, None)
+
+    # The new edges start in the last row that was already seen.
+    numRows = len(b.rows)
+    numEdges = len(b.targets)
+    for r in range(max(self.rowsSeen - 1, 0), numRows):
+      x = b.rows[r]
+      end = b.rowOffsets[r + 1] if r + 1 < numRows else numEdges
+      for j in range(max(b.rowOffsets[r], self.edgesSeen), end):
+        y = b.targets[j]
+        if y in self.isTarget:
+          found.append((x, y))
+        elif b.kinds[y] == csr_graph.MISSING:
+          self.pending.setdefault(y, array('i')).append(x)
+
+    self.rowsSeen = numRows
+    self.edgesSeen = numEdges
+    return found
+
+
+####
+#### Command line
+####
+
+parser = argparse.ArgumentParser(description='Follow a CC log while it is being written, and print what holds onto an object.')
+
+parser.add_argument('file_name',
+                    help='cycle collector graph file name, usually starting with incomplete-')
+
+parser.add_argument('target',
+                    help='address of the target object, or a prefix of the class name of the target objects')
+
+parser.add_argument('--interval', dest='interval', type=float,
+                    default=5.0,
+                    help='Number of seconds to wait between reading the log.')
+
+
+def nodeString (b, x):
+  return '{0} [{1}]'.format(b.names[x], b.labelNames[b.labels[x]])
+
+
+def followLog ():
+  args = parser.parse_args()
+
+  follower = LogFollower(args.file_name)
+  b = follower.builder
+  tracker = HolderTracker(b, args.target)
+  printed = set([])
+
+  while True:
+    if follower.poll() != 0:
+      print('Read', len(b.rows), 'nodes and', len(b.targets), 'edges.')
+      for (x, y) in tracker.update():
+        if not (x, y) in printed:
+          printed.add((x, y))
+          print('   ', nodeString(b, x), '-->', nodeString(b, y))
+      sys.stdout.flush()
+
+    if follower.finished:
+      break
+    time.sleep(args.interval)
+
+  print('The log is complete.')
+  for y in tracker.targets:
+    if b.names[y] in follower.garbage:
+      print(nodeString(b, y), 'is garbage.')
+    else:
+      print(nodeString(b, y), 'is alive.')
+
+
+if __name__ == "__main__":
+  followLog()
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Library for searching a graph with extra nodes and edges, or with
+# parts of it hidden, without changing the graph itself.
+#
+# The graph and its edge labels, as produced by parse_cc_graph or
+# parse_gc_graph, are never modified, so one loaded graph can be
+# searched by many queries, even at the same time from different
+# threads.  Anything a query needs to add or hide goes in an Overlay,
+# which belongs to that query.
+#
+# START: a virtual node that isn't in any graph, whose successors are
+#   the roots of the overlay.  Searches start here.
+#
+# makeOverlay (roots, extraEdges=None, excludedNodes=None,
+#   excludedLabels=None, expandOnly=None): returns an Overlay.
+#
+#    - roots is a collection of the successors of START.
+#    - extraEdges maps nodes to collections of successors they have
+#      in addition to the ones in the graph.
+#    - excludedNodes is a set of nodes that are never visited.
+#    - excludedLabels is a set of edge labels.  An edge is skipped if
+#      it has at least one label, and all of them are in this set.
+#    - expandOnly is None, or a set of nodes.  If it is a set, only
+#      the edges from nodes in the set are followed.  Other nodes can
+#      still be reached, but the search stops there.  For example,
+#      this can be used to only look at paths through black nodes.
+#
+# successors (g, edgeLabels, ov, x): the successors of x in the graph
+#   g with the overlay ov.  edgeLabels is only used if ov has
+#   excludedLabels.
+#
+# EdgeLabels (edgeLabels): a view of the edge labels of a graph that
+#   can have more labels added to it by a query, like the labels of
+#   extra edges, without changing the original.  It can be used in
+#   place of edgeLabels, via ga._replace(edgeLabels=EdgeLabels(...)).
+#   addLabel (x, y, lbl) adds a label to the edge from x to y.
+
+
+import itertools
+from collections import namedtuple
+
+
+START = 'FAKE START OBJECT'
+
+Overlay = namedtuple('Overlay', 'roots extraEdges excludedNodes excludedLabels expandOnly')
+
+
+def makeOverlay (roots, extraEdges=None, excludedNodes=None, excludedLabels=None, expandOnly=None):
+  return Overlay(roots=roots, extraEdges=extraEdges or {},
+                 excludedNodes=excludedNodes or set([]),
+                 excludedLabels=excludedLabels or set([]),
+                 expandOnly=expandOnly)
+
+
+def labelsExcluded (ov, lbls):
+  if not lbls:
+    return False
+  for l in lbls:
+    if not l in ov.excludedLabels:
+      return False
+  return True
+
+
+def successors (g, edgeLabels, ov, x):
+  if x == START:
+    succs = ov.roots
+  elif ov.expandOnly is not None and not x in ov.expandOnly:
+    return ()
+  else:
+    succs = g.get(x, ())
+    extra = ov.extraEdges.get(x)
+    if extra:
+      succs = itertools.chain(succs, extra)
+
+  if ov.excludedNodes:
+    succs = [y for y in succs if not y in ov.excludedNodes]
+  if ov.excludedLabels:
+    lbls = edgeLabels.get(x, {})
+    succs = [y for y in succs if not labelsExcluded(ov, lbls.get(y))]
+  return succs
+
+
+class EdgeLabels:
+  def __init__(self, edgeLabels):
+    self.base = edgeLabels
+    self.extra = {}
+
+  def addLabel(self, x, y, lbl):
+    self.extra.setdefault(x, {}).setdefault(y, []).append(lbl)
+
+  def __contains__(self, x):
+    return x in self.base or x in self.extra
+
+  def __getitem__(self, x):
+    if not x in self.extra:
+      return self.base[x]
+    # Merge the labels into a new map, so the original isn't changed.
+    lbls = dict(self.base.get(x, {}))
+    for y, l in self.extra[x].items():
+      lbls[y] = lbls.get(y, []) + l
+    return lbls
+
+  def get(self, x, default=None):
+    if not x in self:
+      return default
+    return self[x]
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Sorted index of node labels, for fast class name prefix queries.
+#
+# buildLabelIndex (nodes, nodeLabels): build an index over the labels of
+#   the given nodes.  Nodes without a label are indexed under ''.  The
+#   index contains the nodes in the order they were passed in, the
+#   sorted list of unique labels, and for each label a posting list of
+#   the positions in nodes of the nodes that have that label, in
+#   increasing order.
+#
+# prefixNodes (li, prefix): return a list of every node whose label
+#   starts with prefix, in the order they were passed in.  Finding the
+#   range of matching labels uses bisect, so this is logarithmic in the
+#   number of distinct labels, plus the size of the result times the
+#   log of the number of matching labels, for merging their postings.
+#
+# labelNodes (li, label): return a list of every node whose label is
+#   exactly label, in the order they were passed in.
+#
+# This works for both CC and GC graphs, as it only relies on nodeLabels.
+
+
+from bisect import bisect_left
+from collections import namedtuple
+from heapq import merge
+
+
+LabelIndex = namedtuple('LabelIndex', 'nodes labels postings')
+
+
+def buildLabelIndex (nodes, nodeLabels):
+  nodes = list(nodes)
+  postings = {}
+  for i, x in enumerate(nodes):
+    postings.setdefault(nodeLabels.get(x, ''), []).append(i)
+
+  labels = sorted(postings)
+  return LabelIndex(nodes=nodes, labels=labels, postings=[postings[l] for l in labels])
+
+
+# Return the range [lo, hi) of labels that start with prefix.
+def prefixRange (li, prefix):
+  lo = bisect_left(li.labels, prefix)
+  if prefix == '':
+    return (lo, len(li.labels))
+  # Every label with the prefix sorts before the prefix with its last
+  # character bumped up by one.
+  upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+  return (lo, bisect_left(li.labels, upper, lo))
+
+
+def prefixNodes (li, prefix):
+  (lo, hi) = prefixRange(li, prefix)
+  nodes = li.nodes
+  return [nodes[i] for i in merge(*li.postings[lo:hi])]
+
+
+def labelNodes (li, label):
+  i = bisect_left(li.labels, label)
+  if i < len(li.labels) and li.labels[i] == label:
+    return [li.nodes[j] for j in li.postings[i]]
+  return []
@@ -0,0 +1,324 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import sys
+import argparse
+from . import parse_cc_graph
+from . import node_parse_cc_graph
+from . import census
+
+
+# Run several analyses of a CC log in a single pass over the file.
+#
+# dup_parents, edge_counter, refcount_checker, mark_remover and census
+# each read the entire log with their own loop, which is slow for
+# multi-gigabyte logs.  Here, the log is tokenized once, and each line
+# is handed to every analysis that is interested in it.  Each analysis
+# is a subclass of Analysis that overrides the callbacks it needs.
+# Once the whole log has been read, the report of each analysis is
+# printed, in the order the analyses were given.
+#
+# Edges are not matched with a regexp, and are only split into a
+# target and a label if some analysis has an edge callback, so the
+# cost of the pass is about the same as a single analysis.
+
+
+parser = argparse.ArgumentParser(description='Run several analyses of a cycle collector log in a single pass.')
+
+parser.add_argument('file_name',
+                    help='cycle collector graph file name')
+
+parser.add_argument('--census', dest='census', action='store_true',
+                    default=False,
+                    help='Summarize the classes of live objects, like census.py.')
+
+parser.add_argument('--dup-parents', dest='dup_parents', action='store_true',
+                    default=False,
+                    help='Find nodes with more than one parent edge, like dup_parents.py.')
+
+parser.add_argument('--edge-count', dest='edge_count_class', metavar='CLASS',
+                    default=None,
+                    help='Count the edges of each object with this label, like edge_counter.py.')
+
+parser.add_argument('--refcounts', dest='refcounts', action='store_true',
+                    default=False,
+                    help='Find ref counted objects with more references than their ref count, like refcount_checker.py.')
+
+parser.add_argument('--remove-marked', dest='remove_marked_file', metavar='FILE',
+                    default=None,
+                    help='Write a copy of the graph without marked GC objects to this file, like mark_remover.py.')
+
+
+####
+#### Analyses
+####
+
+# Base class for analyses.  Each callback is also given the raw line,
+# for analyses that want to echo the log.
+class Analysis:
+  name = None
+
+  # nodeTy is 'gc', 'gc.marked' or 'rc=N'.
+  def node(self, addr, nodeTy, label, l):
+    pass
+
+  # Only called for edges from nodes.  src is the address of the node.
+  def edge(self, src, dst, label, l):
+    pass
+
+  # Comments, weak map entries, incremental roots and the line
+  # separating the graph from the results.
+  def other(self, l):
+    pass
+
+  # Called with the results of the cycle collector.  Only parsed if
+  # some analysis overrides this.
+  def results(self, knownEdges, garbage):
+    pass
+
+  def report(self):
+    pass
+
+
+class CensusAnalysis(Analysis):
+  name = 'census'
+
+  def __init__(self, fname):
+    self.args = census.parser.parse_args([fname])
+    self.nodes = set([])
+    self.ga = node_parse_cc_graph.GraphAttribs(nodeLabels={}, rcNodes={}, gcNodes={})
+    self.garbage = set([])
+
+  def node(self, addr, nodeTy, label, l):
+    self.nodes.add(addr)
+    self.ga.nodeLabels[addr] = label
+    if nodeTy == 'gc':
+      self.ga.gcNodes[addr] = False
+    elif nodeTy == 'gc.marked':
+      self.ga.gcNodes[addr] = True
+    else:
+      self.ga.rcNodes[addr] = int(nodeTy[3:])
+
+  def results(self, knownEdges, garbage):
+    self.garbage = garbage
+
+  def report(self):
+    census.analyze_nodes(self.args, self.nodes, self.ga, self.garbage)
+
+
+class DupParentsAnalysis(Analysis):
+  name = 'duplicate parents'
+
+  def __init__(self):
+    # Map from the number of extra parent edges to the number of nodes
+    # with that many.
+    self.numDups = {}
+    self.dupNodes = []
+    self.currNode = None
+
+  def endNode(self):
+    if self.currNode is None:
+      return
+    self.numDups[self.currDups] = self.numDups.get(self.currDups, 0) + 1
+    if self.currDups > 0:
+      self.dupNodes.append((self.currDups, self.currNode, self.currLabel))
+
+  def node(self, addr, nodeTy, label, l):
+    self.endNode()
+    self.currNode = addr
+    self.currLabel = label
+    self.foundParent = False
+    self.currDups = 0
+
+  def edge(self, src, dst, label, l):
+    if label == 'parent':
+      if self.foundParent:
+        self.currDups += 1
+      else:
+        self.foundParent = True
+
+  def report(self):
+    self.endNode()
+    self.currNode = None
+    for (dups, addr, label) in self.dupNodes:
+      print(dups, addr, label)
+    print(self.numDups)
+
+
+class EdgeCountAnalysis(Analysis):
+  name = 'edge counts'
+
+  def __init__(self, className):
+    self.className = className
+    self.counts = {}
+
+  def node(self, addr, nodeTy, label, l):
+    if label == self.className:
+      self.counts[addr] = 0
+
+  def edge(self, src, dst, label, l):
+    if src in self.counts:
+      self.counts[src] += 1
+
+  def report(self):
+    buckets = {}
+    for x, k in self.counts.items():
+      if k > 1:
+        print('%(num)8d %(label)s' % {'num':k, 'label':x})
+        buckets[k] = buckets.get(k, 0) + 1
+    print(buckets)
+
+
+class RefcountAnalysis(Analysis):
+  name = 'ref counts'
+
+  def __init__(self):
+    self.rcs = {}
+    self.referents = {}
+
+  def node(self, addr, nodeTy, label, l):
+    if nodeTy != 'gc' and nodeTy != 'gc.marked':
+      self.rcs[addr] = int(nodeTy[3:])
+
+  def edge(self, src, dst, label, l):
+    self.referents[dst] = self.referents.get(dst, 0) + 1
+
+  def report(self):
+    for x, rc in self.rcs.items():
+      if rc < self.referents.get(x, 0):
+        print('Object %s has refcount %d but saw %d references to it' % (x, rc, self.referents[x]))
+
+
+# Echo the graph, minus the marked GC nodes and their edges.  Unlike
+# mark_remover.py, edges to marked nodes are kept, as a node may be
+# logged after edges to it.  The results are not echoed, as they refer
+# to the original graph.
+class MarkRemoverAnalysis(Analysis):
+  name = 'mark remover'
+
+  def __init__(self, fname):
+    self.fname = fname
+    try:
+      self.outf = open(fname, 'w')
+    except:
+      sys.stderr.write('Error opening file ' + fname + '\n')
+      exit(-1)
+    self.inMarked = False
+    self.numRemoved = 0
+
+  def node(self, addr, nodeTy, label, l):
+    self.inMarked = nodeTy == 'gc.marked'
+    if self.inMarked:
+      self.numRemoved += 1
+    else:
+      self.outf.write(l)
+
+  def edge(self, src, dst, label, l):
+    if not self.inMarked:
+      self.outf.write(l)
+
+  def other(self, l):
+    self.inMarked = False
+    self.outf.write(l)
+
+  def report(self):
+    self.outf.close()
+    print('Removed', self.numRemoved, 'marked nodes. Wrote the rest of the graph to', self.fname)
+
+
+####
+#### Log streaming
+####
+
+def overrides(a, method):
+  return getattr(type(a), method) is not getattr(Analysis, method)
+
+
+def runPipeline(f, analyses):
+  nodeFns = [a.node for a in analyses if overrides(a, 'node')]
+  edgeFns = [a.edge for a in analyses if overrides(a, 'edge')]
+  otherFns = [a.other for a in analyses if overrides(a, 'other')]
+  resultFns = [a.results for a in analyses if overrides(a, 'results')]
+  nodePatt = parse_cc_graph.nodePatt
+
+  currNode = None
+
+  for l in f:
+    if l[0] == '>':
+      if edgeFns:
+        # Avoid regexps for edges, as there are many more edges than nodes.
+        end = l.find(' ', 2)
+        if end == -1:
+          dst = l[2:].rstrip()
+          label = ''
+        else:
+          dst = l[2:end]
+          label = l[end + 1:].rstrip('\r\n')
+        for fn in edgeFns:
+          fn(currNode, dst, label, l)
+      continue
+
+    nm = nodePatt.match(l)
+    if nm:
+      currNode = nm.group(1)
+      for fn in nodeFns:
+        fn(currNode, nm.group(2), nm.group(3), l)
+      continue
+
+    for fn in otherFns:
+      fn(l)
+    if l[:10] == '==========':
+      break
+    if not (l[0] == '#' or parse_cc_graph.weakMapEntryPatt.match(l) or
+            parse_cc_graph.incrRootPatt.match(l)):
+      sys.stderr.write('Error: skipping unknown line:' + l[:-1] + '\n')
+
+  if resultFns:
+    (knownEdges, garbage) = parse_cc_graph.parseResults(f)
+    for fn in resultFns:
+      fn(knownEdges, garbage)
+
+
+def selectAnalyses(args):
+  analyses = []
+  if args.census:
+    analyses.append(CensusAnalysis(args.file_name))
+  if args.dup_parents:
+    analyses.append(DupParentsAnalysis())
+  if args.edge_count_class != None:
+    analyses.append(EdgeCountAnalysis(args.edge_count_class))
+  if args.refcounts:
+    analyses.append(RefcountAnalysis())
+  if args.remove_marked_file != None:
+    analyses.append(MarkRemoverAnalysis(args.remove_marked_file))
+  return analyses
+
+
+def logPipeline():
+  args = parser.parse_args()
+
+  analyses = selectAnalyses(args)
+  if not analyses:
+    sys.stderr.write('Expected at least one analysis to be selected.\n')
+    exit(-1)
+
+  try:
+    f = open(args.file_name, 'r')
+  except:
+    sys.stderr.write('Error opening file ' + args.file_name + '\n')
+    exit(-1)
+
+  runPipeline(f, analyses)
+  f.close()
+
+  for a in analyses:
+    print('====', a.name, '====')
+    a.report()
+    print()
+
+
+if __name__ == "__main__":
+  logPipeline()
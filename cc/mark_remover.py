@@ -1,155 +1,142 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 # Create a version of the CC log with the marked GC objects removed.
-# Should we remove all references to that object, too?  That would be
-# trickier and may require two passes.
+# This is useful for shrinking logs before archiving them, as marked
+# objects can't be garbage, and are often most of the log.
+#
+# The log is read once.  Whether a node is marked is given in the
+# line that starts the node, so each node and its edges are either
+# echoed or skipped as they are read, without holding anything else.
+# The results are not echoed, as they refer to the original graph.
+#
+# With --remove-edges, edges to marked objects are removed, too.  A
+# node may be logged after edges to it, so this can't be done in the
+# same pass.  Instead, the addresses of the marked nodes are kept in a
+# sorted array of 64-bit integers, which takes 8 bytes per marked node,
+# and the output, which is much smaller than the original log, is
+# filtered in a second pass.
+
 
 import sys
-import re
-from collections import namedtuple
+import os
+import argparse
+import tempfile
+from array import array
+from bisect import bisect_left
+from . import parse_cc_graph
 
 
-####
-####  Log parsing
-####
+parser = argparse.ArgumentParser(description='Remove marked GC objects from a cycle collector log.')
 
-nodePatt = re.compile ('([a-zA-Z0-9]+) \[(rc=[0-9]+|gc(?:.marked)?)\] ([^\r\n]*)\r?$')
-edgePatt = re.compile ('> ([a-zA-Z0-9]+) ([^\r\n]*)\r?$')
+parser.add_argument('file_name',
+                    help='cycle collector graph file name')
 
+parser.add_argument('--output', '-o', dest='output_file_name',
+                    default=None,
+                    help='Write the log to this file instead of stdout.')
 
-def getMarkedNodes (f):
-  # first, compute the set of marked JS nodes
-  markedNodes = set([])
+parser.add_argument('--remove-edges', '-re', dest='remove_edges', action='store_true',
+                    default=False,
+                    help='Also remove edges to marked objects.  This requires a second pass over the output.')
 
-  for l in f:
-    if l[0] == '>':
-      continue
-    else:
-      nm = nodePatt.match(l)
-      if nm:
-        currNode = nm.group(1)
-        nodeTy = nm.group(2)
-        if nodeTy == 'gc.marked':
-          markedNodes.add(currNode)
-      elif l[:10] == '==========':
-        break
-      else:
-        sys.stderr.write('Error: Unknown line:' + l[:-1])
 
-  return markedNodes
+####
+####  Log filtering
+####
+
+nodePatt = parse_cc_graph.nodePatt
 
 
-def echoNonMarkedNodes (f, markedNodes):
+# Echo every line from f to outf, except for marked nodes and their
+# edges.  If marked is not None, the address of each marked node is
+# appended to it.  Returns the number of marked nodes.
+def removeMarkedNodes (f, outf, marked):
   inMarked = False
+  numMarked = 0
 
   for l in f:
     if l[0] == '>':
       if not inMarked:
-        e = edgePatt.match(l)
-        assert(currNode != None)
-        target = e.group(1)
-        if not target in markedNodes:
-          sys.stdout.write(l)
-    else:
-      nm = nodePatt.match(l)
-      if nm:
-        currNode = nm.group(1)
-        nodeTy = nm.group(2)
-        if nodeTy == 'gc.marked':
-          inMarked = True
-        else:
-          inMarked = False
-          sys.stdout.write(l)
-      elif l[:10] == '==========':
-        sys.stdout.write(l)
-        break
-      else:
-        print 'Error: Unknown line:', l[:-1]
-  
-
-
-resultPatt = re.compile ('([a-zA-Z0-9]+) \[([a-z0-9=]+)\]\w*')
-knownPatt = re.compile ('known=(\d+)')
-
-
-def parseResults (f):
-  garbage = set([])
-  knownEdges = {}
+        outf.write(l)
+      continue
 
-  for l in f:
-    rm = resultPatt.match(l)
-    if rm:
-      obj = rm.group(1)
-      tag = rm.group(2)
-      if tag == 'garbage':
-        assert(not obj in garbage)
-        garbage.add(obj)
-      else:
-        km = knownPatt.match(tag)
-        if km:
-          assert (not obj in knownEdges)
-          knownEdges[obj] = int(km.group(1))
-        else:
-          print 'Error: Unknown result entry type:', tag
+    nm = nodePatt.match(l)
+    if nm:
+      inMarked = nm.group(2) == 'gc.marked'
+      if inMarked:
+        numMarked += 1
+        if marked is not None:
+          marked.append(int(nm.group(1), 16))
+        continue
     else:
-      print 'Error: Unknown result entry:', l[:-1]
-
-  return (knownEdges, garbage)
-
+      inMarked = False
+    outf.write(l)
+    if l[:10] == '==========':
+      break
 
-def parseCCEdgeFile (fname):
-  try:
-    f = open(fname, 'r')
-  except:
-    print 'Error opening file', fname
-    exit(-1)
-
-  markedNodes = getMarkedNodes (f)
-  f.close()
-
-  try:
-    f = open(fname, 'r')
-  except:
-    print 'Error opening file', fname
-    exit(-1)
+  return numMarked
 
-  echoNonMarkedNodes(f, markedNodes)
 
-  f.close()
+def isMarked (marked, addr):
+  i = bisect_left(marked, addr)
+  return i < len(marked) and marked[i] == addr
 
 
-# Some applications may not care about multiple edges.
-# They can instead use a single graph, which is represented as a map
-# from a source node to a set of its destinations.
-def toSinglegraph (gm):
-  g = {}
-  for src, dsts in gm.iteritems():
-    d = set([])
-    for dst, k in dsts.iteritems():
-      d.add(dst)
-    g[src] = d
-  return g
-
-
-def reverseMultigraph (gm):
-  gm2 = {}
-  for src, dsts in gm.iteritems():
-    if not src in gm2:
-      gm2[src] = {}
-    for dst, k in dsts.iteritems():
-      gm2.setdefault(dst, {})[src] = k
-  return gm2
+# Echo every line from f to outf, except for edges to nodes in the
+# sorted array marked.  Returns the number of edges removed.
+def removeMarkedEdges (f, outf, marked):
+  numRemoved = 0
 
+  for l in f:
+    if l[0] == '>':
+      end = l.find(' ', 2)
+      if end == -1:
+        end = len(l.rstrip())
+      if isMarked(marked, int(l[2:end], 16)):
+        numRemoved += 1
+        continue
+    outf.write(l)
 
-if len(sys.argv) < 2:
-  print 'Not enough arguments.'
-  exit()
+  return numRemoved
 
-parseCCEdgeFile(sys.argv[1])
 
+def markRemover ():
+  args = parser.parse_args()
 
+  try:
+    f = open(args.file_name, 'r')
+  except:
+    sys.stderr.write('Error opening file ' + args.file_name + '\n')
+    exit(-1)
 
+  if args.output_file_name:
+    outf = open(args.output_file_name, 'w')
+  else:
+    outf = sys.stdout
+
+  if not args.remove_edges:
+    numMarked = removeMarkedNodes(f, outf, None)
+    f.close()
+    sys.stderr.write('Removed {0} marked nodes.\n'.format(numMarked))
+  else:
+    marked = array('Q')
+    tmpf = tempfile.TemporaryFile('w+', dir=os.path.dirname(args.output_file_name or '.') or '.')
+    numMarked = removeMarkedNodes(f, tmpf, marked)
+    f.close()
+    marked = array('Q', sorted(marked))
+
+    tmpf.seek(0)
+    numEdges = removeMarkedEdges(tmpf, outf, marked)
+    tmpf.close()
+    sys.stderr.write('Removed {0} marked nodes and {1} edges to them.\n'.format(numMarked, numEdges))
+
+  if args.output_file_name:
+    outf.close()
+
+
+if __name__ == "__main__":
+  markRemover()
@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Library for collapsing a graph into a much smaller graph of classes.
+#
+# Questions like "what holds onto objects of class X" only care about
+# the classes of the objects involved, so they can be answered on a
+# quotient graph that has one node per class, instead of on the full
+# graph, which can have millions of nodes.
+#
+# quotientGraph (offsets, targets, classOf, classNames, classIds=None):
+#   build the quotient of a CSR graph, in one pass over its edges.
+#   classOf maps each node id to a class id, or -1 to leave the node
+#   out, classNames maps class ids to names, and classIds maps names
+#   back to class ids.  If classIds isn't given, it is computed from
+#   classNames.  Returns a QuotientGraph:
+#
+#      - classNames, classIds and classOf are as passed in, so results
+#        can be mapped back to nodes, and classes can be looked up by
+#        name.
+#      - nodeCounts holds the number of nodes in each class.
+#      - edges maps each class to a map from classes to weights.  The
+#        weight of the edge from class a to class b is the number of
+#        pairs of nodes x and y where x is in a, y is in b and x has
+#        at least one edge to y.  Multiple edges from x to y are only
+#        counted once.
+#
+# labelClasses (ig, canonicalize=None): compute classOf, classNames
+#   and classIds for an IntGraph from csr_graph, putting nodes with the
+#   same label into the same class.  If canonicalize is given, it is
+#   called once on each distinct label, and labels that canonicalize
+#   to the same string are put into the same class.
+#
+# canonicalLabel (l): combine similar labels, like all XUL elements,
+#   JS objects of the same class with different globals, strings and
+#   symbols with different contents, or labels that only differ in the
+#   addresses they contain.  Can be passed as canonicalize.
+#
+# classGraph (ig, canonicalize=None): the quotient of an IntGraph by
+#   labelClasses.
+#
+# predecessorClasses (qg, c): return a map from each class with an
+#   edge to class c to the weight of that edge.
+#
+# writeDotFile (qg, fname, minWeight=1): write out the quotient graph
+#   as a .dot file, leaving out edges with a weight less than
+#   minWeight, and classes without any edges that are left.
+
+
+import sys
+import re
+from array import array
+from collections import namedtuple
+
+
+QuotientGraph = namedtuple('QuotientGraph', 'classNames classIds classOf nodeCounts edges')
+
+
+def quotientGraph (offsets, targets, classOf, classNames, classIds=None):
+  if classIds is None:
+    classIds = dict([(name, c) for c, name in enumerate(classNames)])
+  nodeCounts = array('q', [0]) * len(classNames)
+  edges = {}
+
+  for x in range(len(classOf)):
+    cx = classOf[x]
+    if cx == -1:
+      continue
+    nodeCounts[cx] += 1
+
+    start = offsets[x]
+    end = offsets[x + 1]
+    if start == end:
+      continue
+    if end - start == 1:
+      succs = targets[start:end]
+    else:
+      succs = set(targets[start:end])
+
+    row = edges.setdefault(cx, {})
+    for y in succs:
+      cy = classOf[y]
+      if cy != -1:
+        row[cy] = row.get(cy, 0) + 1
+
+  return QuotientGraph(classNames=classNames, classIds=classIds, classOf=classOf,
+                       nodeCounts=nodeCounts, edges=edges)
+
+
+startsWith = ['nsGenericElement (XUL)', 'nsGenericElement (xhtml)', 'nsGenericElement (XBL)',
+              'nsNodeInfo (XUL)', 'nsNodeInfo (xhtml)', 'nsNodeInfo (XBL)',
+              'nsXPCWrappedJS', 'JS Object (XULElement)',
+              'nsDocument normal (xhtml)',
+              'nsDocument (xhtml)',
+              'XPCWrappedNative', 'nsJSScriptTimeoutHandler',
+              'nsGenericElement (SVG)',]
+
+objPatt = re.compile (r'(JS Object \([^\)]+\)) \(global=[0-9a-fA-F]*\)')
+addrPatt = re.compile(r'0x[0-9a-fA-F]+')
+
+
+def canonicalLabel (l):
+  for s in startsWith:
+    if l.startswith(s):
+      return s
+  om = objPatt.match(l)
+  if om:
+    return om.group(1)
+  if l.startswith('string ') or l.startswith('substring '):
+    return l.split(' ', 1)[0]
+  if l.startswith('symbol '):
+    return 'symbol'
+  return addrPatt.sub('*', l)
+
+
+def labelClasses (ig, canonicalize=None):
+  # The class of each label id, or -1 if it hasn't been seen yet.
+  labelClass = array('i', [-1]) * len(ig.labelNames)
+  classIds = {}
+  classNames = []
+
+  classOf = array('i', [0]) * len(ig.names)
+  for x in range(len(ig.names)):
+    lbl = ig.labels[x]
+    c = labelClass[lbl]
+    if c == -1:
+      name = ig.labelNames[lbl]
+      if canonicalize:
+        name = canonicalize(name)
+      c = classIds.get(name)
+      if c is None:
+        c = len(classNames)
+        classIds[name] = c
+        classNames.append(name)
+      labelClass[lbl] = c
+    classOf[x] = c
+
+  return (classOf, classNames, classIds)
+
+
+def classGraph (ig, canonicalize=None):
+  (classOf, classNames, classIds) = labelClasses(ig, canonicalize)
+  return quotientGraph(ig.offsets, ig.targets, classOf, classNames, classIds)
+
+
+def predecessorClasses (qg, c):
+  preds = {}
+  for a, row in qg.edges.items():
+    w = row.get(c)
+    if w:
+      preds[a] = w
+  return preds
+
+
+def writeDotFile (qg, fname, minWeight=1):
+  try:
+    f = open(fname, 'w')
+  except:
+    sys.stderr.write('Error opening file ' + fname + '\n')
+    exit(-1)
+
+  f.write('digraph classes {\n')
+
+  shown = set([])
+  for a, row in qg.edges.items():
+    for b, w in row.items():
+      if w >= minWeight:
+        shown.add(a)
+        shown.add(b)
+
+  for c in sorted(shown):
+    name = qg.classNames[c].replace('\\', '\\\\').replace('"', '\\"')
+    f.write('  c{0} [label="{1} ({2})"];\n'.format(c, name, qg.nodeCounts[c]))
+
+  for a, row in sorted(qg.edges.items()):
+    for b, w in sorted(row.items()):
+      if w >= minWeight:
+        f.write('  c{0} -> c{1} [label="{2}", penwidth={3}];\n'.format(a, b, w, min(1 + w.bit_length() // 2, 8)))
+
+  f.write('}\n')
+  f.close()
@@ -0,0 +1,252 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Library for answering many "does x reach y" questions about one graph.
+#
+# Each question could be answered with a search of the graph, but that
+# gets slow when there are hundreds of them.  Instead, the graph is
+# collapsed into its DAG of strongly connected components once, and
+# each component gets a few labels that answer most questions right
+# away:
+#
+#    - Components are numbered in reverse topological order, so a
+#      component can only reach components with smaller numbers.
+#    - A depth first search of the DAG numbers the components in post
+#      order.  The components in the search tree below a component c
+#      have the post order numbers treeLow[c] through post[c], so if
+#      the number of d is in that range, c reaches d.
+#    - low[c] is the smallest post order number of any component c
+#      reaches.  If c reaches d, then everything d reaches is reached
+#      by c, so low[c] <= low[d] and post[d] <= post[c].  If that
+#      doesn't hold, c doesn't reach d.
+#
+# The rest of the questions are answered with a depth first search of
+# the DAG, which uses the same labels to skip any component that can't
+# reach the target.
+#
+# buildIndex (numIds, offsets, targets): build the index for a CSR
+#   graph, like an IntGraph from csr_graph, in linear time.  Returns a
+#   ReachIndex.  sccOf maps each node id to its component, and
+#   offsets and targets hold the edges of the DAG of components.
+#
+# dictGraphIndex (g): build the index for a graph represented as a map
+#   from each node to a collection of its successors, as produced by
+#   toSinglegraph.  Returns (ids, idx), where ids maps node names to
+#   the node ids used by idx.
+#
+# reaches (idx, x, y): return True if there is a path from the node
+#   with id x to the node with id y.  Every node reaches itself.
+#
+# addrReaches (ids, idx, a, b): reaches for node names.
+
+
+from array import array
+from collections import namedtuple
+from . import csr_graph
+
+
+ReachIndex = namedtuple('ReachIndex', 'sccOf offsets targets post low treeLow')
+
+
+# Tarjan's algorithm, without recursion.  Components are numbered in
+# the order they are finished, which is reverse topological order.
+def strongComponents (numIds, offsets, targets):
+  index = array('i', [-1]) * numIds
+  lowLink = array('i', [0]) * numIds
+  onStack = bytearray(numIds)
+  sccOf = array('i', [-1]) * numIds
+  stack = []
+  counter = 0
+  numSccs = 0
+
+  for s in range(numIds):
+    if index[s] != -1:
+      continue
+    index[s] = lowLink[s] = counter
+    counter += 1
+    stack.append(s)
+    onStack[s] = 1
+    callStack = [s]
+    edgePos = [offsets[s]]
+
+    while callStack:
+      v = callStack[-1]
+      i = edgePos[-1]
+      end = offsets[v + 1]
+      descended = False
+      while i < end:
+        w = targets[i]
+        i += 1
+        if index[w] == -1:
+          edgePos[-1] = i
+          index[w] = lowLink[w] = counter
+          counter += 1
+          stack.append(w)
+          onStack[w] = 1
+          callStack.append(w)
+          edgePos.append(offsets[w])
+          descended = True
+          break
+        elif onStack[w] and index[w] < lowLink[v]:
+          lowLink[v] = index[w]
+      if descended:
+        continue
+
+      callStack.pop()
+      edgePos.pop()
+      if lowLink[v] == index[v]:
+        while True:
+          w = stack.pop()
+          onStack[w] = 0
+          sccOf[w] = numSccs
+          if w == v:
+            break
+        numSccs += 1
+      if callStack:
+        u = callStack[-1]
+        if lowLink[v] < lowLink[u]:
+          lowLink[u] = lowLink[v]
+
+  return (numSccs, sccOf)
+
+
+# The DAG of components, in CSR form, with each edge listed once.
+def condense (numIds, offsets, targets, numSccs, sccOf):
+  # Group the nodes by component with a counting sort.
+  memberOffsets = array('q', [0]) * (numSccs + 1)
+  for x in range(numIds):
+    memberOffsets[sccOf[x] + 1] += 1
+  for c in range(numSccs):
+    memberOffsets[c + 1] += memberOffsets[c]
+  nextSlot = memberOffsets[:numSccs]
+  members = array('i', [0]) * numIds
+  for x in range(numIds):
+    c = sccOf[x]
+    members[nextSlot[c]] = x
+    nextSlot[c] += 1
+
+  dagOffsets = array('q', [0])
+  dagTargets = array('i')
+  for c in range(numSccs):
+    succs = set([])
+    for j in range(memberOffsets[c], memberOffsets[c + 1]):
+      x = members[j]
+      for k in range(offsets[x], offsets[x + 1]):
+        d = sccOf[targets[k]]
+        if d != c:
+          succs.add(d)
+    dagTargets.extend(sorted(succs))
+    dagOffsets.append(len(dagTargets))
+
+  return (dagOffsets, dagTargets)
+
+
+def postOrderLabels (numSccs, offsets, targets):
+  post = array('i', [-1]) * numSccs
+  treeLow = array('i', [0]) * numSccs
+  counter = 0
+
+  # Components with larger numbers come earlier in topological order,
+  # so start from them to get bigger search trees.
+  for s in range(numSccs - 1, -1, -1):
+    if post[s] != -1:
+      continue
+    # Mark the component as visited before it gets its number.
+    post[s] = -2
+    treeLow[s] = counter
+    callStack = [s]
+    edgePos = [offsets[s]]
+    while callStack:
+      c = callStack[-1]
+      i = edgePos[-1]
+      end = offsets[c + 1]
+      while i < end and post[targets[i]] != -1:
+        i += 1
+      if i < end:
+        d = targets[i]
+        edgePos[-1] = i + 1
+        post[d] = -2
+        treeLow[d] = counter
+        callStack.append(d)
+        edgePos.append(offsets[d])
+      else:
+        callStack.pop()
+        edgePos.pop()
+        post[c] = counter
+        counter += 1
+
+  # Successors have smaller numbers, so they are done first.
+  low = array('i', post)
+  for c in range(numSccs):
+    for j in range(offsets[c], offsets[c + 1]):
+      d = targets[j]
+      if low[d] < low[c]:
+        low[c] = low[d]
+
+  return (post, low, treeLow)
+
+
+def buildIndex (numIds, offsets, targets):
+  (numSccs, sccOf) = strongComponents(numIds, offsets, targets)
+  (dagOffsets, dagTargets) = condense(numIds, offsets, targets, numSccs, sccOf)
+  (post, low, treeLow) = postOrderLabels(numSccs, dagOffsets, dagTargets)
+  return ReachIndex(sccOf=sccOf, offsets=dagOffsets, targets=dagTargets,
+                    post=post, low=low, treeLow=treeLow)
+
+
+def dictGraphIndex (g):
+  (names, ids, offsets, targets) = csr_graph.fromDictGraph(g)
+  return (ids, buildIndex(len(names), offsets, targets))
+
+
+# Return 1 if c reaches d, 0 if it doesn't, and -1 if the labels
+# can't tell.
+def checkLabels (idx, c, d):
+  if c == d:
+    return 1
+  if c < d:
+    return 0
+  postD = idx.post[d]
+  if idx.low[c] > idx.low[d] or postD > idx.post[c]:
+    return 0
+  if idx.treeLow[c] <= postD:
+    return 1
+  return -1
+
+
+def reaches (idx, x, y):
+  c = idx.sccOf[x]
+  d = idx.sccOf[y]
+  r = checkLabels(idx, c, d)
+  if r != -1:
+    return r == 1
+
+  visited = set([c])
+  workList = [c]
+  while workList:
+    e = workList.pop()
+    for j in range(idx.offsets[e], idx.offsets[e + 1]):
+      f = idx.targets[j]
+      if f in visited:
+        continue
+      visited.add(f)
+      r = checkLabels(idx, f, d)
+      if r == 1:
+        return True
+      if r == -1:
+        workList.append(f)
+
+  return False
+
+
+def addrReaches (ids, idx, a, b):
+  if a == b:
+    return True
+  x = ids.get(a)
+  y = ids.get(b)
+  if x is None or y is None:
+    return False
+  return reaches(idx, x, y)
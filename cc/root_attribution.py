@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import argparse
+from collections import deque
+from . import find_roots
+from . import label_index
+
+
+# Which roots are holding onto the most objects?
+#
+# find_roots explains why a single object is alive.  This goes the
+# other way: a breadth first search from every root at once labels each
+# object reachable from the roots with the root that reaches it first,
+# and how far away it is, in a single pass over the graph.  The number
+# of objects each root reaches first is then added up for each root,
+# for each root label, and for each kind of root.
+#
+# attributeRoots (g, roots, attribution=None): roots is a list of
+#   roots.  Returns a map from each node reachable from the roots to a
+#   pair of the root that reaches it first and its distance from that
+#   root.  When two roots reach a node at the same distance, the one
+#   that comes first in roots wins.  The CC roots are in the order
+#   find_roots.selectRoots gives them.  If attribution is given, it is
+#   extended in place, and the nodes already in it are left alone, so
+#   the roots can be searched from in groups.  g/root_attribution uses
+#   this to search from the gray roots only over the nodes that the
+#   black roots don't reach.
+#
+# rootCounts (attribution): map each root to the number of nodes it
+#   reaches first, including itself, and the greatest distance of
+#   those nodes.
+#
+# printAttribution (counts, rootKind, rootLabel, maxRoots): print out
+#   the maxRoots roots that reach the most nodes first, then the
+#   largest totals for each root label and each kind of root.
+#   rootKind and rootLabel are functions that return the kind and
+#   label of a root.
+#
+# This file can also be run on a CC log, and g/root_attribution does
+# the same for GC logs.
+
+
+def attributeRoots (g, roots, attribution=None):
+  if attribution is None:
+    attribution = {}
+  workList = deque()
+
+  for r in roots:
+    if not r in attribution:
+      attribution[r] = (r, 0)
+      workList.append(r)
+
+  while workList:
+    x = workList.popleft()
+    (r, dist) = attribution[x]
+    newAttrib = (r, dist + 1)
+    for y in g.get(x, []):
+      if not y in attribution:
+        attribution[y] = newAttrib
+        workList.append(y)
+
+  return attribution
+
+
+def rootCounts (attribution):
+  counts = {}
+  for (r, dist) in attribution.values():
+    (n, maxDist) = counts.get(r, (0, 0))
+    counts[r] = (n + 1, max(maxDist, dist))
+  return counts
+
+
+def printTotals (title, totals, maxRoots):
+  print()
+  print(title)
+  for key, (n, numRoots) in sorted(totals.items(), key=lambda kv: -kv[1][0])[:maxRoots]:
+    print('%(num)8d %(roots)6d %(key)s' % {'num':n, 'roots':numRoots, 'key':key})
+
+
+def printAttribution (counts, rootKind, rootLabel, maxRoots):
+  total = 0
+  for (n, maxDist) in counts.values():
+    total += n
+  print('Found', total, 'nodes reachable from', len(counts), 'roots.')
+
+  print()
+  print('   nodes  depth root')
+  byCount = sorted(counts.items(), key=lambda rc: -rc[1][0])
+  for (r, (n, maxDist)) in byCount[:maxRoots]:
+    print('%(num)8d %(dist)6d %(root)s [%(kind)s] %(label)s' %
+          {'num':n, 'dist':maxDist, 'root':r, 'kind':rootKind(r), 'label':rootLabel(r)})
+
+  labelTotals = {}
+  kindTotals = {}
+  for r, (n, maxDist) in counts.items():
+    for (totals, key) in [(labelTotals, rootLabel(r)), (kindTotals, rootKind(r))]:
+      (m, numRoots) = totals.get(key, (0, 0))
+      totals[key] = (m + n, numRoots + 1)
+
+  printTotals('   nodes  roots label', labelTotals, maxRoots)
+  printTotals('   nodes  roots kind', kindTotals, maxRoots)
+
+
+####
+#### CC logs
+####
+
+parser = argparse.ArgumentParser(description='Find the roots that hold onto the most objects in the cycle collector graph.')
+
+parser.add_argument('file_name',
+                    help='cycle collector graph file name')
+
+parser.add_argument('--max', dest='max_roots', type=int,
+                    default=20,
+                    help='Number of roots to print out.')
+
+parser.add_argument('-i', '--ignore-rc-roots', dest='ignore_rc_roots', action='store_true',
+                    default=False,
+                    help='ignore ref counted roots')
+
+parser.add_argument('-j', '--ignore-js-roots', dest='ignore_js_roots', action='store_true',
+                    default=False,
+                    help='ignore Javascript roots')
+
+parser.add_argument('-n', '--node-name-as-root', dest='node_roots',
+                    metavar='CLASS_NAME',
+                    help='treat nodes with this class name as extra roots')
+
+
+def ccRootKind (ga, roots, x):
+  if x in ga.incrRoots:
+    return 'incremental root'
+  if roots[x] == 'rcRoot':
+    return 'ref counted root with unknown edges'
+  if roots[x] == 'gcRoot':
+    return 'marked GC object'
+  return 'extra root class'
+
+
+def ccRootAttribution ():
+  args = parser.parse_args()
+
+  (g, ga, res) = find_roots.loadGraph(args.file_name)
+  print()
+
+  li = label_index.buildLabelIndex(g, ga.nodeLabels)
+  roots = find_roots.selectRoots(args, g, ga, res, li)
+
+  counts = rootCounts(attributeRoots(g, list(roots)))
+  printAttribution(counts, lambda x: ccRootKind(ga, roots, x),
+                   lambda x: ga.nodeLabels.get(x, ''), args.max_roots)
+
+
+if __name__ == "__main__":
+  ccRootAttribution()
@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import sys
+import signal
+import time
+import struct
+import pickle
+import argparse
+from array import array
+from multiprocessing import shared_memory
+from multiprocessing import resource_tracker
+from . import csr_graph
+
+
+# Share one parsed CC graph between several analysis processes.
+#
+# Parsing a huge log takes a long time and a lot of memory, so running
+# a few analyses on it at once means parsing it a few times.  Instead,
+# this file can be run on the log to parse it once into a csr_graph
+# IntGraph and copy it into a shared memory segment.  Any tool that
+# loads its graph with loadCCGraph below can then be given shm:NAME
+# instead of a file name, and will use the graph in the segment without
+# parsing or copying it.
+#
+# The segment starts with a header that holds the offset and length of
+# each section.  Sections are 8 byte aligned, and hold the arrays of
+# the IntGraph in native byte order, the node addresses and labels as
+# string tables, and a pickle of the few things that are small enough
+# not to matter, like the weak map entries and the CC results.
+#
+# shareGraph (ig, res, name=None): copy an IntGraph and the CC results
+#   into a new shared memory segment, and return the SharedMemory.
+#   The segment stays around until it is passed to releaseGraph, even
+#   if this process exits.
+#
+# releaseGraph (shm): close and remove a segment made by shareGraph.
+#
+# attachGraph (name): returns (ig, res) for the segment with this
+#   name.  The arrays of ig are read-only memoryviews of the segment.
+#   names and labelNames are csr_graph.StringTables, which decode each
+#   string when it is looked up, and ids is a csr_graph.AddressIndex,
+#   which does a binary search of the addresses instead of using a
+#   dict.  The segment stays mapped until the process exits.
+#
+# loadCCGraph (fname, recordEdgeLabels=False): like
+#   csr_graph.loadCCGraph, except that a name starting with shm:
+#   attaches to a shared graph.
+
+
+SHM_PREFIX = 'shm:'
+
+MAGIC = b'CCSHGRF1'
+NUM_SECTIONS = 13
+headerFormat = '8s' + 'q' * (2 * NUM_SECTIONS)
+
+# Sections, in order.
+OFFSETS = 0
+TARGETS = 1
+EDGE_LABELS = 2
+KINDS = 3
+REF_COUNTS = 4
+LABELS = 5
+INCR_ROOTS = 6
+NAME_OFFSETS = 7
+NAME_DATA = 8
+NAME_ORDER = 9
+LABEL_NAME_OFFSETS = 10
+LABEL_NAME_DATA = 11
+EXTRAS = 12
+
+sectionTypes = ['q', 'i', 'i', 'B', 'i', 'i', 'i', 'q', 'B', 'i', 'q', 'B', 'B']
+
+
+####
+####  Sharing
+####
+
+def shareGraph (ig, res, name=None):
+  (nameOffsets, nameData) = csr_graph.stringTable(ig.names)
+  (labelNameOffsets, labelNameData) = csr_graph.stringTable(ig.labelNames)
+  order = csr_graph.addressOrder(ig.names)
+  extras = pickle.dumps((ig.numNodes, ig.weakMapEntries, ig.edgeLabels is not None, res))
+
+  sections = [None] * NUM_SECTIONS
+  sections[OFFSETS] = ig.offsets
+  sections[TARGETS] = ig.targets
+  sections[EDGE_LABELS] = ig.edgeLabels if ig.edgeLabels is not None else array('i')
+  sections[KINDS] = ig.kinds
+  sections[REF_COUNTS] = ig.refCounts
+  sections[LABELS] = ig.labels
+  sections[INCR_ROOTS] = ig.incrRoots
+  sections[NAME_OFFSETS] = nameOffsets
+  sections[NAME_DATA] = nameData
+  sections[NAME_ORDER] = order
+  sections[LABEL_NAME_OFFSETS] = labelNameOffsets
+  sections[LABEL_NAME_DATA] = labelNameData
+  sections[EXTRAS] = extras
+
+  # Lay out the sections after the header, 8 byte aligned.
+  layout = []
+  pos = struct.calcsize(headerFormat)
+  for s in sections:
+    pos = (pos + 7) & ~7
+    n = len(memoryview(s).cast('B'))
+    layout += [pos, n]
+    pos += n
+
+  shm = shared_memory.SharedMemory(name=name, create=True, size=max(pos, 1))
+  struct.pack_into(headerFormat, shm.buf, 0, MAGIC, *layout)
+  for i, s in enumerate(sections):
+    start = layout[2 * i]
+    shm.buf[start:start + layout[2 * i + 1]] = memoryview(s).cast('B')
+
+  return shm
+
+
+def releaseGraph (shm):
+  shm.close()
+  shm.unlink()
+
+
+# Segments attached by this process, so they aren't closed while ig is
+# still using them.
+attached = {}
+
+
+def attachSegment (name):
+  try:
+    return shared_memory.SharedMemory(name=name, track=False)
+  except TypeError:
+    pass
+
+  # Before Python 3.13, attaching to a segment registers it with the
+  # resource tracker, which removes it when this process exits, even
+  # though it belongs to the process that shared it.
+  register = resource_tracker.register
+  resource_tracker.register = lambda name, rtype: None
+  try:
+    return shared_memory.SharedMemory(name=name)
+  finally:
+    resource_tracker.register = register
+
+
+def attachGraph (name):
+  try:
+    shm = attachSegment(name)
+  except FileNotFoundError:
+    sys.stderr.write('Error: there is no shared graph named ' + name + '\n')
+    exit(-1)
+  attached[name] = shm
+
+  header = struct.unpack_from(headerFormat, shm.buf, 0)
+  if header[0] != MAGIC:
+    sys.stderr.write('Error: ' + name + ' is not a shared graph.\n')
+    exit(-1)
+
+  buf = shm.buf.toreadonly()
+  sections = []
+  for i in range(NUM_SECTIONS):
+    start = header[1 + 2 * i]
+    sections.append(buf[start:start + header[2 + 2 * i]].cast(sectionTypes[i]))
+
+  (numNodes, weakMapEntries, hasEdgeLabels, res) = pickle.loads(sections[EXTRAS])
+  names = csr_graph.StringTable(sections[NAME_OFFSETS], sections[NAME_DATA])
+
+  ig = csr_graph.IntGraph(numNodes=numNodes, names=names,
+                          ids=csr_graph.AddressIndex(names, sections[NAME_ORDER]),
+                          offsets=sections[OFFSETS], targets=sections[TARGETS],
+                          kinds=sections[KINDS], refCounts=sections[REF_COUNTS],
+                          labels=sections[LABELS],
+                          labelNames=csr_graph.StringTable(sections[LABEL_NAME_OFFSETS], sections[LABEL_NAME_DATA]),
+                          incrRoots=sections[INCR_ROOTS], weakMapEntries=weakMapEntries,
+                          edgeLabels=sections[EDGE_LABELS] if hasEdgeLabels else None)
+  return (ig, res)
+
+
+def loadCCGraph (fname, recordEdgeLabels=False):
+  if fname.startswith(SHM_PREFIX):
+    (ig, res) = attachGraph(fname[len(SHM_PREFIX):])
+    if recordEdgeLabels and ig.edgeLabels is None:
+      sys.stderr.write('Error: the shared graph ' + fname + ' does not have edge labels.\n')
+      exit(-1)
+    return (ig, res)
+  return csr_graph.loadCCGraph(fname, recordEdgeLabels)
+
+
+####
+####  Command line
+####
+
+parser = argparse.ArgumentParser(description='Parse a CC log into shared memory, so several tools can use it at once.')
+
+parser.add_argument('file_name',
+                    help='cycle collector graph file name')
+
+parser.add_argument('--name', dest='name',
+                    default=None,
+                    help='Name of the shared memory segment.  Picked at random by default.')
+
+parser.add_argument('--edge-labels', dest='edge_labels', action='store_true',
+                    default=False,
+                    help='Also share the labels of edges.')
+
+
+def sharedGraph ():
+  args = parser.parse_args()
+
+  sys.stderr.write('Parsing {0}. '.format(args.file_name))
+  sys.stderr.flush()
+  (ig, res) = csr_graph.loadCCGraph(args.file_name, args.edge_labels)
+  shm = shareGraph(ig, res, args.name)
+  del ig
+  sys.stderr.write('Done.\n')
+
+  print('Shared the graph as', SHM_PREFIX + shm.name)
+  print('Press Ctrl-C to remove it.')
+  sys.stdout.flush()
+
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  try:
+    while True:
+      time.sleep(3600)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    releaseGraph(shm)
+
+
+if __name__ == "__main__":
+  sharedGraph()
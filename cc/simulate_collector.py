@@ -0,0 +1,300 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import sys
+import argparse
+from array import array
+from collections import namedtuple
+from . import csr_graph
+from . import shared_graph
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+# Replay the cycle collector's scan over a graph loaded by csr_graph,
+# to compute what the cycle collector should have freed, and why
+# everything else was kept alive.
+#
+# This follows the phases of nsCycleCollector:
+#
+#   - MarkRoots: the graph in the log is the result of this phase, so
+#     all we have to do here is compute the internal counts, which is
+#     the number of edges in the graph pointing to each node.
+#
+#   - ScanRoots: every node starts out grey.  Ref counted nodes with
+#     more references than internal counts, incremental roots and
+#     marked GC nodes are roots.  Everything reachable from a root is
+#     colored black.  Then weak map entries are scanned repeatedly: if
+#     the map and the key (and its delegate, if any) are black, then
+#     the value must be black, too.  If the map and the key delegate
+#     are black, then the key must be black.
+#
+#   - CollectWhite: everything that is still grey is white, and is
+#     garbage.
+#
+# The colors and the reasons each node is black are kept in flat
+# arrays indexed by node id.  For every black node, reasons holds why
+# it is black, and parents holds the node that first reached it, or
+# -1 for roots.  This is enough to give a path from a root to any live
+# node.  Nodes are colored in breadth-first order, so these paths are
+# as short as possible.
+
+
+parser = argparse.ArgumentParser(description='Simulate the cycle collector on a cycle collector graph, and explain why objects are alive.')
+
+parser.add_argument('file_name',
+                    help='cycle collector graph file name')
+
+parser.add_argument('--why', dest='why', metavar='ADDRESS', action='append',
+                    default=[],
+                    help='Explain why the object with this address was kept alive. Can be given multiple times.')
+
+parser.add_argument('--compare', dest='compare', action='store_true',
+                    default=False,
+                    help='Compare the simulated garbage to the garbage reported in the log.')
+
+
+# Why a node is black.
+NOT_ALIVE = 0
+REFCOUNT_ROOT = 1
+INCREMENTAL_ROOT = 2
+MARKED_GC_ROOT = 3
+REACHABLE = 4
+WEAK_MAP_VALUE = 5
+WEAK_MAP_KEY = 6
+
+reasonNames = ['garbage', 'ref counted root', 'incremental root',
+               'marked GC root', 'reachable', 'weak map value', 'weak map key']
+
+
+# - internalCounts is an array of the computed internal count of each node.
+# - reasons is a bytearray of why each node is alive.
+# - parents is an array of the node that made each node alive.
+# - weakMaps maps the ids of nodes that are alive due to a weak map entry
+#   to the id of the weak map, or -1 for a black map.
+# - garbage is an array of the ids of the garbage nodes.
+# - knownEdges maps the ids of the ref counted roots to their internal count.
+# - overCounted is an array of the ids of ref counted nodes with more
+#   internal references than their ref count.  This should not happen.
+CCSimulation = namedtuple('CCSimulation',
+                          'internalCounts reasons parents weakMaps garbage knownEdges overCounted')
+
+
+# Calculate how many references are accounted for by edges in the graph.
+# This is a histogram of the edge targets.  If NumPy is installed, this
+# is a single bincount, which is about 25 times faster than counting
+# one edge at a time on a log with a million edges.
+def computeInternalCounts (ig):
+  if numpy is None:
+    ics = array('i', [0]) * len(ig.names)
+    for dst in ig.targets:
+      ics[dst] += 1
+    return ics
+
+  counts = numpy.bincount(numpy.frombuffer(ig.targets, dtype=numpy.intc),
+                          minlength=len(ig.names))
+  ics = array('i')
+  ics.frombytes(counts.astype(numpy.intc).tobytes())
+  return ics
+
+
+def nullToNone (ig, addr):
+  if addr == '0x0' or addr == '(nil)':
+    return None
+  return ig.ids.get(addr)
+
+
+def simulate (ig):
+  numIds = len(ig.names)
+  offsets = ig.offsets
+  targets = ig.targets
+  kinds = ig.kinds
+
+  ics = computeInternalCounts(ig)
+  reasons = bytearray(numIds)
+  parents = array('i', [-1]) * numIds
+  weakMaps = {}
+  knownEdges = {}
+  overCounted = array('i')
+
+  # Breadth-first work list of newly black nodes.
+  workList = array('i')
+
+  def addRoot (x, reason):
+    if not reasons[x]:
+      reasons[x] = reason
+      workList.append(x)
+
+  # ScanRoots.
+  for x in range(ig.numNodes):
+    if kinds[x] == csr_graph.RC:
+      rc = ig.refCounts[x]
+      if rc > ics[x]:
+        knownEdges[x] = ics[x]
+        addRoot(x, REFCOUNT_ROOT)
+      elif rc < ics[x]:
+        overCounted.append(x)
+  for x in ig.incrRoots:
+    addRoot(x, INCREMENTAL_ROOT)
+  for x in range(ig.numNodes):
+    if kinds[x] == csr_graph.GC_MARKED:
+      addRoot(x, MARKED_GC_ROOT)
+
+  def floodBlack (start):
+    i = start
+    while i < len(workList):
+      x = workList[i]
+      i += 1
+      for j in range(offsets[x], offsets[x + 1]):
+        y = targets[j]
+        if not reasons[y]:
+          reasons[y] = REACHABLE
+          parents[y] = x
+          workList.append(y)
+    return i
+
+  scanned = floodBlack(0)
+
+  # ScanWeakMaps.  A missing map, key or key delegate is treated as
+  # black.  For explanations, a key is reached via its delegate and a
+  # value is reached via its key, or via the map if they are missing.
+  entries = []
+  for wme in ig.weakMapEntries:
+    v = nullToNone(ig, wme.value)
+    if v is None:
+      continue
+    entries.append((nullToNone(ig, wme.weakMap), nullToNone(ig, wme.key),
+                    nullToNone(ig, wme.keyDelegate), v))
+
+  def blackenWeak (x, reason, via, m):
+    reasons[x] = reason
+    parents[x] = via if via is not None else (m if m is not None else -1)
+    weakMaps[x] = m if m is not None else -1
+    workList.append(x)
+
+  anyChanged = True
+  while anyChanged:
+    anyChanged = False
+    for (m, k, kd, v) in entries:
+      if m is not None and not reasons[m]:
+        continue
+      if k is not None and not reasons[k]:
+        if kd is not None and not reasons[kd]:
+          continue
+        blackenWeak(k, WEAK_MAP_KEY, kd, m)
+      if not reasons[v]:
+        blackenWeak(v, WEAK_MAP_VALUE, k, m)
+    if scanned < len(workList):
+      scanned = floodBlack(scanned)
+      anyChanged = True
+
+  # CollectWhite.
+  garbage = array('i')
+  for x in range(ig.numNodes):
+    if not reasons[x]:
+      garbage.append(x)
+
+  return CCSimulation(internalCounts=ics, reasons=reasons, parents=parents,
+                      weakMaps=weakMaps, garbage=garbage,
+                      knownEdges=knownEdges, overCounted=overCounted)
+
+
+# Return the path from a root to x, as a list of node ids, starting
+# with the root.  Returns [] if x is garbage.
+def whyAlive (sim, x):
+  if not sim.reasons[x]:
+    return []
+  path = [x]
+  while sim.parents[x] != -1:
+    x = sim.parents[x]
+    path.append(x)
+  path.reverse()
+  return path
+
+
+####
+#### Output
+####
+
+def nodeString (ig, x):
+  return '{0} [{1}]'.format(ig.names[x], csr_graph.nodeLabel(ig, x))
+
+
+def printWhyAlive (ig, sim, x):
+  path = whyAlive(sim, x)
+  if not path:
+    print(nodeString(ig, x), 'is garbage.')
+    print()
+    return
+
+  root = path[0]
+  reason = sim.reasons[root]
+  if reason == REFCOUNT_ROOT:
+    print('Root', nodeString(ig, root), 'is a ref counted object with',
+          ig.refCounts[root] - sim.internalCounts[root], 'unknown edge(s).')
+  elif reason == WEAK_MAP_KEY or reason == WEAK_MAP_VALUE:
+    print('Root', nodeString(ig, root), 'is in a black weak map.')
+  else:
+    print('Root', nodeString(ig, root), 'is a', reasonNames[reason] + '.')
+
+  for y in path[1:]:
+    reason = sim.reasons[y]
+    sys.stdout.write('    --[')
+    if reason == REACHABLE:
+      sys.stdout.write('edge')
+    else:
+      m = sim.weakMaps[y]
+      sys.stdout.write('{0} in weak map {1}'.format(reasonNames[reason],
+                                                     ig.names[m] if m != -1 else 'black map'))
+    sys.stdout.write(']--> ' + nodeString(ig, y) + '\n')
+  print()
+
+
+def printSummary (ig, sim):
+  counts = [0] * len(reasonNames)
+  for x in range(ig.numNodes):
+    counts[sim.reasons[x]] += 1
+
+  print('Simulated the cycle collector on', ig.numNodes, 'nodes and', len(ig.targets), 'edges.')
+  for reason in range(1, len(reasonNames)):
+    print('%(num)8d %(label)s' % {'num':counts[reason], 'label':reasonNames[reason]})
+  print('%(num)8d %(label)s' % {'num':counts[NOT_ALIVE], 'label':reasonNames[NOT_ALIVE]})
+
+  for x in sim.overCounted:
+    print('Error: computed internal count of', ig.names[x], 'greater than supplied reference count.')
+  print()
+
+
+def compareGarbage (ig, sim, res):
+  garbageFx = res[1]
+  garbagePy = set([ig.names[x] for x in sim.garbage])
+  print(len(garbageFx - garbagePy), 'objects were reported as garbage but were simulated as alive.')
+  print(len(garbagePy - garbageFx), 'objects were simulated as garbage but were reported as alive.')
+  print()
+
+
+def simulateCollector ():
+  args = parser.parse_args()
+
+  (ig, res) = shared_graph.loadCCGraph(args.file_name)
+  sim = simulate(ig)
+
+  printSummary(ig, sim)
+  if args.compare:
+    compareGarbage(ig, sim, res)
+
+  for addr in args.why:
+    if not addr in ig.ids:
+      sys.stdout.write('{0} is not in the graph.\n'.format(addr))
+      continue
+    printWhyAlive(ig, sim, ig.ids[addr])
+
+
+if __name__ == "__main__":
+  simulateCollector()
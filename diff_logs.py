@@ -0,0 +1,326 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import sys
+import os
+import argparse
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+import cc.parse_cc_graph
+import cc.quotient_graph
+import g.parse_gc_graph
+
+
+# Compare a sequence of CC or GC logs taken from the same process, to
+# look for things that are growing over time.  The logs should be given
+# in the order they were taken.  This reports:
+#
+#   - How the number of objects of each class changed.
+#
+#   - Which objects are present in every log.  Objects are matched by
+#     address plus label, so an address that has been reused for a
+#     different kind of object isn't counted.
+#
+#   - Which roots are present in the last log but not the first.  For
+#     CC logs, these are the ref counted objects with unknown edges
+#     from the results section.  For GC logs, these are the roots at
+#     the start of the log.
+#
+# Each log is streamed, and only the address and interned label of
+# each object are kept, in a pair of arrays sorted by address, which
+# take 12 bytes per object.  Objects are matched across logs by merging
+# these arrays.  At most three of these pairs are alive at once: the
+# objects that are present in every log so far, the objects of the log
+# that was just read, and the intersection of the two.  Sorting a log
+# briefly needs a list of its objects' indexes as well.
+#
+# Like find_roots.py, the kind of log is determined from the file
+# name, which should start with 'cc' or 'gc'.
+
+
+parser = argparse.ArgumentParser(description='Compare CC or GC logs taken at different times to find objects that are leaking.')
+
+parser.add_argument('file_names', metavar='FILE', nargs='+',
+                    help='CC or GC log file names, in the order they were taken')
+
+parser.add_argument('--num-show', '-ns', dest='num_to_show', type=int,
+                    default=20,
+                    help='Only show this many classes in each section. Default is 20.')
+
+parser.add_argument('--min-change', '-mc', dest='min_change', type=int,
+                    default=1,
+                    help='Only show classes whose count changed by at least this much. Default is 1.')
+
+parser.add_argument('--raw-labels', dest='raw_labels', action='store_true',
+                    default=False,
+                    help='Don\'t combine similar labels, such as strings or labels that differ only in addresses.')
+
+parser.add_argument('--list-persistent', dest='list_persistent', action='store_true',
+                    default=False,
+                    help='Print the address and label of every object present in every log.')
+
+
+# - nodes is a NodeArrays of every object in the log.
+# - classCounts maps class ids to the number of objects of that class.
+# - roots maps the address of every root to a description of the root.
+LogSummary = namedtuple('LogSummary', 'nodes classCounts roots')
+
+# addrs is an array of the addresses of some objects, as integers, in
+# increasing order, and labelIds is an array of their label ids.
+NodeArrays = namedtuple('NodeArrays', 'addrs labelIds')
+
+
+####
+#### Labels
+####
+
+# Interned labels and classes, shared by all of the logs so that ids
+# can be compared across logs.
+class LabelTable:
+  def __init__(self, rawLabels):
+    self.rawLabels = rawLabels
+    self.labelIds = {}
+    self.labels = []
+    self.classIds = {}
+    self.classes = []
+    self.labelClasses = []
+
+  def intern(self, lbl):
+    lblId = self.labelIds.get(lbl)
+    if lblId is None:
+      lblId = len(self.labels)
+      self.labelIds[lbl] = lblId
+      self.labels.append(lbl)
+      cls = lbl if self.rawLabels else cc.quotient_graph.canonicalLabel(lbl)
+      clsId = self.classIds.get(cls)
+      if clsId is None:
+        clsId = len(self.classes)
+        self.classIds[cls] = clsId
+        self.classes.append(cls)
+      self.labelClasses.append(clsId)
+    return lblId
+
+
+####
+#### Log streaming
+####
+
+def logKind(fname):
+  baseFileName = os.path.basename(fname)
+  if baseFileName.startswith('cc') or baseFileName.startswith('incomplete-cc'):
+    return 'cc'
+  if baseFileName.startswith('gc') or baseFileName.startswith('incomplete-gc'):
+    return 'gc'
+  return None
+
+
+def countNode(lt, nodes, classCounts, addr, lbl):
+  lblId = lt.intern(lbl)
+  nodes.addrs.append(int(addr, 16))
+  nodes.labelIds.append(lblId)
+  clsId = lt.labelClasses[lblId]
+  classCounts[clsId] = classCounts.get(clsId, 0) + 1
+
+
+def newNodeArrays():
+  return NodeArrays(addrs=array('Q'), labelIds=array('i'))
+
+
+# Sort the objects in the order they were read by address.  If an
+# address shows up more than once, the last label is kept.
+def sortNodes(nodes):
+  order = sorted(range(len(nodes.addrs)), key=nodes.addrs.__getitem__)
+  result = newNodeArrays()
+  for i in order:
+    addr = nodes.addrs[i]
+    if result.addrs and result.addrs[-1] == addr:
+      result.labelIds[-1] = nodes.labelIds[i]
+    else:
+      result.addrs.append(addr)
+      result.labelIds.append(nodes.labelIds[i])
+  return result
+
+
+# The label id of the object with this address, or -1.
+def nodeLabelId(nodes, addr):
+  i = bisect_left(nodes.addrs, addr)
+  if i < len(nodes.addrs) and nodes.addrs[i] == addr:
+    return nodes.labelIds[i]
+  return -1
+
+
+def summarizeCCLog(lt, f):
+  nodes = newNodeArrays()
+  classCounts = {}
+  nodePatt = cc.parse_cc_graph.nodePatt
+
+  for l in f:
+    if l[0] == '>':
+      continue
+    nm = nodePatt.match(l)
+    if nm:
+      countNode(lt, nodes, classCounts, nm.group(1), nm.group(3))
+    elif l[:10] == '==========':
+      break
+
+  roots = {}
+  (knownEdges, _) = cc.parse_cc_graph.parseResults(f)
+  for addr, known in knownEdges.items():
+    roots[int(addr, 16)] = 'ref counted object with {0} known edge(s)'.format(known)
+
+  return LogSummary(nodes=sortNodes(nodes), classCounts=classCounts, roots=roots)
+
+
+def summarizeGCLog(lt, f):
+  nodes = newNodeArrays()
+  classCounts = {}
+  roots = {}
+  nodePatt = g.parse_gc_graph.nodePatt
+
+  # Roots come first.  Don't overwrite a black root with a gray root.
+  for l in f:
+    if l[:10] == '==========':
+      break
+    nm = nodePatt.match(l)
+    if nm:
+      addr = int(nm.group(1), 16)
+      if not addr in roots:
+        roots[addr] = nm.group(3)
+
+  for l in f:
+    if l[0] == '>' or l[0] == '#':
+      continue
+    nm = nodePatt.match(l)
+    if nm:
+      countNode(lt, nodes, classCounts, nm.group(1), nm.group(3))
+
+  return LogSummary(nodes=sortNodes(nodes), classCounts=classCounts, roots=roots)
+
+
+def summarizeLog(lt, fname, kind):
+  sys.stderr.write('Reading {0}.\n'.format(fname))
+  try:
+    f = open(fname, 'r', encoding='latin1')
+  except:
+    sys.stderr.write('Error opening file ' + fname + '\n')
+    exit(-1)
+
+  if kind == 'cc':
+    s = summarizeCCLog(lt, f)
+  else:
+    s = summarizeGCLog(lt, f)
+  f.close()
+  return s
+
+
+####
+#### Comparison
+####
+
+# Keep the objects in persistent that are also in the new log, with
+# the same label.  Both are sorted by address, so this is a merge.
+def intersectNodes(persistent, nodes):
+  result = newNodeArrays()
+  n = len(nodes.addrs)
+  j = 0
+  for i in range(len(persistent.addrs)):
+    addr = persistent.addrs[i]
+    while j < n and nodes.addrs[j] < addr:
+      j += 1
+    if j == n:
+      break
+    if nodes.addrs[j] == addr and nodes.labelIds[j] == persistent.labelIds[i]:
+      result.addrs.append(addr)
+      result.labelIds.append(persistent.labelIds[i])
+  return result
+
+
+def rootKeys(s):
+  return set([(addr, nodeLabelId(s.nodes, addr)) for addr in s.roots])
+
+
+def printClassCounts(args, lt, allCounts):
+  deltas = []
+  for clsId in range(len(lt.classes)):
+    counts = [c.get(clsId, 0) for c in allCounts]
+    delta = counts[-1] - counts[0]
+    if abs(delta) >= args.min_change:
+      deltas.append((delta, clsId, counts))
+  deltas.sort(key=lambda d: (-d[0], lt.classes[d[1]]))
+
+  print('Change in object counts by class, from the first to the last log.', end=' ')
+  print('Showing no more than', args.num_to_show, 'classes that increased the most.')
+  for (delta, clsId, counts) in deltas[:args.num_to_show]:
+    if delta <= 0:
+      break
+    print('%(delta)+9d %(counts)s %(label)s' % {'delta':delta, 'counts':' '.join(['%8d' % c for c in counts]),
+                                                 'label':lt.classes[clsId]})
+  print()
+
+
+def printPersistent(args, lt, persistent, numLogs):
+  print(len(persistent.addrs), 'objects were present in all', numLogs, 'logs.', end=' ')
+  print('Showing no more than', args.num_to_show, 'of the most frequent classes.')
+
+  classCounts = {}
+  for lblId in persistent.labelIds:
+    clsId = lt.labelClasses[lblId]
+    classCounts[clsId] = classCounts.get(clsId, 0) + 1
+  for clsId, n in sorted(classCounts.items(), key=lambda c: -c[1])[:args.num_to_show]:
+    print('%(num)8d %(label)s' % {'num':n, 'label':lt.classes[clsId]})
+  print()
+
+  if args.list_persistent:
+    for addr, lblId in zip(persistent.addrs, persistent.labelIds):
+      print('0x{0:x} [{1}]'.format(addr, lt.labels[lblId]))
+    print()
+
+
+def printNewRoots(lt, firstRoots, last):
+  newRoots = rootKeys(last) - firstRoots
+  print(len(newRoots), 'roots are in the last log but not the first.')
+  for (addr, lblId) in sorted(newRoots):
+    lbl = lt.labels[lblId] if lblId != -1 else ''
+    print('  0x{0:x} [{1}] {2}'.format(addr, lbl, last.roots[addr]))
+  print()
+
+
+def diffLogs():
+  args = parser.parse_args()
+
+  kinds = set([logKind(fname) for fname in args.file_names])
+  if None in kinds:
+    sys.stderr.write('Expected log file names to start with cc or gc.\n')
+    exit(-1)
+  if len(kinds) != 1:
+    sys.stderr.write('Can\'t compare CC logs with GC logs.\n')
+    exit(-1)
+  kind = kinds.pop()
+
+  lt = LabelTable(args.raw_labels)
+  allCounts = []
+  firstRoots = None
+  persistent = None
+  s = None
+
+  for fname in args.file_names:
+    s = summarizeLog(lt, fname, kind)
+    allCounts.append(s.classCounts)
+    if persistent is None:
+      firstRoots = rootKeys(s)
+      persistent = s.nodes
+    else:
+      persistent = intersectNodes(persistent, s.nodes)
+
+  print()
+  printClassCounts(args, lt, allCounts)
+  printPersistent(args, lt, persistent, len(args.file_names))
+  printNewRoots(lt, firstRoots, s)
+
+
+if __name__ == "__main__":
+  diffLogs()
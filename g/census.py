@@ -178,29 +178,39 @@ def parseGraph (f):
     return (count, s)
 
 
+  # Each entry is (category, count, description).
   displayStuff = []
 
-  displayStuff.append(displayifyMap("strings", string, 5))
-  displayStuff.append(displayifyMap("functions", scriptyFunctions, 40))
-  displayStuff.append(displayifyMap("scripts", script, 10))
-  displayStuff.append(displayifyMap("scopes", scope, 10))
-
-  displayStuff.append((symbol, "symbols: {}".format(symbol)))
-  displayStuff.append((jitcode, "jitcodes: {}".format(jitcode)))
-  displayStuff.append((Object, "objects: {}".format(Object)))
-  displayStuff.append((shape, "shapes: {}".format(shape)))
-  displayStuff.append((baseShape, "base shapes: {}".format(baseShape)))
-  displayStuff.append((regexp, "regexps: {}".format(regexp)))
-  displayStuff.append((lazyScript, "lazy script: {}".format(lazyScript)))
-  displayStuff.append((objectGroup, "object groups: {}".format(objectGroup)))
-  displayStuff.append((invalid, "INVALIDs: {}".format(invalid)))
-  displayStuff.append((array, "arrays: {}".format(array)))
-  displayStuff.append((call, "calls: {}".format(call)))
-  displayStuff.append((other, "other: {}".format(other)))
-
-  for _, s in sorted(displayStuff, reverse=True, key=lambda a_b1: a_b1[0]):
+  def addCount(name, count):
+    displayStuff.append((name, count, "{}: {}".format(name, count)))
+
+  def addMap(name, m, maxItems):
+    (count, s) = displayifyMap(name, m, maxItems)
+    displayStuff.append((name, count, s))
+
+  addMap("strings", string, 5)
+  addMap("functions", scriptyFunctions, 40)
+  addMap("scripts", script, 10)
+  addMap("scopes", scope, 10)
+
+  addCount("symbols", symbol)
+  addCount("jitcodes", jitcode)
+  addCount("objects", Object)
+  addCount("shapes", shape)
+  addCount("base shapes", baseShape)
+  addCount("regexps", regexp)
+  addCount("lazy script", lazyScript)
+  addCount("object groups", objectGroup)
+  addCount("INVALIDs", invalid)
+  addCount("arrays", array)
+  addCount("calls", call)
+  addCount("other", other)
+
+  for _, _, s in sorted(displayStuff, reverse=True, key=lambda d: d[1]):
     print(s)
 
+  return dict([(name, count) for name, count, _ in displayStuff])
+
 
 
 def parseGCEdgeFile (fname):
@@ -212,14 +222,23 @@ def parseGCEdgeFile (fname):
 
   rootLabels = parseRoots(f)
 
-  parseGraph(f)
+  counts = parseGraph(f)
   f.close()
+  return counts
+
+
+# Returns a map from categories to the number of objects in that
+# category, so that batch_logs.py can combine the census of many logs.
+def gcCensus():
+  if len(sys.argv) < 2:
+    print('Not enough arguments.')
+    exit()
+
+  return parseGCEdgeFile(sys.argv[1])
 
 
-if len(sys.argv) < 2:
-  print('Not enough arguments.')
-  exit()
+if __name__ == "__main__":
+  gcCensus()
 
-parseGCEdgeFile(sys.argv[1])
 
 
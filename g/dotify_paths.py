@@ -6,6 +6,9 @@
 
 # Experimental find_roots.py dotify support.
 
+from cc import dot_writer
+from cc import chain_compress
+
 
 #######
 # union find with path compression and union by rank
@@ -50,138 +53,197 @@ def add_dot_mode_path(ga, path):
   gPaths.append(path)
 
 
-def outputDotFile(args, ga, targs):
-
-  # build the set of nodes
-  nodes = set([])
-  for p in gPaths:
-    for x in p:
-      nodes.add(x)
-
-  # build the edge map
-  edges = {}
+def canonical_paths(ga):
+  # compress shapes: merge each shape into the first shape or base
+  # shape it points to.
+  shape_merge = {}
+  shape_rep = {}
+  merged = set([])
 
   for p in gPaths:
     prevNode = None
     for x in p:
-      if prevNode:
-        edges.setdefault(prevNode, set([])).add(x)
+      if prevNode != None and not prevNode in merged and \
+            ga.nodeLabels.get(prevNode, '') == 'shape' and \
+            ga.nodeLabels.get(x, '') in ['shape', 'base_shape']:
+        union(shape_merge, shape_rep, x, prevNode)
+        merged.add(prevNode)
       prevNode = x
 
-  # compress shapes
-  shape_merge = {}
-  shape_rep = {}
-
-  for x in nodes:
-    if ga.nodeLabels.get(x, '') != 'shape':
-      continue
-    if not x in edges:
-      continue
-    for y in edges[x]:
-      if ga.nodeLabels.get(y, '') != 'shape' and ga.nodeLabels.get(y, '') != 'base_shape':
-        continue
-      union(shape_merge, shape_rep, y, x)
-      break
-
   def canon_node(x):
     y = find(shape_merge, x)
     if y in shape_rep:
       y = shape_rep[y]
     return y
 
-  # Remove merged away nodes
-  for x in list(shape_merge.keys()):
-    if canon_node(x) != x:
-      nodes.remove(x)
+  # Update the paths for merging, removing the edges between merged
+  # nodes.
+  for p in gPaths:
+    cp = []
+    for x in p:
+      x = canon_node(x)
+      if not cp or cp[-1] != x:
+        cp.append(x)
+    yield cp
+
+
+# Return the label, shape and color to draw n with.
+def node_dot_attrs(ga, n, targs):
+  lbl = ga.nodeLabels.get(n, '')
+  if lbl.startswith('Object'):
+    lbl = lbl[6:]
+    shape = 'square'
+    color = 'black'
+  elif lbl.startswith('Function'):
+    if len(lbl) > 10:
+      lbl = lbl[9:]
+    shape = 'ellipse'
+    color = 'black'
+  elif lbl.startswith('HTML'):
+    lbl = lbl[4:]
+    shape = 'diamond'
+    color = 'blue'
+  elif lbl.startswith('XPCWrappedNative'):
+    lbl = 'XPCWN' + lbl[16:]
+    shape = 'diamond'
+    color = 'black'
+  elif lbl.startswith('script'):
+    if lbl.startswith('script app://system.gaiamobile.org/'):
+      lbl = lbl[35:]
+    else:
+      lbl = lbl[7:]
+    shape = 'ellipse'
+    color = 'red'
+  else:
+    if lbl.startswith('WeakMap'):
+      lbl = 'WeakMap'
+    elif lbl == 'base_shape':
+      lbl = 'shape'
+    elif lbl == 'type_object':
+      lbl = 'type'
+    elif lbl.startswith('DOMRequest '):
+      lbl = 'DOMRequest'
+    shape = 'circle'
+    color = 'black'
+  if lbl.endswith('<no private>'):
+    lbl = lbl[:-13]
+
+  # this will def. not work with multiple targets
+  if n == targs[0]:
+    shape = 'tripleoctagon'
+    lbl = 'TARGET'
+    color = 'orange'
+
+  if shape == 'ellipse':
+    lbl = lbl[:30]
+  else:
+    lbl = lbl[:15]
 
-  # Update the edges for merging
-  new_edges = {}
-  for x, dsts in edges.items():
-    new_dsts = set([])
-    for y in dsts:
-      new_dsts.add(canon_node(y))
-    x = canon_node(x)
-    if x in new_dsts:
-      new_dsts.remove(x)
-    new_edges[x] = new_edges.get(x, set([])).union(new_dsts)
-  edges = new_edges
+  return (lbl, shape, color)
 
 
-  # output the dot file
+# If count isn't None, n stands for count nodes that look the same.
+def node_dot_string(ga, n, targs, count=None):
+  (lbl, shape, color) = node_dot_attrs(ga, n, targs)
+  if count != None:
+    lbl = '{0} x{1}'.format(lbl, count)
+  return '  node [color = {3}, shape = {2}, label="{1}"] q{0};\n'.format(n, lbl, shape, color)
 
-  outf = open('graph.dot', 'w')
-  outf.write('digraph {\n')
 
+def edge_dot_string(args, ga, x, y):
+  if args.dot_mode_edges:
+    lbls = ga.edgeLabels.get(x, {}).get(y, [])
+    ll = []
+    for l in lbls:
+      if len(l) == 2:
+        l = l[0]
+      if l.startswith('**UNKNOWN SLOT '):
+        continue
+      ll.append(l)
+    return '  q{0} -> q{1} [label="{2}"];\n'.format(x, y, ', '.join(ll))
+  else:
+    return '  q{0} -> q{1};\n'.format(x, y)
+
+
+# Write out the paths with a DotWriter, one path at a time.  Each path
+# only adds the nodes and edges that haven't been written out yet.
+# When the writer starts a new file, the nodes of a path are declared
+# again, so that each file stands on its own.  These repeated nodes
+# aren't counted against the budget.
+def outputDotFile(args, ga, targs):
   if len(targs) != 1:
     print('Had more than one target, arbitrarily picking the first one', targs[0])
 
-  for n in nodes:
-    lbl = ga.nodeLabels.get(n, '')
-    if lbl.startswith('Object'):
-      lbl = lbl[6:]
-      shape = 'square'
-      color = 'black'
-    elif lbl.startswith('Function'):
-      if len(lbl) > 10:
-        lbl = lbl[9:]
-      shape = 'ellipse'
-      color = 'black'
-    elif lbl.startswith('HTML'):
-      lbl = lbl[4:]
-      shape = 'diamond'
-      color = 'blue'
-    elif lbl.startswith('XPCWrappedNative'):
-      lbl = 'XPCWN' + lbl[16:]
-      shape = 'diamond'
-      color = 'black'
-    elif lbl.startswith('script'):
-      if lbl.startswith('script app://system.gaiamobile.org/'):
-        lbl = lbl[35:]
-      else:
-        lbl = lbl[7:]
-      shape = 'ellipse'
-      color = 'red'
-    else:
-      if lbl.startswith('WeakMap'):
-        lbl = 'WeakMap'
-      elif lbl == 'base_shape':
-        lbl = 'shape'
-      elif lbl == 'type_object':
-        lbl = 'type'
-      elif lbl.startswith('DOMRequest '):
-        lbl = 'DOMRequest'
-      shape = 'circle'
-      color = 'black'
-    if lbl.endswith('<no private>'):
-      lbl = lbl[:-13]
-
-    # this will def. not work with multiple targets
-    if n == targs[0]:
-      shape = 'tripleoctagon'
-      lbl = 'TARGET'
-      color = 'orange'
-
-    if shape == 'ellipse':
-      lbl = lbl[:30]
-    else:
-      lbl = lbl[:15]
-
-    outf.write('  node [color = {3}, shape = {2}, label="{1}"] q{0};\n'.format(n, lbl, shape, color))
-
-  for x, dsts in edges.items():
-    for y in dsts:
-      if args.dot_mode_edges:
-        lbls = ga.edgeLabels.get(x, {}).get(y, [])
-        ll = []
-        for l in lbls:
-          if len(l) == 2:
-            l = l[0]
-          if l.startswith('**UNKNOWN SLOT '):
-            continue
-          ll.append(l)
-        outf.write('  q{0} -> q{1} [label="{2}"];\n'.format(x, y, ', '.join(ll)))
-      else:
-        outf.write('  q{0} -> q{1};\n'.format(x, y))
-
-  outf.write('}\n')
+  if args.dot_compress:
+    outputCompressedDotFile(args, ga, targs)
+    return
+
+  outf = dot_writer.DotWriter('graph', 'digraph {\n', maxNodes=args.dot_max_nodes,
+                              maxEdges=args.dot_max_edges, shardNodes=args.dot_shard_nodes)
+
+  paths = dot_writer.orderComponents(list(canonical_paths(ga)), len, lambda p: p[0], args.dot_select)
+
+  nodes = set([])
+  edges = set([])
+  shard = -1
+
+  for p in paths:
+    newNodes = set(p) - nodes
+    newEdges = set([e for e in zip(p, p[1:]) if not e in edges])
+    if not outf.beginComponent(len(newNodes), len(newEdges)):
+      continue
+    if outf.shard() != shard:
+      shard = outf.shard()
+      nodes = set([])
+      edges = set([])
+      newNodes = set(p)
+      newEdges = set(zip(p, p[1:]))
+
+    for n in newNodes:
+      outf.write(node_dot_string(ga, n, targs))
+    for (x, y) in newEdges:
+      outf.write(edge_dot_string(args, ga, x, y))
+    nodes |= newNodes
+    edges |= newEdges
+
+  outf.close()
+  outf.printSummary()
+
+
+# Fewest leaves of the same kind with the same parent to merge, and
+# fewest nodes in a chain to collapse, with --dot-compress.
+STAR_MIN = 3
+CHAIN_MIN = 2
+
+
+# Write out the union of the paths as a single component, after
+# collapsing chains and stars with chain_compress.  The targets and the
+# start of each path are kept.
+def outputCompressedDotFile(args, ga, targs):
+  g = {}
+  keep = set(targs)
+  for p in canonical_paths(ga):
+    keep.add(p[0])
+    for x in p:
+      g.setdefault(x, set([]))
+    for (x, y) in zip(p, p[1:]):
+      g[x].add(y)
+
+  (g, chains, stars) = chain_compress.compressGraph(g, keep, lambda x: node_dot_attrs(ga, x, targs),
+                                                    STAR_MIN, CHAIN_MIN)
+
+  outf = dot_writer.DotWriter('graph', 'digraph {\n', maxNodes=args.dot_max_nodes,
+                              maxEdges=args.dot_max_edges, shardNodes=args.dot_shard_nodes)
+
+  if outf.beginComponent(len(g), sum(len(edges) for edges in g.values())):
+    for n in g:
+      outf.write(node_dot_string(ga, n, targs, stars.get(n)))
+    for x, edges in g.items():
+      for y in edges:
+        if (x, y) in chains:
+          outf.write('  q{0} -> q{1} [style=bold, label="{2}"];\n'.format(x, y, chains[(x, y)]))
+        else:
+          outf.write(edge_dot_string(args, ga, x, y))
+
   outf.close()
+  outf.printSummary()
@@ -10,6 +10,12 @@ import copy
 from collections import namedtuple
 from collections import deque
 from . import parse_gc_graph
+from cc import label_index
+from cc import external_reverse
+from cc import csr_graph
+from cc import reachability
+from cc import graph_overlay
+from cc import dot_writer
 import argparse
 from .dotify_paths import outputDotFile
 from .dotify_paths import add_dot_mode_path
@@ -65,6 +71,14 @@ parser.add_argument('--hide-weak-maps', '-hwm', dest='hide_weak_maps', action='s
                     default=False,
                     help='If selected, don\'t show why any weak maps in the path are alive.')
 
+parser.add_argument('--reversed-graph', dest='reversed_graph', metavar='FILE',
+                    default=None,
+                    help='Use the reversed graph in FILE, written by cc/external_reverse, instead of reversing the graph in memory. Implies --depth-first.')
+
+parser.add_argument('--reachable-from', dest='reachable_from', metavar='ADDR', action='append',
+                    default=None,
+                    help='Instead of finding paths, say whether the object at ADDR reaches each target.  Can be given more than once.')
+
 ### Dot mode arguments.
 parser.add_argument('--dot-mode', '-d', dest='dot_mode', action='store_true',
                     default=False,
@@ -76,6 +90,26 @@ parser.add_argument('--dot-mode-edges', '-de', dest='dot_mode_edges', action='st
                     default=False,
                     help='Show edges in dot mode.')
 
+parser.add_argument('--dot-compress', dest='dot_compress', action='store_true',
+                    default=False,
+                    help='Collapse chains and fans of leaves that look the same in dot mode, and write all of the paths as one graph.')
+
+parser.add_argument('--dot-max-nodes', dest='dot_max_nodes', type=int,
+                    default=-1,
+                    help='Most nodes to write in dot mode. Paths that don\'t fit are skipped.')
+
+parser.add_argument('--dot-max-edges', dest='dot_max_edges', type=int,
+                    default=-1,
+                    help='Most edges to write in dot mode. Paths that don\'t fit are skipped.')
+
+parser.add_argument('--dot-shard-nodes', dest='dot_shard_nodes', type=int,
+                    default=-1,
+                    help='Split the dot mode output into graph.dot, graph.1.dot, etc. with at most this many nodes each.')
+
+parser.add_argument('--dot-select', dest='dot_select', choices=dot_writer.SELECT_MODES,
+                    default='order',
+                    help='Order to write paths in dot mode, which decides which are kept by --dot-max-nodes and --dot-max-edges: in order, longest first, or a deterministic sample.')
+
 
 
 ########################################################
@@ -226,17 +260,18 @@ def findRootsBFS(args, g, ga, target):
     if wme.keyDelegate != '0x0':
       weakData.setdefault(wme.keyDelegate, set([])).add(wme)
 
-  # Create a fake start object that points to the roots and
-  # add it to the graph.
-  startObject = 'FAKE START OBJECT'
-  rootEdges = set([])
-  for r, isBlack in ga.roots.items():
-    if args.only_black_roots and not isBlack:
-      continue
-    rootEdges.add(r)
+  # Start from a fake object that points to the roots, without adding
+  # it to the graph.
+  startObject = graph_overlay.START
+  rootEdges = {r for r, isBlack in ga.roots.items() if isBlack or not args.only_black_roots}
+
+  # Gray and white nodes can be reached, but not passed through, either
+  # by edges or by weak map entries.
+  if args.only_black_paths:
+    ov = graph_overlay.makeOverlay(rootEdges, expandOnly=ga.colorNodes['B'])
+  else:
+    ov = graph_overlay.makeOverlay(rootEdges)
 
-  assert not startObject in g
-  g[startObject] = rootEdges
   distances[startObject] = (-1, None)
   workList.append(startObject)
 
@@ -249,31 +284,22 @@ def findRootsBFS(args, g, ga, target):
     assert dist >= limit
     limit = dist
 
-    if args.only_black_paths:
-      if x in ga.colorNodes['G'] or x in ga.colorNodes['W']:
-        continue
-      assert x in ga.colorNodes['B'] or x == startObject
-
     if x == target:
       # Found target: nothing to do?
       # This will just find the shortest path to the object.
       continue
 
-    if not x in g:
-      # x does not point to any other nodes.
-      continue
-
     newDist = dist + 1
     newDistNode = (newDist, x)
 
-    for y in g[x]:
+    for y in graph_overlay.successors(g, ga.edgeLabels, ov, x):
       if y in distances:
         assert distances[y][0] <= newDist
       else:
         distances[y] = newDistNode
         workList.append(y)
 
-    if x in weakData:
+    if x in weakData and (ov.expandOnly is None or x in ov.expandOnly):
       for wme in weakData[x]:
         assert x == wme.weakMap or x == wme.key or x == wme.keyDelegate
         traverseWeakMapEntry(dist, wme.key, wme.weakMap, wme.value, "value in weak map " + wme.weakMap)
@@ -301,7 +327,7 @@ def findRootsBFS(args, g, ga, target):
         # so follow it, and worry about the weak map later.
         [_, k, m, lbl] = dist
 
-        ga.edgeLabels[k].setdefault(p, []).append(lbl)
+        ga.edgeLabels.addLabel(k, p, lbl)
         p = k
         if not m in printedThings and not args.hide_weak_maps:
           printWorkList.append(m)
@@ -315,9 +341,6 @@ def findRootsBFS(args, g, ga, target):
     else:
       print('Didn\'t find a path.')
 
-  # Remove the fake object so the graph can be queried again.
-  del g[startObject]
-
   return
 
 
@@ -327,21 +350,24 @@ def findRootsBFS(args, g, ga, target):
 ########################################################
 
 def reverseGraph(g):
-  g2 = {}
   print('Reversing graph.', end=' ')
   sys.stdout.flush()
-  for src, dsts in g.items():
-    for d in dsts:
-      g2.setdefault(d, set([])).add(src)
+  g2 = csr_graph.reverseDictGraph(g)
   print('Done.')
   print()
   return g2
 
 
+# The reversed graph from --reversed-graph, or else g reversed in memory.
+def reversedGraph(args, g):
+  if args.reversed_graph != None:
+    return external_reverse.openReversedGraph(args.reversed_graph).graph
+  return reverseGraph(g)
+
+
 # Look for roots and print out the paths to the given object
 # This works by reversing the graph, then flooding to find roots.
-def findRootsDFS(args, g, ga, x):
-  revg = reverseGraph(g)
+def findRootsDFS(args, revg, ga, x):
   roots = ga.roots
   visited = set([])
   revPath = [x]
@@ -399,15 +425,8 @@ def loadGraph(fname):
   return (g, ga)
 
 
-def stringTargets(ga, stringTarget):
-  targs = []
-
-  for addr, lbl in ga.nodeLabels.items():
-    if not lbl.startswith('string '):
-      continue
-    s = lbl[7:]
-    if s.startswith(stringTarget):
-      targs.append(addr)
+def stringTargets(li, stringTarget):
+  targs = label_index.prefixNodes(li, 'string ' + stringTarget)
 
   sys.stderr.write('Found {} string targets starting with {}\n'.format(len(targs), stringTarget))
   return targs
@@ -415,40 +434,63 @@ def stringTargets(ga, stringTarget):
 
 targetDebug = False
 
-def selectTargets(args, g, ga):
+def selectTargets(args, g, ga, li):
   if args.string_mode:
-    targs = stringTargets(ga, args.target)
+    targs = stringTargets(li, args.target)
   elif addrPatt.match(args.target):
     targs = [args.target]
     if targetDebug:
       sys.stderr.write('Looking for object with address {}.\n'.format(args.target))
   else:
     # look for objects with a class name prefixes, not a particular object
-    targs = []
-    for x in list(g.keys()):
-      if ga.nodeLabels.get(x, '')[0:len(args.target)] == args.target:
-        if targetDebug:
-          sys.stderr.write('Found object {}. '.format(x))
-        targs.append(x)
+    targs = label_index.prefixNodes(li, args.target)
     if targs == []:
       print('No matching class names found.')
-    else:
-      if targetDebug:
-        sys.stderr.write('\n')
+    elif targetDebug:
+      sys.stderr.write('Found objects {}.\n'.format(' '.join(targs)))
 
   return targs
 
 
+# Answer every question with one index, instead of a search for each.
+def printReachable(args, g, ga, targs):
+  (ids, idx) = reachability.dictGraphIndex(g)
+  for src in args.reachable_from:
+    for a in targs:
+      if reachability.addrReaches(ids, idx, src, a):
+        print(src, 'reaches', end=' ')
+      else:
+        print(src, 'does not reach', end=' ')
+      print_node(ga, a)
+      print()
+
+
 def findGCRoots():
   args = parser.parse_args()
+  if args.reversed_graph != None:
+    args.use_dfs = True
 
   (g, ga) = loadGraph(args.file_name)
-  targs = selectTargets(args, g, ga)
+  li = label_index.buildLabelIndex(g, ga.nodeLabels)
+  targs = selectTargets(args, g, ga, li)
 
+  if args.reachable_from != None:
+    print()
+    printReachable(args, g, ga, targs)
+    return [a for a in targs if a in g]
+
+  # The labels of weak map edges found by the searches go into an
+  # overlay instead of ga, and are kept for dot mode.
+  ga = ga._replace(edgeLabels=graph_overlay.EdgeLabels(ga.edgeLabels))
+
+  # The reversed graph is shared by every target.
+  revg = None
   for a in targs:
     if a in g:
       if args.use_dfs:
-        findRootsDFS(args, g, ga, a)
+        if revg is None:
+          revg = reversedGraph(args, g)
+        findRootsDFS(args, revg, ga, a)
       else:
         print()
         print()
@@ -459,6 +501,8 @@ def findGCRoots():
   if args.dot_mode:
     outputDotFile(args, ga, targs)
 
+  return [a for a in targs if a in g]
+
 
 if __name__ == "__main__":
   findGCRoots()
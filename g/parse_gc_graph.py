@@ -6,16 +6,40 @@
 
 
 # Library for parsing garbage collector log files into a graph data structure.
+#
+# The zone and compartment of each node are recorded in ga.locations,
+# a Locations:
+#
+#   - zoneOf and compartmentOf are arrays that hold the zone id and
+#     compartment id of each node, or -1 for nodes that come before
+#     the first zone.  They are in the order the nodes appear in the
+#     log, which is also the order of the keys of the graph.
+#   - zoneNames maps zone ids to the address of the zone.
+#   - compartmentNames maps compartment ids to a name for them.
+#   - zoneCompartment maps zone ids to the compartment id of the nodes
+#     in the zone.
+#
+# The log only says which zone each node is in, and which compartments
+# are in each zone.  Newer logs also list the realms of each
+# compartment, by compartment address, but compartment lines only give
+# a name, so the two can't be matched up.  The compartment lines are
+# used if a zone has any, and the realm lines otherwise, for logs that
+# only have realms.  Nodes in a zone with a single compartment are put
+# into that compartment.  The nodes of a zone with more than one
+# compartment can't be told apart, so they are all put into a
+# compartment that stands for every compartment of the zone.
 
 
 import sys
 import re
+from array import array
 from collections import namedtuple
 
 
 
-GraphAttribs = namedtuple('GraphAttribs', 'edgeLabels nodeLabels roots rootLabels weakMapEntries colorNodes')
+GraphAttribs = namedtuple('GraphAttribs', 'edgeLabels nodeLabels roots rootLabels weakMapEntries colorNodes locations')
 WeakMapEntry = namedtuple('WeakMapEntry', 'weakMap key keyDelegate value')
+Locations = namedtuple('Locations', 'zoneOf compartmentOf zoneNames compartmentNames zoneCompartment')
 
 ####
 ####  Log parsing
@@ -23,6 +47,9 @@ WeakMapEntry = namedtuple('WeakMapEntry', 'weakMap key keyDelegate value')
 
 nodePatt = re.compile ('((?:0x)?[a-fA-F0-9]+) (?:(B|G|W) )?([^\r\n]*)\r?$')
 edgePatt = re.compile ('> ((?:0x)?[a-fA-F0-9]+) (?:(B|G|W) )?([^\r\n]*)\r?$')
+zonePatt = re.compile ('# zone ((?:0x)?[a-fA-F0-9]+)\r?$')
+compartmentPatt = re.compile ('# compartment (.*) \[in zone ((?:0x)?[a-fA-F0-9]+)\]\r?$')
+realmPatt = re.compile ('# realm (.*) \[in compartment ((?:0x)?[a-fA-F0-9]+), zone ((?:0x)?[a-fA-F0-9]+)\]\r?$')
 weakMapEntryPatt = re.compile ('WeakMapEntry map=([a-zA-Z0-9]+|\(nil\)) key=([a-zA-Z0-9]+|\(nil\)) keyDelegate=([a-zA-Z0-9]+|\(nil\)) value=([a-zA-Z0-9]+)\r?$')
 
 # A bit of a hack. Up-to-date as of Jan 15, 2025.
@@ -77,6 +104,15 @@ def parseGraph (f):
   nodeLabels = {}
   colorNodes = { 'B':set([]), 'W':set([]), 'G':set([]) }
 
+  zoneOf = array('i')
+  zoneNames = []
+  # The names of the compartments of each zone, from compartment lines.
+  zoneCompartments = []
+  # The compartments of each zone, from realm lines, as a map from the
+  # address of the compartment to the name of its first realm.
+  zoneRealms = []
+  currZone = -1
+
   def addNode (node, nodeLabel):
     assert(not node in edges)
     edges[node] = {}
@@ -106,14 +142,54 @@ def parseGraph (f):
         nodeColor = nm.group(2)
         addNode(currNode, nm.group(3))
         colorNodes[nodeColor].add(currNode)
+        zoneOf.append(currZone)
       elif l[0] == '#':
-        # Skip over comments.
+        zm = zonePatt.match(l)
+        if zm:
+          currZone = len(zoneNames)
+          zoneNames.append(zm.group(1))
+          zoneCompartments.append([])
+          zoneRealms.append({})
+          continue
+        cm = compartmentPatt.match(l)
+        if cm and currZone != -1:
+          zoneCompartments[currZone].append(cm.group(1))
+          continue
+        rm = realmPatt.match(l)
+        if rm and currZone != -1:
+          zoneRealms[currZone].setdefault(rm.group(2), rm.group(1))
+        # Skip over other comments.
         continue
       else:
         print('Error: Unknown line:', l[:-1])
 
+  locations = computeLocations(zoneOf, zoneNames, zoneCompartments, zoneRealms)
+
   # yar, should pass the root crud in and wedge it in here, or somewhere
-  return [edges, edgeLabels, nodeLabels, colorNodes]
+  return [edges, edgeLabels, nodeLabels, colorNodes, locations]
+
+
+# Give each zone a compartment id for its nodes, then look up the
+# compartment of each node through its zone.
+def computeLocations (zoneOf, zoneNames, zoneCompartments, zoneRealms):
+  compartmentNames = []
+  zoneCompartment = array('i')
+  for z in range(len(zoneNames)):
+    comps = zoneCompartments[z] or list(zoneRealms[z].values())
+    zoneCompartment.append(len(compartmentNames))
+    if len(comps) == 1:
+      compartmentNames.append(comps[0])
+    else:
+      compartmentNames.append('{0} compartments in zone {1}'.format(len(comps), zoneNames[z]))
+
+  compartmentOf = array('i', [-1]) * len(zoneOf)
+  for i in range(len(zoneOf)):
+    if zoneOf[i] != -1:
+      compartmentOf[i] = zoneCompartment[zoneOf[i]]
+
+  return Locations(zoneOf=zoneOf, compartmentOf=compartmentOf,
+                   zoneNames=zoneNames, compartmentNames=compartmentNames,
+                   zoneCompartment=zoneCompartment)
 
 
 def parseGCEdgeFile (fname):
@@ -124,12 +200,12 @@ def parseGCEdgeFile (fname):
     exit(-1)
 
   [roots, rootLabels, weakMapEntries] = parseRoots(f)
-  [edges, edgeLabels, nodeLabels, colorNodes] = parseGraph(f)
+  [edges, edgeLabels, nodeLabels, colorNodes, locations] = parseGraph(f)
   f.close()
 
   ga = GraphAttribs (edgeLabels=edgeLabels, nodeLabels=nodeLabels, roots=roots,
                      rootLabels=rootLabels, weakMapEntries=weakMapEntries,
-                     colorNodes=colorNodes)
+                     colorNodes=colorNodes, locations=locations)
   return (edges, ga)
 
 
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import sys
+import argparse
+from . import parse_gc_graph
+from cc import root_attribution
+
+########################################################
+# Find the roots that hold onto the most objects in a
+# Firefox garbage collector log.  See cc/root_attribution
+# for how this works.
+########################################################
+
+
+parser = argparse.ArgumentParser(description='Find the roots that hold onto the most objects in the garbage collector graph.')
+
+parser.add_argument('file_name',
+                    help='garbage collector graph file name')
+
+parser.add_argument('--max', dest='max_roots', type=int,
+                    default=20,
+                    help='Number of roots to print out.')
+
+parser.add_argument('--only-black-roots', '-obr', dest='only_black_roots', action='store_true',
+                    default=False,
+                    help='Only consider black roots.')
+
+
+def loadGraph(fname):
+  sys.stdout.write('Parsing {0}. '.format(fname))
+  sys.stdout.flush()
+  (g, ga) = parse_gc_graph.parseGCEdgeFile(fname)
+  g = parse_gc_graph.toSinglegraph(g)
+  print('Done loading graph.')
+
+  return (g, ga)
+
+
+def gcRootAttribution():
+  args = parser.parse_args()
+
+  (g, ga) = loadGraph(args.file_name)
+
+  # Everything reachable from a black root is black, so the black roots
+  # are searched from to completion first, and the gray roots only get
+  # the objects that are left over.
+  blackRoots = [r for r, isBlack in ga.roots.items() if isBlack]
+  attribution = root_attribution.attributeRoots(g, blackRoots)
+  if not args.only_black_roots:
+    grayRoots = [r for r, isBlack in ga.roots.items() if not isBlack]
+    root_attribution.attributeRoots(g, grayRoots, attribution)
+
+  def rootKind(x):
+    if ga.roots[x]:
+      return 'black root'
+    return 'gray root'
+
+  counts = root_attribution.rootCounts(attribution)
+  root_attribution.printAttribution(counts, rootKind, lambda x: ga.rootLabels.get(x, ''), args.max_roots)
+
+
+if __name__ == "__main__":
+  gcRootAttribution()
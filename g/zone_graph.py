@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import sys
+import argparse
+from array import array
+from . import parse_gc_graph
+from cc import csr_graph
+from cc import quotient_graph
+
+########################################################
+# Look at the edges between zones and between compartments
+# in a Firefox garbage collector log.
+#
+# The graph is collapsed into a weighted graph of zones and
+# a weighted graph of compartments, using the zone and
+# compartment of each node recorded by parse_gc_graph, so
+# questions like which compartments hold onto a zone only
+# look at a few hundred nodes.
+########################################################
+
+
+parser = argparse.ArgumentParser(description='Show the edges between zones and compartments in a GC log.')
+
+parser.add_argument('file_name',
+                    help='garbage collector graph file name')
+
+parser.add_argument('--zone', dest='zone',
+                    help='Print out the zones and compartments that hold onto the zone with this address.')
+
+parser.add_argument('--dot', dest='dot', action='store_true',
+                    default=False,
+                    help='Write the zone graph to FILE_NAME.zones.dot and the compartment graph to FILE_NAME.compartments.dot.')
+
+parser.add_argument('--min', dest='min_weight', type=int,
+                    default=1,
+                    help='Only show edges that stand for at least this many edges.')
+
+
+# Return the quotient graphs of g by compartment and by zone.  Nodes
+# that aren't in a zone are left out.  fromDictGraph gives the nodes
+# of g the first ids, in the order of the keys of g, which is the order
+# of loc, so only the nodes that are missing from the log need to be
+# added.
+def locationGraphs(g, loc):
+  (names, ids, offsets, targets) = csr_graph.fromDictGraph(g)
+
+  missing = array('i', [-1]) * (len(names) - len(g))
+  zoneOf = loc.zoneOf + missing
+  compartmentOf = loc.compartmentOf + missing
+
+  cg = quotient_graph.quotientGraph(offsets, targets, compartmentOf, loc.compartmentNames)
+  zg = quotient_graph.quotientGraph(offsets, targets, zoneOf, loc.zoneNames)
+  return (cg, zg)
+
+
+def loadGraph(fname):
+  sys.stdout.write('Parsing {0}. '.format(fname))
+  sys.stdout.flush()
+  (g, ga) = parse_gc_graph.parseGCEdgeFile(fname)
+  g = parse_gc_graph.toSinglegraph(g)
+  print('Done loading graph.')
+
+  return (g, ga)
+
+
+def printWeights(args, names, weights):
+  for c, w in sorted(weights.items(), key=lambda cw: -cw[1]):
+    if w >= args.min_weight:
+      print('%(num)8d %(label)s' % {'num':w, 'label':names[c]})
+
+
+# Print out the edges between different zones.
+def printCrossZoneEdges(args, zg):
+  cross = []
+  for a, row in zg.edges.items():
+    for b, w in row.items():
+      if a != b and w >= args.min_weight:
+        cross.append((w, a, b))
+
+  print('Found', len(cross), 'pairs of zones with edges between them.')
+  for (w, a, b) in sorted(cross, reverse=True):
+    print('%(num)8d %(src)s -> %(dst)s' % {'num':w, 'src':zg.classNames[a], 'dst':zg.classNames[b]})
+
+
+# Print out the zones and compartments outside of the zone z with
+# edges into it.
+def printZoneHolders(args, cg, zg, loc, z):
+  print('Zone', loc.zoneNames[z], 'has', zg.nodeCounts[z], 'nodes.')
+
+  zoneHolders = quotient_graph.predecessorClasses(zg, z)
+  zoneHolders.pop(z, None)
+  print('Zones holding onto it:')
+  printWeights(args, zg.classNames, zoneHolders)
+
+  compHolders = quotient_graph.predecessorClasses(cg, loc.zoneCompartment[z])
+  compHolders.pop(loc.zoneCompartment[z], None)
+  print('Compartments holding onto it:')
+  printWeights(args, cg.classNames, compHolders)
+
+
+def zoneGraph():
+  args = parser.parse_args()
+
+  (g, ga) = loadGraph(args.file_name)
+  loc = ga.locations
+  (cg, zg) = locationGraphs(g, loc)
+  print('Found', len(loc.zoneNames), 'zones and', len(loc.compartmentNames), 'compartments.')
+
+  if args.zone != None:
+    if not args.zone in loc.zoneNames:
+      print(args.zone, 'is not a zone in the graph.')
+      exit(-1)
+    printZoneHolders(args, cg, zg, loc, loc.zoneNames.index(args.zone))
+  else:
+    printCrossZoneEdges(args, zg)
+
+  if args.dot:
+    quotient_graph.writeDotFile(zg, args.file_name + '.zones.dot', args.min_weight)
+    quotient_graph.writeDotFile(cg, args.file_name + '.compartments.dot', args.min_weight)
+
+
+if __name__ == "__main__":
+  zoneGraph()